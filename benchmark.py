@@ -0,0 +1,332 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import argparse
+import statistics
+from pathlib import Path
+from dataclasses import dataclass, asdict
+from typing import Any, Optional
+
+from runtime import *
+
+
+TAG = "// DIFFERENCE_EXPORTER_BENCHMARK"
+
+# 結果のJSONの形式
+RESULT_VERSION = 1
+
+# 終了コード
+EXIT_SUCCESS = 0
+# 基準より遅くなった構成がある, または一致したファイル数が合わない
+EXIT_REGRESSION = 1
+
+
+@dataclass
+class TreeSpec:
+    """ベンチマーク用のソースツリーの構成
+    """
+    # 走査対象のファイル数
+    num_files:int = 20000
+    # ディレクトリの階層の深さ
+    depth:int = 3
+    # 1つのディレクトリに作るサブディレクトリ数
+    fanout:int = 6
+    # ファイルサイズの中央値(バイト)
+    median_size:int = 4096
+    # ファイルサイズのばらつき (対数正規分布のシグマ)
+    size_sigma:float = 1.0
+    # ファイルサイズの上限(バイト)
+    max_size:int = 4 * 1024 * 1024
+    # 検索内容を含むファイルの割合
+    hit_rate:float = 0.01
+    # UTF-16(BOM付き)のファイルの割合
+    utf16_rate:float = 0.02
+    # 走査対象外の.gen.hファイルの割合 (ファイル数とは別に生成)
+    gen_rate:float = 0.1
+    # 除外ディレクトリ(Intermediate等)に置くファイルの割合 (ファイル数とは別に生成)
+    excluded_rate:float = 0.2
+    # 乱数のシード
+    seed:int = 0
+
+
+def generate_tree(root:Path, spec:TreeSpec) -> int:
+    """ベンチマーク用のソースツリーを生成
+
+    Unrealのソースツリーを模して、モジュールの階層に拡張子の混在したファイルを配置します。
+
+    Args:
+        root (Path): 生成先ディレクトリ
+        spec (TreeSpec): ツリーの構成
+
+    Returns:
+        int: 検索内容を含む走査対象のファイル数
+    """
+    rng = random.Random(spec.seed)
+    extensions = ("h", "cpp", "ini", "usf", "ush", "cs", "inl")
+    line = "int value = 0; // padding for benchmark content\n"
+
+    # 階層ごとのディレクトリ名から葉のディレクトリを列挙
+    directories = [root]
+    for level in range(spec.depth):
+        directories = [directory / f"{'Module' if level == 0 else 'Private'}{i:02d}" for directory in directories for i in range(spec.fanout)]
+
+    def write_file(path:Path, is_hit:bool, is_utf16:bool) -> None:
+        size = min(spec.max_size, max(64, int(rng.lognormvariate(0.0, spec.size_sigma) * spec.median_size)))
+        content = line * max(1, size // len(line))
+        if is_hit:
+            # 先頭以外にも置いてチャンクの途中の一致も測る
+            position = rng.randrange(0, len(content) + 1, len(line))
+            content = content[:position] + TAG + "\n" + content[position:]
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(str(path), mode="wb") as f:
+            f.write(content.encode("utf-16") if is_utf16 else content.encode("utf-8"))
+
+    num_hits = 0
+    for i in range(spec.num_files):
+        directory = directories[i % len(directories)]
+        is_hit = rng.random() < spec.hit_rate
+        num_hits += int(is_hit)
+        write_file(directory / f"File{i}.{extensions[i % len(extensions)]}", is_hit, rng.random() < spec.utf16_rate)
+
+    # 走査対象外のファイル (検索内容を含んでいても出力されない)
+    for i in range(int(spec.num_files * spec.gen_rate)):
+        write_file(directories[i % len(directories)] / f"File{i}.gen.h", rng.random() < spec.hit_rate, False)
+
+    for i in range(int(spec.num_files * spec.excluded_rate)):
+        excluded_dir = ENGINE_EXCLUDED_DIRS[i % len(ENGINE_EXCLUDED_DIRS)]
+        write_file(directories[i % len(directories)] / excluded_dir / f"File{i}.h", rng.random() < spec.hit_rate, False)
+
+    return num_hits
+
+
+def run_export(input_dir:Path, output_dir:Path, num_workers:int, backend:str, chunk_size:int) -> ExportSnapshot:
+    """差分出力を1回実行
+
+    Args:
+        input_dir (Path): 入力ディレクトリ
+        output_dir (Path): 出力ディレクトリ
+        num_workers (int): ワーカー数
+        backend (str): 走査とコピーの実行方式
+        chunk_size (int): ワーカーにまとめて渡すファイル数
+
+    Returns:
+        ExportSnapshot: 差分出力の集計
+    """
+    exporter = DifferenceExporter()
+
+    if not exporter.export(str(input_dir), str(output_dir), TAG, num_workers, backend=backend, chunk_size=chunk_size, excluded_dirs=ENGINE_EXCLUDED_DIRS):
+        raise RuntimeError("failed to start export")
+    exporter.wait()
+
+    if exporter.error is not None:
+        raise exporter.error
+
+    return exporter.snapshot()
+
+
+def measure(
+    work_dir:Path,
+    input_dir:Path,
+    num_workers:int,
+    backend:str,
+    chunk_size:int,
+    repeat:int,
+) -> dict[str, Any]:
+    """1つの構成を繰り返し計測
+
+    Args:
+        work_dir (Path): 出力ディレクトリを作るディレクトリ
+        input_dir (Path): 入力ディレクトリ
+        num_workers (int): ワーカー数
+        backend (str): 走査とコピーの実行方式
+        chunk_size (int): ワーカーにまとめて渡すファイル数
+        repeat (int): 繰り返し回数
+
+    Returns:
+        dict[str, Any]: 最速の回の集計と経過時間の統計
+    """
+    snapshots:list[ExportSnapshot] = []
+    for i in range(repeat):
+        output_dir = work_dir / f"out_{backend}_{num_workers}_{chunk_size}_{i}"
+        output_dir.mkdir()
+        snapshots.append(run_export(input_dir, output_dir, num_workers, backend, chunk_size))
+
+    best = min(snapshots, key=lambda snapshot: snapshot.elapsed)
+    return {
+        "backend": backend,
+        "workers": num_workers,
+        # 差分出力が実際に使ったワーカー数 (CPU数までに制限されます)
+        "effective_workers": best.scan_workers,
+        "chunk_size": chunk_size,
+        "best": best.elapsed,
+        "median": statistics.median(snapshot.elapsed for snapshot in snapshots),
+        "files_per_second": best.files_per_second,
+        "read_mb_per_second": best.read_mb_per_second,
+        "phases": best.phases,
+        "scan_time": best.scan_time,
+        "copy_time": best.copy_time,
+        "scanned": best.scanned,
+        "matched": best.matched,
+        "copied": best.copied,
+    }
+
+
+def result_key(result:dict[str, Any]) -> tuple[str, int, int]:
+    return result["backend"], result["workers"], result["chunk_size"]
+
+
+def compare_baseline(results:list[dict[str, Any]], baseline:dict[str, Any], tolerance:float) -> list[str]:
+    """基準の結果と比較
+
+    Args:
+        results (list[dict[str, Any]]): 今回の結果
+        baseline (dict[str, Any]): 基準の結果のJSON
+        tolerance (float): 許容する遅延の割合
+
+    Returns:
+        list[str]: 基準より遅くなった構成
+    """
+    baseline_results = {result_key(result): result for result in baseline.get("results", [])}
+
+    regressions:list[str] = []
+    for result in results:
+        if (base:=baseline_results.get(result_key(result))) is None:
+            continue
+
+        ratio = result["best"] / base["best"] if base["best"] > 0.0 else 1.0
+        backend, workers, chunk_size = result_key(result)
+        print(f"{backend:>8} {workers:>8} {chunk_size:>6} {base['best']:>8.3f} -> {result['best']:>8.3f} ({ratio - 1.0:+.1%})")
+        if ratio > 1.0 + tolerance:
+            regressions.append(f"{backend} workers={workers} chunk={chunk_size}: {base['best']:.3f}s -> {result['best']:.3f}s")
+
+    return regressions
+
+
+def main(
+    spec:TreeSpec,
+    workers:list[int],
+    backends:list[str],
+    chunk_sizes:list[int],
+    repeat:int,
+    json_path:Optional[str],
+    baseline_path:Optional[str],
+    tolerance:float,
+) -> int:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_dir = Path(temp_dir) / "Engine"
+
+        start = time.perf_counter()
+        num_hits = generate_tree(input_dir, spec)
+        print(f"generated {spec.num_files} files ({num_hits} hits) in {time.perf_counter() - start:.1f}s, cpu_count={os.cpu_count()}")
+
+        print(f"{'backend':>8} {'workers':>8} {'chunk':>6} {'best[s]':>8} {'files/s':>10} {'walk[s]':>8} {'export[s]':>9} {'scan[s]':>8} {'copy[s]':>8}")
+
+        results:list[dict[str, Any]] = []
+        is_valid = True
+        for backend in backends:
+            for num_workers in workers:
+                for chunk_size in chunk_sizes:
+                    result = measure(Path(temp_dir), input_dir, num_workers, backend, chunk_size, repeat)
+                    results.append(result)
+
+                    # CPU数で制限された場合は指定した数と実際に使った数
+                    effective_workers = result["effective_workers"]
+                    workers_text = f"{num_workers}" if effective_workers == num_workers else f"{num_workers}->{effective_workers}"
+
+                    phases = result["phases"]
+                    print(
+                        f"{backend:>8} {workers_text:>8} {chunk_size:>6} {result['best']:>8.3f} {result['files_per_second']:>10.0f}"
+                        f" {phases.get(PHASE_WALK, 0.0):>8.3f} {phases.get(PHASE_EXPORT, 0.0):>9.3f} {result['scan_time']:>8.3f} {result['copy_time']:>8.3f}"
+                    )
+
+                    # 生成したツリーと出力が食い違う場合は計測も無効
+                    if result["matched"] != num_hits or result["scanned"] != spec.num_files:
+                        print(f"unexpected result: scanned={result['scanned']} matched={result['matched']} (expected {spec.num_files}, {num_hits})", file=sys.stderr)
+                        is_valid = False
+
+    report = {
+        "version": RESULT_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "spec": asdict(spec),
+        "results": results,
+    }
+
+    if json_path is not None:
+        with open(json_path, mode="w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+
+    regressions:list[str] = []
+    if baseline_path is not None:
+        with open(baseline_path, mode="r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+        if baseline.get("spec") != report["spec"]:
+            print("warning: baseline was measured with a different tree", file=sys.stderr)
+
+        print(f"compare with {baseline_path} (tolerance {tolerance:.0%})")
+        regressions = compare_baseline(results, baseline, tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+
+    return EXIT_SUCCESS if is_valid and len(regressions) == 0 else EXIT_REGRESSION
+
+
+def int_list(value:str) -> list[int]:
+    return [int(item) for item in value.split(",") if item != ""]
+
+
+def str_list(value:str) -> list[str]:
+    return [item for item in value.split(",") if item != ""]
+
+
+if __name__ == "__main__":
+    defaults = TreeSpec()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_files", type=int, default=defaults.num_files)
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--fanout", type=int, default=defaults.fanout)
+    parser.add_argument("--median_size", type=int, default=defaults.median_size)
+    parser.add_argument("--size_sigma", type=float, default=defaults.size_sigma)
+    parser.add_argument("--max_size", type=int, default=defaults.max_size)
+    parser.add_argument("--hit_rate", type=float, default=defaults.hit_rate)
+    parser.add_argument("--utf16_rate", type=float, default=defaults.utf16_rate)
+    parser.add_argument("--gen_rate", type=float, default=defaults.gen_rate)
+    parser.add_argument("--excluded_rate", type=float, default=defaults.excluded_rate)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--workers", type=int_list, default=[1, 4, 16], help="ワーカー数 (カンマ区切り)")
+    parser.add_argument("--backends", type=str_list, default=list(BACKENDS), help="実行方式 (カンマ区切り)")
+    parser.add_argument("--chunk_sizes", type=int_list, default=[DEFAULT_CHUNK_SIZE], help="ワーカーにまとめて渡すファイル数 (カンマ区切り)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", type=str, default=None, help="結果を出力するJSONのパス")
+    parser.add_argument("--baseline", type=str, default=None, help="比較する基準の結果のJSONのパス")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="基準から許容する遅延の割合")
+
+    args = parser.parse_args(sys.argv[1:])
+
+    for backend in args.backends:
+        if backend not in BACKENDS:
+            parser.error(f"unknown backend: {backend}")
+
+    spec = TreeSpec(
+        num_files=args.num_files,
+        depth=args.depth,
+        fanout=args.fanout,
+        median_size=args.median_size,
+        size_sigma=args.size_sigma,
+        max_size=args.max_size,
+        hit_rate=args.hit_rate,
+        utf16_rate=args.utf16_rate,
+        gen_rate=args.gen_rate,
+        excluded_rate=args.excluded_rate,
+        seed=args.seed,
+    )
+
+    sys.exit(main(spec, args.workers, args.backends, args.chunk_sizes, args.repeat, args.json, args.baseline, args.tolerance))
@@ -2,3 +2,4 @@ from editor.directory_button import *
 from editor.search_content_entry import *
 from editor.export_progress import *
 from editor.export_button import *
+from editor.option_checkbutton import *
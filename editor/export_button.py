@@ -22,14 +22,49 @@ class ExportButton:
         pady:Union[int, tuple[int, int], tuple[tuple[int, int]]] = (0, 4),
         sticky:str = EW,
         callback_export:Optional[Callable[[], None]] = None,
+        callback_cancel:Optional[Callable[[], None]] = None,
         *args,
         **kwargs,
     ) -> None:
         grid = GridUtil(column=column, row=row, padx=padx, pady=pady, sticky=sticky)
 
-        self.button = ttk.Button(master, text="Export", state=DISABLED, command=callback_export)
+        self.callback_export = callback_export
+        self.callback_cancel = callback_cancel
+
+        # 差分出力の実行中はキャンセルボタンとして振る舞う
+        self.is_running = False
+
+        self.button = ttk.Button(master, text="Export", state=DISABLED, command=self.on_click)
         self.button.grid(column=grid.column, row=grid.row, padx=grid.padx, pady=grid.pady, sticky=grid.sticky)
 
+    def on_click(self) -> None:
+        """実行中はキャンセル、それ以外は出力のコールバックを呼び出し
+        """
+        callback = self.callback_cancel if self.is_running else self.callback_export
+        if callback is not None:
+            callback()
+
+    @property
+    def running(self) -> bool:
+        """差分出力の実行中か取得
+
+        Returns:
+            bool: 実行中の場合はTrueを返します。
+        """
+        return self.is_running
+
+    @running.setter
+    def running(self, running:bool) -> None:
+        """差分出力の実行中か設定
+
+        実行中はボタンの表示をCancelに切り替えます。
+
+        Args:
+            running (bool): 実行中の場合はTrue
+        """
+        self.is_running = running
+        self.button.configure(text="Cancel" if running else "Export", bootstyle=DANGER if running else PRIMARY)
+
     @property
     def state(self) -> str:
         """ボタンの状態を取得
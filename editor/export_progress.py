@@ -3,9 +3,10 @@ import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from ttkbootstrap.tooltip import ToolTip
 
-from typing import Union
+from typing import Union, Optional, Callable
 
 from editor.grid_util import *
+from runtime.export_stats import ExportSnapshot
 
 
 __all__ = [
@@ -14,32 +15,71 @@ __all__ = [
 
 
 class ExportProgress:
+    # 進捗のポーリング間隔(ms)
+    POLLING_INTERVAL = 200
+
     def __init__(
         self,
         master:tk.Misc,
-        column:Union[int, tuple[int, int]],
-        row:Union[int, tuple[int, int]],
-        padx:Union[int, tuple[int, int], tuple[tuple[int, int], tuple[int, int]]] = (0, 4),
-        pady:Union[int, tuple[int, int], tuple[tuple[int, int], tuple[int, int]]] = (0, 4),
-        sticky:Union[str, tuple[str, str]] = (EW, EW),
+        column:Union[int, tuple[int, int, int]],
+        row:Union[int, tuple[int, int, int]],
+        padx:Union[int, tuple[int, int, int], tuple[tuple[int, int], tuple[int, int], tuple[int, int]]] = (0, 4, 0),
+        pady:Union[int, tuple[int, int, int], tuple[tuple[int, int], tuple[int, int], tuple[int, int]]] = (0, 4, 4),
+        sticky:Union[str, tuple[str, str, str]] = (EW, EW, EW),
+        columnspan:Union[int, tuple[int, int, int]] = (1, 1, 2),
         *args,
         **kwargs,
     ) -> None:
-        grid = GridUtil(column=column, row=row, padx=padx, pady=pady, sticky=sticky)
+        grid = GridUtil(column=column, row=row, columnspan=columnspan, padx=padx, pady=pady, sticky=sticky)
 
         label = ttk.Label(master, text="Export progress")
-        label.grid(column=grid.column, row=grid.row, padx=grid.padx, pady=grid.pady, sticky=grid.sticky)
+        label.grid(column=grid.column, row=grid.row, columnspan=grid.columnspan, padx=grid.padx, pady=grid.pady, sticky=grid.sticky)
         ToolTip(label, text="")
 
-        self.progressbar = ttk.Progressbar(master, mode=DETERMINATE, bootstyle=(STRIPED, PRIMARY))
-        self.progressbar.grid(column=grid.column, row=grid.row, padx=grid.padx, pady=grid.pady, sticky=grid.sticky)
+        self.progressbar = ttk.Progressbar(master, mode=DETERMINATE, maximum=1.0, bootstyle=(STRIPED, PRIMARY))
+        self.progressbar.grid(column=grid.column, row=grid.row, columnspan=grid.columnspan, padx=grid.padx, pady=grid.pady, sticky=grid.sticky)
+
+        self.status_var = ttk.StringVar(master, "")
+
+        status_label = ttk.Label(master, textvariable=self.status_var)
+        status_label.grid(column=grid.column, row=grid.row, columnspan=grid.columnspan, padx=grid.padx, pady=grid.pady, sticky=grid.sticky)
 
-    def start(self) -> None:
+        self.callback_snapshot:Optional[Callable[[], ExportSnapshot]] = None
+        self.after_id:Optional[str] = None
+
+    def start(self, callback_snapshot:Callable[[], ExportSnapshot]) -> None:
         """出力開始
+
+        Args:
+            callback_snapshot (Callable[[], ExportSnapshot]): 進捗の取得
+        """
+        self.callback_snapshot = callback_snapshot
+        self.progressbar.configure(value=0.0)
+        self.poll()
+
+    def poll(self) -> None:
+        """進捗を一定間隔で更新
+        """
+        self.update_status(self.callback_snapshot())
+        self.after_id = self.progressbar.after(self.POLLING_INTERVAL, self.poll)
+
+    def update_status(self, snapshot:ExportSnapshot) -> None:
+        """進捗の表示を更新
+
+        ディレクトリの走査が完了するまで総数は暫定値です。
+
+        Args:
+            snapshot (ExportSnapshot): 進捗
         """
-        self.progressbar.start()
+        self.progressbar.configure(value=snapshot.progress)
+        self.status_var.set(snapshot.format())
 
     def end(self) -> None:
         """出力終了
         """
-        self.progressbar.stop()
+        if self.after_id is not None:
+            self.progressbar.after_cancel(self.after_id)
+            self.after_id = None
+
+        if self.callback_snapshot is not None:
+            self.update_status(self.callback_snapshot())
@@ -0,0 +1,54 @@
+import tkinter as tk
+import ttkbootstrap as ttk
+from ttkbootstrap.constants import *
+from ttkbootstrap.tooltip import ToolTip
+
+from typing import Union
+
+from editor.grid_util import *
+
+
+__all__ = [
+    "OptionCheckbutton",
+]
+
+
+class OptionCheckbutton:
+    def __init__(
+        self,
+        master:tk.Misc,
+        text:str,
+        tooltip:str,
+        column:int,
+        row:int,
+        padx:Union[int, tuple[int, int]] = 0,
+        pady:Union[int, tuple[int, int]] = 0,
+        sticky:str = W,
+        value:bool = False,
+        *args,
+        **kwargs,
+    ) -> None:
+        grid = GridUtil(column=column, row=row, padx=padx, pady=pady, sticky=sticky)
+
+        self.value_var = ttk.BooleanVar(master, value)
+
+        self.checkbutton = ttk.Checkbutton(master, text=text, variable=self.value_var, bootstyle=(ROUND, TOGGLE))
+        self.checkbutton.grid(column=grid.column, row=grid.row, padx=grid.padx, pady=grid.pady, sticky=grid.sticky)
+        ToolTip(self.checkbutton, text=tooltip)
+
+    @property
+    def state(self) -> str:
+        return str(self.checkbutton["state"])
+
+    @state.setter
+    def state(self, state:str) -> None:
+        self.checkbutton.configure(state=state)
+
+    @property
+    def value(self) -> bool:
+        """チェックの有無を取得
+
+        Returns:
+            bool: チェックされている場合はTrueを返します。
+        """
+        return self.value_var.get()
@@ -0,0 +1,101 @@
+import os
+import re
+import sys
+import json
+import argparse
+from typing import Optional, Sequence
+
+from prompt import split_list, EXIT_SUCCESS, EXIT_ERROR, EXIT_INVALID
+from runtime import *
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="検索内容を含むファイルの索引を常駐して維持し、走査せずに差分出力します。")
+    parser.add_argument("--host", type=str, default=DEFAULT_DAEMON_ADDRESS[0], help="常駐プロセスのアドレス")
+    parser.add_argument("--port", type=int, default=DEFAULT_DAEMON_ADDRESS[1], help="常駐プロセスのポート")
+    parser.add_argument("--authkey_file", "--authkey-file", type=str, default=str(DEFAULT_DAEMON_AUTHKEY_PATH), help="接続の認証キーのパス (所有者のみ読み書きできるファイル, serveで無ければ生成)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="索引を構築して常駐")
+    serve.add_argument("--input_dir", "--input-dir", type=str, required=True)
+    serve.add_argument("--tag", type=str, action="append", default=[], help="検索内容 (複数指定可)")
+    serve.add_argument("--regex", type=str, action="append", default=[], help="検索内容の正規表現 (複数指定可)")
+    serve.add_argument("--num_workers", "--num-workers", type=int, default=os.cpu_count(), help="索引の構築とコピーのスレッド数")
+    serve.add_argument("--extensions", type=str, action="append", default=None, help=f"走査対象の拡張子 (カンマ区切り, 既定: {','.join(DEFAULT_EXTENSIONS)})")
+    serve.add_argument("--exclude", type=str, action="append", default=[], help="走査しないファイル・ディレクトリ (gitignore形式, 複数指定可)")
+    serve.add_argument("--exclude_dirs", "--exclude-dirs", type=str, action="append", default=None, help="走査しないディレクトリ名 (カンマ区切り, 既定: なし)")
+    serve.add_argument("--exclude_engine_dirs", "--exclude-engine-dirs", default=False, action="store_true", help=f"エンジンのビルド生成物などのディレクトリも走査しない ({','.join(ENGINE_EXCLUDED_DIRS)})")
+    serve.add_argument("--index", type=str, default=None, help="索引を保存するJSONのパス (次回の起動を速くします)")
+    serve.add_argument("--poll_interval", "--poll-interval", type=float, default=5.0, help="inotifyが使えない場合に全体を再確認する間隔(秒)")
+    serve.add_argument("--polling", default=False, action="store_true", help="inotifyを使わずにポーリングで監視")
+
+    export = commands.add_parser("export", help="索引にある一致したファイルをコピー")
+    export.add_argument("--output_dir", "--output-dir", type=str, required=True)
+    export.add_argument("--sync_mode", "--sync-mode", type=str, choices=SYNC_MODES, default=SYNC_STAT, help="出力先と同一のファイルのコピーを省略する方式")
+
+    commands.add_parser("status", help="索引の状態を表示")
+    commands.add_parser("rescan", help="入力ディレクトリ全体を再確認")
+    commands.add_parser("stop", help="常駐を終了")
+    return parser
+
+
+def main(argv:Optional[Sequence[str]] = None) -> int:
+    parser = create_parser()
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    address = (args.host, args.port)
+
+    try:
+        authkey = load_daemon_authkey(args.authkey_file, create=args.command == "serve")
+    except OSError as e:
+        print(f"failed to load the authkey: {e}", file=sys.stderr)
+        return EXIT_ERROR
+
+    if args.command == "serve":
+        if len(args.tag) + len(args.regex) == 0:
+            parser.error("--tag or --regex is required")
+
+        try:
+            info = DiffExportInfo(
+                args.input_dir,
+                ".",
+                args.tag,
+                args.num_workers,
+                tag_regexes=args.regex,
+                extensions=DEFAULT_EXTENSIONS if args.extensions is None else tuple(split_list(args.extensions)),
+                excluded_dirs=(DEFAULT_EXCLUDED_DIRS if args.exclude_dirs is None else tuple(split_list(args.exclude_dirs))) + (ENGINE_EXCLUDED_DIRS if args.exclude_engine_dirs else ()),
+                excluded_patterns=args.exclude,
+            )
+            info.create_matcher()
+        except (ValueError, re.error) as e:
+            print(f"invalid options: {e}", file=sys.stderr)
+            return EXIT_INVALID
+
+        if not DifferenceExporter.is_valid_directory(args.input_dir):
+            print("invalid input directory", file=sys.stderr)
+            return EXIT_INVALID
+
+        daemon = TagIndexDaemon(info, args.index, args.poll_interval, not args.polling)
+        try:
+            daemon.serve(address, authkey)
+        except KeyboardInterrupt:
+            pass
+        return EXIT_SUCCESS
+
+    client = TagIndexClient(address, authkey)
+    try:
+        if args.command == "export":
+            response = client.export(args.output_dir, args.sync_mode)
+        else:
+            response = client.request(args.command)
+    except OSError as e:
+        print(f"failed to connect to the daemon: {e}", file=sys.stderr)
+        return EXIT_ERROR
+
+    json.dump(response, sys.stdout, ensure_ascii=False, indent=4)
+    print()
+    return EXIT_SUCCESS if response.get("ok") else EXIT_ERROR
+
+
+if __name__ == "__main__":
+    sys.exit(main())
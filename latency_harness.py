@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import builtins
+import argparse
+import tempfile
+import threading as th
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from runtime import *
+from benchmark import TAG, TreeSpec, generate_tree, int_list
+
+
+# 終了コード
+EXIT_SUCCESS = 0
+# 一致したファイル数か出力が食い違う, または期待した高速化に届かない
+EXIT_FAILURE = 1
+
+
+class LatencyInjector:
+    """ローカルのファイルシステムに待ち時間を注入 (SMB/NFSなどのネットワーク共有の代わり)
+
+    open, stat, scandirなどのメタデータ操作の呼び出しごとにスリープしてからローカルの操作を行います。
+    スリープ中はGILを解放するので、ネットワークの応答待ちと同じく他のスレッドは進められます。
+    内容の読み書きは待ち時間が往復1回分に含まれるとみなして注入しません。
+    """
+    # 待ち時間を注入する関数 (モジュール, 関数名)
+    TARGETS = (
+        (builtins, "open"),
+        (os, "open"),
+        (os, "stat"),
+        (os, "lstat"),
+        (os, "scandir"),
+        (os, "mkdir"),
+        (os, "chmod"),
+        (os, "replace"),
+    )
+
+    def __init__(self, latency:float, jitter:float = 0.0, seed:int = 0) -> None:
+        """コンストラクタ
+
+        Args:
+            latency (float): 1回の操作に加える待ち時間(秒)
+            jitter (float, optional): 待ち時間に加える一様乱数の幅(秒). Defaults to 0.0.
+            seed (int, optional): 乱数の種. Defaults to 0.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+
+        # 待ち時間を注入した操作の回数
+        self.num_operations = 0
+
+        self.originals:list[tuple[Any, str, Callable]] = []
+        self.lock = th.Lock()
+
+    def delay(self) -> None:
+        """1回の操作分の待ち時間
+        """
+        with self.lock:
+            self.num_operations += 1
+            seconds = self.latency + (self.rng.uniform(0.0, self.jitter) if self.jitter > 0.0 else 0.0)
+        time.sleep(seconds)
+
+    def wrap(self, function:Callable) -> Callable:
+        def delayed(*args, **kwargs):
+            self.delay()
+            return function(*args, **kwargs)
+        return delayed
+
+    def __enter__(self) -> "LatencyInjector":
+        for module, name in LatencyInjector.TARGETS:
+            function = getattr(module, name)
+            self.originals.append((module, name, function))
+            setattr(module, name, self.wrap(function))
+        return self
+
+    def __exit__(self, *args) -> None:
+        for module, name, function in reversed(self.originals):
+            setattr(module, name, function)
+        self.originals.clear()
+
+
+def list_outputs(output_dir:Path) -> list[str]:
+    return sorted(str(path.relative_to(output_dir)) for path in output_dir.rglob("*") if path.is_file() and not path.name.startswith("."))
+
+
+def run_export(input_dir:Path, output_dir:Path, backend:str, num_workers:int, io_concurrency:int, latency:float, jitter:float) -> dict[str, Any]:
+    """待ち時間を注入して差分出力を1回実行
+
+    Args:
+        input_dir (Path): 入力ディレクトリ
+        output_dir (Path): 出力ディレクトリ
+        backend (str): 走査とコピーの実行方式
+        num_workers (int): ワーカー数 (BACKEND_ASYNCではディレクトリの走査のスレッド数)
+        io_concurrency (int): 同時に実行するファイル操作の上限 (BACKEND_ASYNCのみ)
+        latency (float): 1回の操作に加える待ち時間(秒)
+        jitter (float): 待ち時間に加える一様乱数の幅(秒)
+
+    Returns:
+        dict[str, Any]: 集計と出力したファイル
+    """
+    exporter = DifferenceExporter()
+
+    with LatencyInjector(latency, jitter) as injector:
+        if not exporter.export(str(input_dir), str(output_dir), TAG, num_workers, backend=backend, io_concurrency=io_concurrency, excluded_dirs=ENGINE_EXCLUDED_DIRS):
+            raise RuntimeError("failed to start export")
+        exporter.wait()
+
+    if exporter.error is not None:
+        raise exporter.error
+
+    snapshot = exporter.snapshot()
+    return {
+        "backend": backend,
+        "workers": min(num_workers, os.cpu_count()),
+        "io_concurrency": io_concurrency if backend == BACKEND_ASYNC else None,
+        "elapsed": snapshot.elapsed,
+        "files_per_second": snapshot.files_per_second,
+        "operations": injector.num_operations,
+        "scanned": snapshot.scanned,
+        "matched": snapshot.matched,
+        "copied": snapshot.copied,
+        "outputs": list_outputs(output_dir),
+    }
+
+
+def main(
+    spec:TreeSpec,
+    latency:float,
+    jitter:float,
+    workers:list[int],
+    concurrencies:list[int],
+    expect_speedup:Optional[float],
+    json_path:Optional[str],
+) -> int:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_dir = Path(temp_dir) / "Engine"
+
+        # ツリーの生成には待ち時間を注入しない
+        num_hits = generate_tree(input_dir, spec)
+        print(f"generated {spec.num_files} files ({num_hits} hits), latency={latency * 1000:.1f}ms jitter={jitter * 1000:.1f}ms, cpu_count={os.cpu_count()}")
+        print(f"{'backend':>8} {'workers':>8} {'inflight':>8} {'elapsed[s]':>10} {'files/s':>10} {'ops':>8}")
+
+        configs = [(BACKEND_THREAD, num_workers, 0) for num_workers in workers]
+        configs += [(BACKEND_ASYNC, max(workers), concurrency) for concurrency in concurrencies]
+
+        results:list[dict[str, Any]] = []
+        is_valid = True
+        for i, (backend, num_workers, concurrency) in enumerate(configs):
+            output_dir = Path(temp_dir) / f"out_{i}"
+            output_dir.mkdir()
+            result = run_export(input_dir, output_dir, backend, num_workers, concurrency, latency, jitter)
+            shutil.rmtree(output_dir)
+
+            print(
+                f"{backend:>8} {result['workers']:>8} {concurrency or result['workers']:>8}"
+                f" {result['elapsed']:>10.3f} {result['files_per_second']:>10.0f} {result['operations']:>8}"
+            )
+
+            # 実行方式に依らず同じファイルを出力する
+            if result["matched"] != num_hits or result["scanned"] != spec.num_files:
+                print(f"unexpected result: scanned={result['scanned']} matched={result['matched']} (expected {spec.num_files}, {num_hits})", file=sys.stderr)
+                is_valid = False
+            if len(results) > 0 and result["outputs"] != results[0]["outputs"]:
+                print(f"outputs differ from {results[0]['backend']}: {backend} inflight={concurrency}", file=sys.stderr)
+                is_valid = False
+            results.append(result)
+
+    # スレッドの最速とasyncioの最速を比較
+    threaded = [result["elapsed"] for result in results if result["backend"] == BACKEND_THREAD]
+    asynchronous = [result["elapsed"] for result in results if result["backend"] == BACKEND_ASYNC]
+    speedup:Optional[float] = None
+    if len(threaded) > 0 and len(asynchronous) > 0:
+        speedup = min(threaded) / min(asynchronous)
+        print(f"speedup: {speedup:.1f}x ({BACKEND_ASYNC} vs {BACKEND_THREAD})")
+
+    if expect_speedup is not None and (speedup is None or speedup < expect_speedup):
+        print(f"expected speedup {expect_speedup:.1f}x was not reached", file=sys.stderr)
+        is_valid = False
+
+    if json_path is not None:
+        with open(json_path, mode="w", encoding="utf-8") as f:
+            json.dump({
+                "latency": latency,
+                "jitter": jitter,
+                "cpu_count": os.cpu_count(),
+                "speedup": speedup,
+                "results": [{key: value for key, value in result.items() if key != "outputs"} for result in results],
+            }, f, ensure_ascii=False, indent=4)
+
+    return EXIT_SUCCESS if is_valid else EXIT_FAILURE
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ローカルのファイルシステムに待ち時間を注入して、ネットワーク共有での実行方式を比較します。")
+    parser.add_argument("--num_files", type=int, default=2000)
+    parser.add_argument("--hit_rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=TreeSpec.seed)
+    parser.add_argument("--latency_ms", type=float, default=2.0, help="1回の操作に加える待ち時間(ミリ秒)")
+    parser.add_argument("--jitter_ms", type=float, default=0.5, help="待ち時間に加える一様乱数の幅(ミリ秒)")
+    parser.add_argument("--workers", type=int_list, default=[os.cpu_count()], help="threadのワーカー数 (カンマ区切り)")
+    parser.add_argument("--concurrency", type=int_list, default=[64, DEFAULT_IO_CONCURRENCY], help="asyncの同時に実行するファイル操作の上限 (カンマ区切り)")
+    parser.add_argument("--expect_speedup", type=float, default=None, help="asyncがthreadより速くなるべき倍率 (届かない場合は失敗)")
+    parser.add_argument("--json", type=str, default=None, help="結果を出力するJSONのパス")
+
+    args = parser.parse_args(sys.argv[1:])
+
+    spec = TreeSpec(
+        num_files=args.num_files,
+        hit_rate=args.hit_rate,
+        seed=args.seed,
+    )
+
+    sys.exit(main(spec, args.latency_ms / 1000, args.jitter_ms / 1000, args.workers, args.concurrency, args.expect_speedup, args.json))
@@ -4,6 +4,7 @@ from ttkbootstrap.constants import *
 
 from pathlib import Path
 import os
+import multiprocessing as mp
 from typing import Optional
 
 from editor import *
@@ -22,8 +23,10 @@ class DifferenceExporterApplication(ttk.Window):
         self.tk_input_directory = DirectoryButton(self, text="Input directory", tooltip="コピー元のディレクトリを指定します。", column=(0, 1), row=0, padx=((10, 10), (0, 10)), pady=((10, 0), (10, 0)), callback_update_directory=self.update_input_directory)
         self.tk_output_directory = DirectoryButton(self, text="Output directory", tooltip="コピー先のディレクトリを指定します。", column=(0, 1), row=1, padx=((10, 10), (0, 10)), pady=10, callback_update_directory=self.update_output_directory)
         self.tk_search_content_entry = SearchContentEntry(self, column=(0, 1), row=2, padx=((10, 10), (0, 10)), pady=0, callback_update_content=self.update_search_content)
-        self.tk_export_progress = ExportProgress(self, column=(0, 1), row=3, padx=((10, 10), (0, 0)), pady=10)
-        self.tk_export_button = ExportButton(self, column=1, row=4, padx=((0, 10), ), pady=((0, 10), ), callback_export=self.start_diff_export)
+        self.tk_resume = OptionCheckbutton(self, text="Resume", tooltip="中断した差分出力を処理済みのファイルの走査を省略して再開します。\n出力先に走査結果のチェックポイントを保存します。", column=0, row=3, padx=10, pady=(10, 0))
+        self.tk_autotune = OptionCheckbutton(self, text="Autotune workers", tooltip="計測しながら走査とコピーのワーカー数を増減します。\n入力ボリュームごとの結果をホームディレクトリに記録します。", column=1, row=3, padx=(0, 10), pady=(10, 0))
+        self.tk_export_progress = ExportProgress(self, column=(0, 1, 0), row=(4, 4, 5), padx=((10, 10), (0, 0), (10, 10)), pady=(10, 10, (0, 10)))
+        self.tk_export_button = ExportButton(self, column=1, row=6, padx=((0, 10), ), pady=((0, 10), ), callback_export=self.start_diff_export, callback_cancel=self.cancel_diff_export)
 
         # 最小サイズが決定したのでウィンドウサイズを固定
         self.resizable(width=False, height=False)
@@ -148,31 +151,63 @@ class DifferenceExporterApplication(ttk.Window):
         if not self.is_valid_search_content((content:=self.search_content)):
             return
 
+        # 出力がすぐに完了しても終了処理が後になるように、開始前に実行中の表示へ切り替え
+        self.update_running_state(True)
+
         ret = self.diff_exporter.export(
             input_dir,
             output_dir,
             content,
             os.cpu_count(),
-            self.end_diff_export,
+            self.notify_diff_export_end,
+            resume=self.tk_resume.value,
+            autotune=self.tk_autotune.value,
         )
 
         if ret:
-            self.tk_export_progress.start()
-            self.tk_input_directory.state = DISABLED
-            self.tk_output_directory.state = DISABLED
-            self.tk_search_content_entry.state = DISABLED
+            self.tk_export_progress.start(self.diff_exporter.snapshot)
+        else:
+            self.update_running_state(False)
+
+    def cancel_diff_export(self) -> None:
+        """差分ファイルの出力を中断
+
+        Resumeを有効にした場合は処理済みのファイルがチェックポイントに保存され、次回の出力で再開します。
+        """
+        if self.diff_exporter.cancel():
             self.tk_export_button.state = DISABLED
 
+    def notify_diff_export_end(self) -> None:
+        """差分出力スレッドから出力の終了を通知
+
+        Tkはスレッドセーフではないので、終了処理はメインループで実行します。
+        """
+        self.after(0, self.end_diff_export)
+
     def end_diff_export(self) -> None:
         """差分ファイルの出力を終了
         """
         self.tk_export_progress.end()
-        self.tk_input_directory.state = READONLY
-        self.tk_output_directory.state = READONLY
-        self.tk_search_content_entry.state = NORMAL
+        self.update_running_state(False)
+
+    def update_running_state(self, running:bool) -> None:
+        """出力の実行中かどうかに合わせて入力欄とボタンの状態を更新
+
+        Args:
+            running (bool): 実行中の場合はTrue
+        """
+        self.tk_input_directory.state = DISABLED if running else READONLY
+        self.tk_output_directory.state = DISABLED if running else READONLY
+        self.tk_search_content_entry.state = DISABLED if running else NORMAL
+        self.tk_resume.state = DISABLED if running else NORMAL
+        self.tk_autotune.state = DISABLED if running else NORMAL
+        self.tk_export_button.running = running
         self.tk_export_button.state = NORMAL
 
 
 if __name__ == "__main__":
+    # cx_Freezeで固めた実行ファイルから走査プロセスを起動するため
+    mp.freeze_support()
+
     app = DifferenceExporterApplication()
     app.mainloop()
@@ -1,52 +1,200 @@
-import time
+import os
 import sys
-import threading as th
+import json
 import argparse
+import multiprocessing as mp
+from typing import Optional, Sequence
 
 from runtime import *
 
 
-lock = th.Lock()
-is_finish = False
-
+# 終了コード
+EXIT_SUCCESS = 0
+# 差分出力中にエラーが発生
+EXIT_ERROR = 1
+# 差分出力を開始できなかった (引数が不正)
+EXIT_INVALID = 2
+# 差分出力を中断した (Ctrl+C)
+EXIT_CANCELLED = 130
+
+
+def show_progress(snapshot:ExportSnapshot) -> None:
+    print(snapshot.format(), file=sys.stderr)
+
+
+def split_list(values:Optional[list[str]]) -> list[str]:
+    """カンマ区切りと複数指定の両方を受け付けたリストを展開
+
+    Args:
+        values (Optional[list[str]]): 引数の値
+
+    Returns:
+        list[str]: 展開したリスト
+    """
+    return [value for values in (values or []) for value in values.split(",") if value != ""]
+
+
+def parse_size(value:str) -> int:
+    """K, M, G接尾辞付きのサイズを変換
+
+    Args:
+        value (str): サイズ
+
+    Returns:
+        int: バイト数
+    """
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper().removesuffix("B")
+    if value[-1:] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="検索内容を含むファイルをディレクトリ構造を維持してコピーします。")
+    parser.add_argument("--input_dir", "--input-dir", type=str, required=True)
+    parser.add_argument("--output_dir", "--output-dir", type=str, required=True)
+    parser.add_argument("--tag", type=str, action="append", default=[], help="検索内容 (複数指定可)")
+    parser.add_argument("--regex", type=str, action="append", default=[], help="検索内容の正規表現 (複数指定可)")
+    parser.add_argument("--num_workers", "--num-workers", type=int, default=os.cpu_count(), help="ワーカー数")
+    parser.add_argument("--copy_workers", "--copy-workers", type=int, default=None, help="コピー用スレッド数 (既定: ワーカー数)")
+    parser.add_argument("--autotune", default=False, action="store_true", help="計測しながら走査とコピーのワーカー数を増減 (threadのみ, 入力ボリュームごとに記録)")
+    parser.add_argument("--autotune_file", "--autotune-file", type=str, default=None, help="自動調整したワーカー数を記録するJSONのパス (既定: ホームディレクトリ)")
+    parser.add_argument("--backend", type=str, choices=BACKENDS, default=BACKEND_THREAD, help="走査とコピーの実行方式")
+    parser.add_argument("--io_concurrency", "--io-concurrency", type=int, default=DEFAULT_IO_CONCURRENCY, help="同時に実行するファイル操作の上限 (asyncのみ)")
+    parser.add_argument("--cache_dir", "--cache-dir", type=str, default=None, help="走査結果のマニフェストなどを保存するディレクトリ (既定: ユーザーのキャッシュディレクトリ)")
+    parser.add_argument("--chunk_size", "--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="ワーカーにまとめて渡すファイル数")
+    parser.add_argument("--walk_threads", "--walk-threads", type=int, default=None, help="ディレクトリを走査するスレッド数")
+    parser.add_argument("--extensions", type=str, action="append", default=None, help=f"走査対象の拡張子 (カンマ区切り, 既定: {','.join(DEFAULT_EXTENSIONS)})")
+    parser.add_argument("--exclude_extensions", "--exclude-extensions", type=str, action="append", default=[], help="走査対象から除く拡張子 (カンマ区切り)")
+    parser.add_argument("--exclude", type=str, action="append", default=[], help="走査しないファイル・ディレクトリ (gitignore形式, 複数指定可)")
+    parser.add_argument("--exclude_from", "--exclude-from", type=str, default=None, help="走査しないファイル・ディレクトリを列挙したファイル (gitignore形式)")
+    parser.add_argument("--max_file_size", "--max-file-size", type=parse_size, default=None, help="走査するファイルサイズの上限 (K, M, G接尾辞可)")
+    parser.add_argument("--exclude_dirs", "--exclude-dirs", type=str, action="append", default=None, help="走査しないディレクトリ名 (カンマ区切り, 既定: なし)")
+    parser.add_argument("--exclude_engine_dirs", "--exclude-engine-dirs", default=False, action="store_true", help=f"エンジンのビルド生成物などのディレクトリも走査しない ({','.join(ENGINE_EXCLUDED_DIRS)})")
+    parser.add_argument("--keep_file_size", "--keep-file-size", type=parse_size, default=DEFAULT_KEEP_FILE_SIZE, help="走査で読み込んだ内容をコピーに使い回すファイルサイズの上限 (0で無効)")
+    parser.add_argument("--keep_memory", "--keep-memory", type=parse_size, default=DEFAULT_KEEP_MEMORY, help="走査で読み込んだ内容を保持するメモリの上限")
+    parser.add_argument("--git_base", "--git-base", type=str, default=None, help="指定したリビジョンから変更・追加されたファイルのみを走査")
+    parser.add_argument("--incremental", default=False, action="store_true", help="前回から変更の無いファイルの走査を省略")
+    parser.add_argument("--resume", default=False, action="store_true", help="前回の差分出力が中断した場合は処理済みのファイルの走査を省略して再開")
+    parser.add_argument("--mirror", default=False, action="store_true", help="今回出力しなかったファイルを出力先から削除")
+    parser.add_argument("--sync_mode", "--sync-mode", type=str, choices=SYNC_MODES, default=SYNC_NONE, help="出力先と同一のファイルのコピーを省略する方式")
+    parser.add_argument("--archive", type=str, default=None, help="出力先ディレクトリの代わりに出力するアーカイブのパス (.zip, .tar.gz, .tar.zst)")
+    parser.add_argument("--baseline", type=str, default=None, help="改変前のファイルのサイズとハッシュ値の索引のパス (検索内容を含まない編集も出力)")
+    parser.add_argument("--baseline_dir", "--baseline-dir", type=str, default=None, help="索引が無い場合に構築する改変前のエンジンのディレクトリ")
+    parser.add_argument("--tag_report", "--tag-report", type=str, default=None, help="ファイルごとに一致した検索内容を出力するJSONのパス")
+    parser.add_argument("--stats_json", "--stats-json", type=str, default=None, help="集計を出力するJSONのパス ('-'は標準出力)")
+    parser.add_argument("--trace_json", "--trace-json", type=str, default=None, help="処理ごとの計測をChromeのトレースイベント形式で出力するJSONのパス")
+    parser.add_argument("--histogram_json", "--histogram-json", type=str, default=None, help="処理ごとの計測のヒストグラムを出力するJSONのパス")
+    parser.add_argument("--quiet", default=False, action="store_true", help="進捗を表示しない")
+    parser.add_argument("--show_process_time", "--show-process-time", default=False, action="store_true")
+    return parser
+
+
+def write_stats(path:str, stats:dict) -> None:
+    if path == "-":
+        json.dump(stats, sys.stdout, ensure_ascii=False, indent=4)
+        print()
+        return
 
-def show_progress(total_file_num:int, total_file_left_num:int) -> None:
-    print(f"{total_file_left_num}/{total_file_num}")
+    with open(path, mode="w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=4)
 
 
-def show_complete() -> None:
-    global is_finish
-    with lock:
-        is_finish = True
+def main(argv:Optional[Sequence[str]] = None) -> int:
+    parser = create_parser()
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
 
+    if len(args.tag) + len(args.regex) == 0:
+        parser.error("--tag or --regex is required")
 
-def get_is_finish() -> bool:
-    global is_finish
-    if not lock.acquire(True, 0.0):
-        return False
-    else:
-        is_ret = is_finish
-        lock.release()
-        return is_ret
+    extensions = DEFAULT_EXTENSIONS if args.extensions is None else tuple(split_list(args.extensions))
+    excluded_dirs = DEFAULT_EXCLUDED_DIRS if args.exclude_dirs is None else tuple(split_list(args.exclude_dirs))
+    if args.exclude_engine_dirs:
+        excluded_dirs += ENGINE_EXCLUDED_DIRS
 
+    excluded_patterns = list(args.exclude)
+    if args.exclude_from is not None:
+        try:
+            with open(args.exclude_from, mode="r", encoding="utf-8") as f:
+                excluded_patterns += f.read().splitlines()
+        except (OSError, UnicodeDecodeError) as e:
+            parser.error(f"cannot read --exclude_from: {e}")
 
-def my_app(input_dir:str, output_dir:str, tag:str, show_process_time:bool) -> None:
     app = DifferenceExporter()
 
-    if not app.export(input_dir, output_dir, tag, 2, show_progress, show_complete):
-        return
-
-    while not get_is_finish():
-        time.sleep(1 / 60)
+    if not app.export(
+        args.input_dir,
+        args.output_dir,
+        args.tag,
+        args.num_workers,
+        incremental=args.incremental,
+        backend=args.backend,
+        chunk_size=args.chunk_size,
+        excluded_dirs=excluded_dirs,
+        walk_threads=args.walk_threads,
+        sync_mode=args.sync_mode,
+        mirror=args.mirror,
+        tag_regexes=args.regex,
+        tag_report_path=args.tag_report,
+        extensions=extensions,
+        excluded_patterns=excluded_patterns,
+        excluded_extensions=split_list(args.exclude_extensions),
+        max_file_size=args.max_file_size,
+        git_base=args.git_base,
+        copy_workers=args.copy_workers,
+        keep_file_size=args.keep_file_size,
+        keep_memory=args.keep_memory,
+        trace_path=args.trace_json,
+        histogram_path=args.histogram_json,
+        resume=args.resume,
+        archive_path=args.archive,
+        baseline_path=args.baseline,
+        baseline_dir=args.baseline_dir,
+        autotune=args.autotune,
+        autotune_path=args.autotune_file,
+        io_concurrency=args.io_concurrency,
+        cache_dir=args.cache_dir,
+    ):
+        print("failed to start export: check the directories and options", file=sys.stderr)
+        return EXIT_INVALID
+
+    # Ctrl+Cは処理済みのファイルをチェックポイントに保存してから終了
+    try:
+        while not app.wait(1.0):
+            if not args.quiet:
+                show_progress(app.snapshot())
+    except KeyboardInterrupt:
+        app.cancel()
+        app.wait()
+
+    snapshot = app.snapshot()
+    if not args.quiet:
+        show_progress(snapshot)
+
+    if app.cancelled:
+        print("export cancelled: run again with --resume to continue", file=sys.stderr)
+    elif app.error is not None:
+        print(f"export failed: {app.error!r}", file=sys.stderr)
+
+    if args.show_process_time:
+        print(f"process time: {snapshot.elapsed:.3f}s", file=sys.stderr)
+
+    if args.stats_json is not None:
+        write_stats(args.stats_json, {
+            "input_dir": args.input_dir,
+            "output_dir": args.output_dir,
+            "backend": args.backend,
+            "num_workers": snapshot.scan_workers,
+            "error": None if app.error is None else repr(app.error),
+            **snapshot.to_dict(),
+        })
+
+    if app.cancelled:
+        return EXIT_CANCELLED
+    return EXIT_SUCCESS if app.error is None else EXIT_ERROR
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--input_dir", type=str, required=True)
-    parser.add_argument("--output_dir", type=str, required=True)
-    parser.add_argument("--tag", type=str, required=True)
-    parser.add_argument("--show_process_time", default=False, action="store_true")
-
-    args = parser.parse_args(sys.argv[1:])
-
-    my_app(args.input_dir, args.output_dir, args.tag, args.show_process_time)
+    mp.freeze_support()
+    sys.exit(main())
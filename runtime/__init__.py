@@ -1 +1,19 @@
+from runtime.memory_budget import *
+from runtime.export_profiler import *
+from runtime.tag_matcher import *
+from runtime.scan_manifest import *
+from runtime.path_filter import *
+from runtime.directory_walker import *
+from runtime.git_walker import *
+from runtime.file_watcher import *
+from runtime.diff_export_info import *
+from runtime.file_scanner import *
+from runtime.digest_cache import *
+from runtime.baseline_index import *
+from runtime.export_stats import *
+from runtime.worker_tuner import *
+from runtime.output_writer import *
+from runtime.archive_writer import *
 from runtime.difference_exporter import *
+from runtime.edited_file_iterator import *
+from runtime.tag_index_daemon import *
@@ -0,0 +1,446 @@
+import os
+import io
+import gzip
+import zlib
+import time
+import queue
+import shutil
+import struct
+import tarfile
+import tempfile
+import threading as th
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Optional, Union
+
+from runtime.diff_export_info import *
+from runtime.export_profiler import *
+from runtime.export_stats import *
+from runtime.memory_budget import *
+from runtime.output_writer import *
+from runtime.scan_manifest import *
+
+# zstdは標準ライブラリ(3.14以降), またはzstandardがある場合のみ
+try:
+    from compression import zstd as _zstd
+
+    def zstd_compress(data:bytes, level:int) -> bytes:
+        return _zstd.compress(data, level)
+
+    def zstd_compressobj(level:int) -> Any:
+        return _zstd.ZstdCompressor(level=level)
+except ImportError:
+    try:
+        import zstandard as _zstd
+
+        def zstd_compress(data:bytes, level:int) -> bytes:
+            return _zstd.ZstdCompressor(level=level).compress(data)
+
+        def zstd_compressobj(level:int) -> Any:
+            return _zstd.ZstdCompressor(level=level).compressobj()
+    except ImportError:
+        zstd_compress:Optional[Callable[[bytes, int], bytes]] = None
+        zstd_compressobj:Optional[Callable[[int], Any]] = None
+
+
+__all__ = [
+    "ArchiveWriter",
+]
+
+
+class ArchiveWriter(OutputWriter):
+    """出力先ディレクトリの代わりにアーカイブへ出力
+
+    圧縮はコピー用スレッドでファイルごとに並列に行い、アーカイブへの追記は1つのスレッドで順に行います。
+    中間のディレクトリへの出力と、出力後の読み直しはありません。
+
+    - zip: ファイルごとにDeflateで圧縮したエントリを追記 (ZIP64対応)
+    - tar.gz, tar.zst: ファイルごとのtarのエントリを独立したgzip/zstdのメンバーとして連結 (pigzと同様)
+
+    アーカイブは一時ファイルに書き込み、完了時に置き換えます。中断やエラーの場合は作成しません。
+    圧縮したファイルの内容はアーカイブへの追記までメモリに保持します。
+    STREAM_THRESHOLDを超えるファイルは全体を読み込まずに、チャンク単位で圧縮してアーカイブと同じディレクトリの一時ファイルに書き出してから追記スレッドに渡します。
+    """
+    COMPRESS_LEVEL = 6
+    ZSTD_LEVEL = 3
+
+    # 一時ファイルを介して圧縮するファイルサイズ (これ以下のファイルは内容をメモリに読み込んで圧縮)
+    STREAM_THRESHOLD = 32 * 1024 * 1024
+
+    # 一時ファイルを介して圧縮する場合に1回に読み込むバイト数
+    STREAM_CHUNK_SIZE = 1024 * 1024
+
+    ZIP_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+    ZIP_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+    ZIP_END = struct.Struct("<IHHHHIIH")
+    ZIP64_END = struct.Struct("<IQHHIIQQQQ")
+    ZIP64_LOCATOR = struct.Struct("<IIQI")
+    ZIP64_LIMIT = 0xFFFFFFFF
+    ZIP_FLAG_UTF8 = 0x0800
+    ZIP_STORED = 0
+    ZIP_DEFLATED = 8
+
+    def __init__(
+        self,
+        info:DiffExportInfo,
+        stats:ExportStats,
+        budget:Optional[MemoryBudget] = None,
+        profiler:Optional[ExportProfiler] = None,
+        manifest:Optional[ScanManifest] = None,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            info (DiffExportInfo): 差分出力情報 (archive_pathを指定済み)
+            stats (ExportStats): 差分出力の集計
+            budget (Optional[MemoryBudget], optional): 走査で保持したファイルの内容のメモリの上限. Defaults to None.
+            profiler (Optional[ExportProfiler], optional): 処理ごとの計測. Defaults to None.
+            manifest (Optional[ScanManifest], optional): コピーを終えたファイルの判定結果を記録するマニフェスト. Defaults to None.
+
+        Raises:
+            ValueError: 使えないアーカイブ形式
+        """
+        super().__init__(info, stats, None, budget, profiler, manifest)
+
+        if not ArchiveWriter.is_available(info.archive_format):
+            raise ValueError(f"unavailable archive format: {info.archive_format}")
+
+        self.path:Path = info.archive_path
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+
+        # 圧縮済みのエントリを追記するスレッドに渡すキュー (圧縮済みの内容を溜め込まないように上限付き)
+        self.entry_queue = queue.Queue(maxsize=max(2, info.copy_workers * 2))
+        self.thread:Optional[th.Thread] = None
+        self.file:Optional[io.BufferedWriter] = None
+
+        # 追記スレッドで発生したエラー
+        self.error:Optional[BaseException] = None
+
+        # zipのセントラルディレクトリ (追記したエントリの情報)
+        self.central_directory:list[bytes] = []
+        self.offset = 0
+
+    @staticmethod
+    def is_available(archive_format:str) -> bool:
+        """アーカイブ形式が使えるか判定
+
+        Args:
+            archive_format (str): アーカイブ形式 (ARCHIVE_FORMATS)
+
+        Returns:
+            bool: 使える場合はTrueを返します。
+        """
+        if archive_format == ARCHIVE_TAR_ZST:
+            return zstd_compress is not None
+        return archive_format in ARCHIVE_FORMATS
+
+    def open(self) -> None:
+        self.file = open(str(self.tmp_path), mode="wb")
+        self.thread = th.Thread(target=self.append_entries, daemon=True)
+        self.thread.start()
+
+    def close(self, commit:bool = True) -> None:
+        if self.thread is not None:
+            self.entry_queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+        if self.file is None:
+            return
+
+        try:
+            if commit and self.error is None:
+                self.finish()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.file.close()
+            self.file = None
+
+        if commit and self.error is None:
+            os.replace(str(self.tmp_path), str(self.path))
+            return
+
+        self.tmp_path.unlink(missing_ok=True)
+        if commit and self.error is not None:
+            raise self.error
+
+    def append_entries(self) -> None:
+        """圧縮済みのエントリを順にアーカイブに追記
+        """
+        while (entry:=self.entry_queue.get()) is not None:
+            try:
+                # エラー発生後は終了通知まで読み捨て
+                if self.error is not None:
+                    continue
+
+                if self.info.archive_format == ARCHIVE_ZIP:
+                    self.append_zip_entry(*entry)
+                else:
+                    self.write_payload(entry)
+            except BaseException as e:
+                self.error = e
+            finally:
+                ArchiveWriter.close_payload(entry[-1] if isinstance(entry, tuple) else entry)
+
+    def finish(self) -> None:
+        """アーカイブの終端を書き込み
+        """
+        if self.info.archive_format == ARCHIVE_ZIP:
+            self.finish_zip()
+        else:
+            self.file.write(self.compress_member(b"\0" * (tarfile.BLOCKSIZE * 2)))
+
+    def compress_member(self, data:bytes) -> bytes:
+        """tarのエントリを独立したgzip/zstdのメンバーに圧縮
+
+        Args:
+            data (bytes): tarのエントリ
+
+        Returns:
+            bytes: 圧縮したメンバー
+        """
+        if self.info.archive_format == ARCHIVE_TAR_ZST:
+            return zstd_compress(data, ArchiveWriter.ZSTD_LEVEL)
+        return gzip.compress(data, ArchiveWriter.COMPRESS_LEVEL, mtime=0)
+
+    def member_compressobj(self) -> Any:
+        """tarのエントリを分割して圧縮するgzip/zstdのメンバーの圧縮器を生成
+
+        Returns:
+            Any: compress, flushを持つ圧縮器
+        """
+        if self.info.archive_format == ARCHIVE_TAR_ZST:
+            return zstd_compressobj(ArchiveWriter.ZSTD_LEVEL)
+        return zlib.compressobj(ArchiveWriter.COMPRESS_LEVEL, zlib.DEFLATED, 31)
+
+    @staticmethod
+    def payload_size(payload:Union[bytes, BinaryIO]) -> int:
+        """圧縮した内容のバイト数 (一時ファイルの場合はファイルサイズ)
+        """
+        if isinstance(payload, bytes):
+            return len(payload)
+        return payload.seek(0, os.SEEK_END)
+
+    def write_payload(self, payload:Union[bytes, BinaryIO]) -> None:
+        """圧縮した内容をアーカイブに書き込み (一時ファイルの場合はチャンク単位で複製)
+        """
+        if isinstance(payload, bytes):
+            self.file.write(payload)
+            return
+        payload.seek(0)
+        shutil.copyfileobj(payload, self.file, ArchiveWriter.STREAM_CHUNK_SIZE)
+
+    @staticmethod
+    def close_payload(payload:Union[bytes, BinaryIO]) -> None:
+        """一時ファイルに圧縮した内容を破棄
+        """
+        if not isinstance(payload, bytes):
+            payload.close()
+
+    def write_roots(self, path:Path, mask:int, data:Optional[bytes]) -> int:
+        # 追記スレッドでエラーが発生したらワーカーを止める
+        if self.error is not None:
+            raise self.error
+
+        start_time = time.perf_counter()
+        compress_start = 0 if self.profiler is None else self.profiler.now()
+
+        input_stat = os.stat(str(path))
+
+        # 一致した検索内容ごとの出力ディレクトリは使わずに出力ディレクトリと同じ階層
+        name = self.info.output_key(self.info.relative_key(path))
+
+        entry:Union[tuple, bytes, BinaryIO]
+        if data is None and input_stat.st_size > ArchiveWriter.STREAM_THRESHOLD:
+            entry = self.spool_entry(path, name, input_stat)
+        else:
+            if data is None:
+                with open(str(path), mode="rb") as f:
+                    data = f.read()
+
+            if self.info.archive_format == ARCHIVE_ZIP:
+                entry = self.compress_zip_entry(name, input_stat, data)
+            else:
+                entry = self.compress_member(self.tar_entry(name, input_stat, data))
+        size = ArchiveWriter.payload_size(entry[-1] if isinstance(entry, tuple) else entry)
+
+        if self.profiler is not None:
+            self.profiler.record("compress", compress_start, path)
+
+        self.entry_queue.put(entry)
+
+        self.stats.add(copied=1, bytes_written=size, copy_time=time.perf_counter() - start_time)
+        return 1
+
+    def spool_entry(self, path:Path, name:str, input_stat:os.stat_result) -> Union[tuple, BinaryIO]:
+        """大きいファイルをチャンク単位で一時ファイルに圧縮
+
+        zipは圧縮しても小さくならない場合も常にDeflateで格納します。
+
+        Args:
+            path (Path): 入力ディレクトリ内のファイルパス
+            name (str): アーカイブ内のパス
+            input_stat (os.stat_result): ファイルのstat
+
+        Raises:
+            OSError: 圧縮中にファイルが短くなった (tarのみ)
+
+        Returns:
+            Union[tuple, BinaryIO]: zipはcompress_zip_entryと同じ形式 (圧縮した内容は一時ファイル), tarは圧縮したメンバーの一時ファイル
+        """
+        chunk_size = ArchiveWriter.STREAM_CHUNK_SIZE
+        spool = tempfile.TemporaryFile(dir=str(self.tmp_path.parent))
+        try:
+            with open(str(path), mode="rb") as f:
+                if self.info.archive_format == ARCHIVE_ZIP:
+                    compressor = zlib.compressobj(ArchiveWriter.COMPRESS_LEVEL, zlib.DEFLATED, -15)
+                    crc = size = 0
+                    while len(chunk:=f.read(chunk_size)) > 0:
+                        crc = zlib.crc32(chunk, crc)
+                        size += len(chunk)
+                        spool.write(compressor.compress(chunk))
+                    spool.write(compressor.flush())
+                    dos_time, dos_date = ArchiveWriter.dos_datetime(input_stat)
+                    return name.encode("utf-8"), ArchiveWriter.ZIP_DEFLATED, dos_time, dos_date, crc, size, input_stat.st_mode & 0xFFFF, spool
+
+                # tarのヘッダーのサイズに合わせてstatのサイズだけ読み込む
+                compressor = self.member_compressobj()
+                spool.write(compressor.compress(ArchiveWriter.tar_header(name, input_stat, input_stat.st_size)))
+                remaining = input_stat.st_size
+                while remaining > 0 and len(chunk:=f.read(min(chunk_size, remaining))) > 0:
+                    spool.write(compressor.compress(chunk))
+                    remaining -= len(chunk)
+                if remaining > 0:
+                    raise OSError(f"file was truncated while archiving: {path}")
+                spool.write(compressor.compress(b"\0" * (-input_stat.st_size % tarfile.BLOCKSIZE)))
+                spool.write(compressor.flush())
+                return spool
+        except BaseException:
+            spool.close()
+            raise
+
+    @staticmethod
+    def tar_header(name:str, input_stat:os.stat_result, size:int) -> bytes:
+        """tarのエントリのヘッダーを生成
+
+        Args:
+            name (str): アーカイブ内のパス
+            input_stat (os.stat_result): ファイルのstat
+            size (int): ファイルの内容のバイト数
+
+        Returns:
+            bytes: tarのヘッダー
+        """
+        tarinfo = tarfile.TarInfo(name)
+        tarinfo.size = size
+        tarinfo.mtime = int(input_stat.st_mtime)
+        tarinfo.mode = input_stat.st_mode & 0o7777
+        return tarinfo.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+    @staticmethod
+    def tar_entry(name:str, input_stat:os.stat_result, data:bytes) -> bytes:
+        """tarのエントリ(ヘッダーと512バイト境界まで埋めた内容)を生成
+
+        Args:
+            name (str): アーカイブ内のパス
+            input_stat (os.stat_result): ファイルのstat
+            data (bytes): ファイルの内容
+
+        Returns:
+            bytes: tarのエントリ
+        """
+        padding = -len(data) % tarfile.BLOCKSIZE
+        return ArchiveWriter.tar_header(name, input_stat, len(data)) + data + b"\0" * padding
+
+    @staticmethod
+    def dos_datetime(input_stat:os.stat_result) -> tuple[int, int]:
+        """zipに記録する更新日時 (DOS形式の時刻と日付)
+
+        Args:
+            input_stat (os.stat_result): ファイルのstat
+
+        Returns:
+            tuple[int, int]: DOS形式の時刻と日付
+        """
+        year, month, day, hour, minute, second = time.localtime(input_stat.st_mtime)[:6]
+        if year < 1980:
+            year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+        dos_time = (hour << 11) | (minute << 5) | (second // 2)
+        dos_date = ((year - 1980) << 9) | (month << 5) | day
+        return dos_time, dos_date
+
+    def compress_zip_entry(self, name:str, input_stat:os.stat_result, data:bytes) -> tuple[bytes, int, int, int, int, int, int, bytes]:
+        """zipのエントリを圧縮
+
+        圧縮しても小さくならない場合は無圧縮で格納します。
+
+        Args:
+            name (str): アーカイブ内のパス
+            input_stat (os.stat_result): ファイルのstat
+            data (bytes): ファイルの内容
+
+        Returns:
+            tuple[bytes, int, int, int, int, int, int, bytes]: 名前, 圧縮方式, 日時(DOS形式の時刻と日付), CRC32, 元のサイズ, 権限, 圧縮した内容
+        """
+        crc = zlib.crc32(data)
+
+        compressor = zlib.compressobj(ArchiveWriter.COMPRESS_LEVEL, zlib.DEFLATED, -15)
+        payload = compressor.compress(data) + compressor.flush()
+        method = ArchiveWriter.ZIP_DEFLATED
+        if len(payload) >= len(data):
+            payload = data
+            method = ArchiveWriter.ZIP_STORED
+
+        dos_time, dos_date = ArchiveWriter.dos_datetime(input_stat)
+
+        return name.encode("utf-8"), method, dos_time, dos_date, crc, len(data), input_stat.st_mode & 0xFFFF, payload
+
+    def append_zip_entry(self, name:bytes, method:int, dos_time:int, dos_date:int, crc:int, size:int, mode:int, payload:Union[bytes, BinaryIO]) -> None:
+        """圧縮済みのzipのエントリを追記
+
+        4GiBを超えるファイルとオフセットはZIP64の拡張フィールドに記録します。
+        """
+        limit = ArchiveWriter.ZIP64_LIMIT
+        compressed_size = ArchiveWriter.payload_size(payload)
+        is_zip64 = size >= limit or compressed_size >= limit
+        version = 45 if is_zip64 or self.offset >= limit else 20
+
+        local_extra = struct.pack("<HHQQ", 0x0001, 16, size, compressed_size) if is_zip64 else b""
+        header = ArchiveWriter.ZIP_LOCAL_HEADER.pack(
+            0x04034b50, version, ArchiveWriter.ZIP_FLAG_UTF8, method, dos_time, dos_date, crc,
+            limit if is_zip64 else compressed_size,
+            limit if is_zip64 else size,
+            len(name), len(local_extra),
+        )
+
+        # セントラルディレクトリの拡張フィールドは上限を超えた値のみ
+        values = [value for value in (size, compressed_size, self.offset) if value >= limit]
+        central_extra = struct.pack(f"<HH{len(values)}Q", 0x0001, 8 * len(values), *values) if len(values) > 0 else b""
+        self.central_directory.append(ArchiveWriter.ZIP_CENTRAL_HEADER.pack(
+            0x02014b50, (3 << 8) | version, version, ArchiveWriter.ZIP_FLAG_UTF8, method, dos_time, dos_date, crc,
+            min(compressed_size, limit), min(size, limit),
+            len(name), len(central_extra), 0, 0, 0, mode << 16, min(self.offset, limit),
+        ) + name + central_extra)
+
+        self.file.write(header)
+        self.file.write(name)
+        self.file.write(local_extra)
+        self.write_payload(payload)
+        self.offset += len(header) + len(name) + len(local_extra) + compressed_size
+
+    def finish_zip(self) -> None:
+        """zipのセントラルディレクトリと終端レコードを書き込み
+        """
+        limit = ArchiveWriter.ZIP64_LIMIT
+        directory_offset = self.offset
+        directory = b"".join(self.central_directory)
+        self.file.write(directory)
+
+        num_entries = len(self.central_directory)
+        if num_entries >= 0xFFFF or directory_offset >= limit or len(directory) >= limit:
+            end_offset = directory_offset + len(directory)
+            self.file.write(ArchiveWriter.ZIP64_END.pack(0x06064b50, 44, 45, 45, 0, 0, num_entries, num_entries, len(directory), directory_offset))
+            self.file.write(ArchiveWriter.ZIP64_LOCATOR.pack(0x07064b50, 0, end_offset, 1))
+            self.file.write(ArchiveWriter.ZIP_END.pack(0x06054b50, 0, 0, 0xFFFF, 0xFFFF, limit, limit, 0))
+        else:
+            self.file.write(ArchiveWriter.ZIP_END.pack(0x06054b50, 0, 0, num_entries, num_entries, len(directory), directory_offset, 0))
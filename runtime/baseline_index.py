@@ -0,0 +1,153 @@
+import os
+import json
+import hashlib
+import threading as th
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from runtime.directory_walker import *
+from runtime.path_filter import *
+
+
+__all__ = [
+    "BaselineIndex",
+]
+
+
+class BaselineIndex:
+    """改変前(プリスティン)のエンジンのファイルのサイズとハッシュ値の索引
+
+    1回だけ構築して保存し、差分出力では検索内容の走査と同じ読み込みでハッシュ値を計算して比較します。
+    検索内容を書き忘れた編集も検出できます。
+    """
+    VERSION = 1
+
+    # 構築時に読み込むバイト数
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, path:Path) -> None:
+        """コンストラクタ
+
+        Args:
+            path (Path): 索引のパス
+        """
+        self.path = Path(path)
+
+        # 入力ディレクトリからの相対パスとサイズ, ハッシュ値(BLAKE2b)
+        self.entries:dict[str, list] = {}
+
+    @staticmethod
+    def digest_of(data:bytes) -> str:
+        """内容のハッシュ値を計算
+
+        Args:
+            data (bytes): ファイルの内容
+
+        Returns:
+            str: ハッシュ値
+        """
+        return hashlib.blake2b(data).hexdigest()
+
+    @staticmethod
+    def create_hasher() -> "hashlib._Hash":
+        """逐次計算するハッシュを生成 (digest_ofと同じ方式)
+
+        Returns:
+            hashlib._Hash: ハッシュ
+        """
+        return hashlib.blake2b()
+
+    def load(self) -> bool:
+        """索引を読み込み
+
+        Returns:
+            bool: 読み込めた場合はTrueを返します。
+        """
+        try:
+            with open(str(self.path), mode="r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            return False
+        if not isinstance((entries:=data.get("entries")), dict):
+            return False
+
+        self.entries = entries
+        return True
+
+    def save(self) -> None:
+        """索引を保存
+
+        書き込み途中で中断しても壊れないように一時ファイルから置き換えます。
+        """
+        data = {
+            "version": self.VERSION,
+            "entries": self.entries,
+        }
+
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(str(tmp_path), mode="w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(str(tmp_path), str(self.path))
+
+    def build(
+        self,
+        pristine_dir:str,
+        path_filter:Optional[PathFilter] = None,
+        num_workers:int = 1,
+        stop_event:Optional[th.Event] = None,
+    ) -> None:
+        """改変前のディレクトリを走査して索引を構築
+
+        差分出力と同じ条件(path_filter)で走査してください。
+
+        Args:
+            pristine_dir (str): 改変前のエンジンのディレクトリ (入力ディレクトリと同じ階層)
+            path_filter (Optional[PathFilter], optional): 走査対象のファイルの条件. Defaults to None.
+            num_workers (int, optional): ハッシュ値を計算するスレッド数. Defaults to 1.
+            stop_event (Optional[th.Event], optional): 構築の中断の通知. Defaults to None.
+        """
+        walker = DirectoryWalker(pristine_dir, path_filter, num_threads=num_workers, stop_event=stop_event)
+
+        def hash_file(entry:os.DirEntry) -> Optional[tuple[str, list]]:
+            h = BaselineIndex.create_hasher()
+            size = 0
+            try:
+                with open(entry.path, mode="rb") as f:
+                    while (chunk:=f.read(BaselineIndex.CHUNK_SIZE)):
+                        h.update(chunk)
+                        size += len(chunk)
+            except OSError:
+                return None
+
+            key = entry.path[walker.root_length:]
+            return (key if os.sep == "/" else key.replace(os.sep, "/")), [size, h.hexdigest()]
+
+        entries:dict[str, list] = {}
+        with ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor:
+            for result in executor.map(hash_file, walker.walk()):
+                if result is not None:
+                    entries[result[0]] = result[1]
+        self.entries = entries
+
+    def is_edited(self, key:str, size:int, digest:Optional[str]) -> bool:
+        """改変前から変更されたファイルか判定
+
+        Args:
+            key (str): 入力ディレクトリからの相対パス
+            size (int): ファイルサイズ
+            digest (Optional[str]): ハッシュ値. サイズが改変前と異なり計算していない場合はNone
+
+        Returns:
+            bool: 改変前に無い, またはサイズかハッシュ値が異なる場合はTrueを返します。
+        """
+        return BaselineIndex.is_edited_entry(self.entries.get(key), size, digest)
+
+    @staticmethod
+    def is_edited_entry(entry:Optional[list], size:int, digest:Optional[str]) -> bool:
+        if entry is None:
+            return True
+        return entry[0] != size or entry[1] != digest
@@ -0,0 +1,481 @@
+import os
+import hashlib
+import threading as th
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+from runtime.digest_cache import *
+from runtime.directory_walker import *
+from runtime.git_walker import *
+from runtime.memory_budget import *
+from runtime.path_filter import *
+from runtime.scan_manifest import *
+from runtime.tag_matcher import *
+
+
+__all__ = [
+    "BACKEND_THREAD",
+    "BACKEND_PROCESS",
+    "BACKEND_HYBRID",
+    "BACKEND_ASYNC",
+    "BACKENDS",
+    "DEFAULT_CHUNK_SIZE",
+    "DEFAULT_IO_CONCURRENCY",
+    "DEFAULT_COPY_QUEUE_SIZE",
+    "DEFAULT_KEEP_FILE_SIZE",
+    "DEFAULT_KEEP_MEMORY",
+    "SYNC_NONE",
+    "SYNC_STAT",
+    "SYNC_HASH",
+    "SYNC_MODES",
+    "ARCHIVE_ZIP",
+    "ARCHIVE_TAR_GZ",
+    "ARCHIVE_TAR_ZST",
+    "ARCHIVE_FORMATS",
+    "archive_format_of",
+    "BASELINE_LABEL",
+    "default_cache_dir",
+    "DiffExportInfo",
+]
+
+
+# 走査とコピーをスレッドで実行
+BACKEND_THREAD = "thread"
+# 走査とコピーをプロセスで実行
+BACKEND_PROCESS = "process"
+# 走査をプロセス、コピーをスレッドで実行
+BACKEND_HYBRID = "hybrid"
+# ファイル単位の走査とコピーをasyncioから専用のスレッドプールで多数並行して実行 (待ち時間の長いネットワーク共有向け)
+BACKEND_ASYNC = "async"
+
+BACKENDS = (
+    BACKEND_THREAD,
+    BACKEND_PROCESS,
+    BACKEND_HYBRID,
+    BACKEND_ASYNC,
+)
+
+# 常にコピー
+SYNC_NONE = "none"
+# サイズと更新日時が出力先と一致する場合はコピーを省略
+SYNC_STAT = "stat"
+# サイズとハッシュ値が出力先と一致する場合はコピーを省略
+SYNC_HASH = "hash"
+
+SYNC_MODES = (
+    SYNC_NONE,
+    SYNC_STAT,
+    SYNC_HASH,
+)
+
+ARCHIVE_ZIP = "zip"
+ARCHIVE_TAR_GZ = "tar.gz"
+ARCHIVE_TAR_ZST = "tar.zst"
+
+ARCHIVE_FORMATS = (
+    ARCHIVE_ZIP,
+    ARCHIVE_TAR_GZ,
+    ARCHIVE_TAR_ZST,
+)
+
+# アーカイブのファイル名の拡張子と形式
+ARCHIVE_SUFFIXES = {
+    ".zip": ARCHIVE_ZIP,
+    ".tar.gz": ARCHIVE_TAR_GZ,
+    ".tgz": ARCHIVE_TAR_GZ,
+    ".tar.zst": ARCHIVE_TAR_ZST,
+    ".tzst": ARCHIVE_TAR_ZST,
+}
+
+# 改変前から変更されたが検索内容を含まないファイルの検索結果の表示名
+BASELINE_LABEL = "<baseline>"
+
+# ワーカーにまとめて渡すファイル数
+DEFAULT_CHUNK_SIZE = 256
+
+# 走査からコピーに渡す待ちファイル数の上限
+DEFAULT_COPY_QUEUE_SIZE = 1024
+
+# BACKEND_ASYNCで同時に実行するファイル操作の上限
+DEFAULT_IO_CONCURRENCY = 256
+
+# BACKEND_ASYNCでディレクトリを走査するスレッド数の上限 (未指定の場合)
+DEFAULT_ASYNC_WALK_THREADS = 32
+
+# 走査で読み込んだ内容をコピーまで保持するファイルサイズの上限
+DEFAULT_KEEP_FILE_SIZE = 256 * 1024
+
+# 走査で読み込んだ内容を保持するメモリの上限 (全てのワーカーの合計)
+DEFAULT_KEEP_MEMORY = 256 * 1024 * 1024
+
+
+def archive_format_of(path:Union[str, Path]) -> str:
+    """ファイル名の拡張子からアーカイブ形式を判定
+
+    Args:
+        path (Union[str, Path]): アーカイブのパス
+
+    Raises:
+        ValueError: 対応していない拡張子
+
+    Returns:
+        str: アーカイブ形式 (ARCHIVE_FORMATS)
+    """
+    name = Path(path).name.lower()
+    for suffix, archive_format in ARCHIVE_SUFFIXES.items():
+        if name.endswith(suffix):
+            return archive_format
+    raise ValueError(f"unknown archive format: {path}")
+
+
+def default_cache_dir() -> Path:
+    """走査結果のマニフェストなどを保存する既定のディレクトリを取得
+
+    出力先は他の人に渡すので、入力ディレクトリのパスやファイルの一覧を含むファイルはユーザーごとのキャッシュに保存します。
+
+    Returns:
+        Path: Windowsは%LOCALAPPDATA%, それ以外は$XDG_CACHE_HOME (未設定の場合は~/.cache) 内のディレクトリ
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or str(Path.home() / "AppData" / "Local")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(base) / "difference_exporter"
+
+
+@dataclass
+class DiffExportInfo:
+    """差分出力情報
+    """
+    input_dir:Path
+    output_dir:Path
+    tags:Union[str, tuple[str, ...]]
+    num_workers:int
+    incremental:bool = False
+    mmap_threshold:int = TagMatcher.MMAP_THRESHOLD
+    backend:str = BACKEND_THREAD
+    chunk_size:int = DEFAULT_CHUNK_SIZE
+    excluded_dirs:tuple[str, ...] = DEFAULT_EXCLUDED_DIRS
+    walk_threads:Optional[int] = None
+    sync_mode:str = SYNC_NONE
+    mirror:bool = False
+    tag_regexes:tuple[str, ...] = ()
+    tag_output_dirs:dict[str, Path] = field(default_factory=dict)
+    tag_report_path:Optional[Path] = None
+    extensions:tuple[str, ...] = DEFAULT_EXTENSIONS
+    excluded_patterns:tuple[str, ...] = ()
+    excluded_extensions:tuple[str, ...] = ()
+    max_file_size:Optional[int] = None
+    git_base:Optional[str] = None
+    copy_workers:Optional[int] = None
+    copy_queue_size:int = DEFAULT_COPY_QUEUE_SIZE
+    keep_file_size:int = DEFAULT_KEEP_FILE_SIZE
+    keep_memory:int = DEFAULT_KEEP_MEMORY
+    trace_path:Optional[Path] = None
+    histogram_path:Optional[Path] = None
+    resume:bool = False
+    archive_path:Optional[Path] = None
+    baseline_path:Optional[Path] = None
+    baseline_dir:Optional[Path] = None
+    autotune:bool = False
+    autotune_path:Optional[Path] = None
+    io_concurrency:int = DEFAULT_IO_CONCURRENCY
+    cache_dir:Optional[Path] = None
+
+    def __post_init__(self) -> None:
+        if isinstance(self.input_dir, str):
+            self.input_dir = Path(self.input_dir)
+
+        if isinstance(self.output_dir, str):
+            self.output_dir = Path(self.output_dir)
+
+        self.tags = (self.tags, ) if isinstance(self.tags, str) else tuple(self.tags)
+        self.tag_regexes = tuple(self.tag_regexes)
+        if len(self.tags) + len(self.tag_regexes) == 0:
+            raise ValueError("no tag")
+
+        # 検索内容ごとの出力ディレクトリ (出力ディレクトリ外の場合もあるので絶対パス)
+        self.tag_output_dirs = {label: Path(directory).absolute() for label, directory in self.tag_output_dirs.items()}
+        for label in self.tag_output_dirs:
+            if label not in self.tag_labels:
+                raise ValueError(f"unknown tag: {label}")
+
+        if isinstance(self.tag_report_path, str):
+            self.tag_report_path = Path(self.tag_report_path)
+
+        if isinstance(self.trace_path, str):
+            self.trace_path = Path(self.trace_path)
+
+        if isinstance(self.histogram_path, str):
+            self.histogram_path = Path(self.histogram_path)
+
+        if isinstance(self.baseline_path, str):
+            self.baseline_path = Path(self.baseline_path)
+
+        if isinstance(self.baseline_dir, str):
+            self.baseline_dir = Path(self.baseline_dir)
+
+        if self.baseline_dir is not None and self.baseline_path is None:
+            raise ValueError("baseline_dir requires baseline_path")
+
+        if isinstance(self.autotune_path, str):
+            self.autotune_path = Path(self.autotune_path)
+
+        self.cache_dir = default_cache_dir() if self.cache_dir is None else Path(self.cache_dir)
+
+        # アーカイブへの出力 (出力ディレクトリには何も出力しません)
+        self.archive_format:Optional[str] = None
+        if self.archive_path is not None:
+            self.archive_path = Path(self.archive_path)
+            self.archive_format = archive_format_of(self.archive_path)
+            if self.mirror or len(self.tag_output_dirs) > 0:
+                raise ValueError("mirror and tag output directories are not supported with an archive")
+
+        self.num_workers = min(max(1, self.num_workers), os.cpu_count())
+
+        if self.backend not in BACKENDS:
+            raise ValueError(f"unknown backend: {self.backend}")
+
+        # プロセスプールは実行中に増減できない
+        if self.autotune and self.backend != BACKEND_THREAD:
+            raise ValueError("autotune requires the thread backend")
+
+        self.chunk_size = max(1, self.chunk_size)
+
+        if self.sync_mode not in SYNC_MODES:
+            raise ValueError(f"unknown sync mode: {self.sync_mode}")
+
+        self.extensions = tuple(self.extensions)
+        self.excluded_extensions = tuple(self.excluded_extensions)
+        self.excluded_dirs = tuple(self.excluded_dirs)
+        self.excluded_patterns = tuple(self.excluded_patterns)
+
+        # 走査対象の条件は差分出力ごとに1回だけ構築
+        self.path_filter = PathFilter(
+            extensions=self.extensions,
+            excluded_extensions=self.excluded_extensions,
+            excluded_dirs=self.excluded_dirs,
+            excluded_patterns=self.excluded_patterns,
+            max_size=self.max_file_size,
+        )
+        if len(self.path_filter.extensions) == 0:
+            raise ValueError("no extension")
+
+        self.io_concurrency = max(1, self.io_concurrency)
+
+        # 未指定の場合はワーカー数と同じスレッド数で走査 (BACKEND_ASYNCはscandirの待ち時間も重ねるため多めに)
+        if self.walk_threads is None:
+            self.walk_threads = self.num_workers
+            if self.backend == BACKEND_ASYNC:
+                self.walk_threads = max(self.num_workers, min(self.io_concurrency, DEFAULT_ASYNC_WALK_THREADS))
+        self.walk_threads = max(1, self.walk_threads)
+
+        # 未指定の場合はワーカー数と同じスレッド数でコピー
+        if self.copy_workers is None:
+            self.copy_workers = self.num_workers
+        self.copy_workers = max(1, self.copy_workers)
+
+        self.copy_queue_size = max(1, self.copy_queue_size)
+
+        self.input_dir_parts_length = len(self.input_dir.parts)
+
+    @property
+    def tag_labels(self) -> tuple[str, ...]:
+        """検索内容(文字列と正規表現)を番号順に取得
+
+        Returns:
+            tuple[str, ...]: 検索内容
+        """
+        return self.tags + self.tag_regexes
+
+    @property
+    def mask_labels(self) -> tuple[str, ...]:
+        """検索結果のマスクのビットの表示名を番号順に取得
+
+        改変前との比較を行う場合は検索内容の後ろにBASELINE_LABELが続きます。
+
+        Returns:
+            tuple[str, ...]: 表示名
+        """
+        if self.baseline_path is None:
+            return self.tag_labels
+        return self.tag_labels + (BASELINE_LABEL, )
+
+    @property
+    def baseline_mask(self) -> int:
+        """改変前から変更されたが検索内容を含まないファイルの検索結果のマスク
+
+        Returns:
+            int: マスク. 改変前と比較しない場合は0
+        """
+        if self.baseline_path is None:
+            return 0
+        return 1 << len(self.tag_labels)
+
+    @property
+    def profiling(self) -> bool:
+        """処理ごとの計測を行うか
+
+        Returns:
+            bool: トレースかヒストグラムを出力する場合はTrueを返します。
+        """
+        return self.trace_path is not None or self.histogram_path is not None
+
+    @property
+    def search_key(self) -> dict[str, list[str]]:
+        """走査結果のマニフェストの有効性の判定に用いる検索内容を取得
+
+        Returns:
+            dict[str, list[str]]: 検索内容
+        """
+        key = {
+            "tags": list(self.tags),
+            "regexes": list(self.tag_regexes),
+        }
+
+        # 改変前と比較する場合は比較結果もマスクに含まれる
+        if self.baseline_path is not None:
+            key["baseline"] = [str(self.baseline_path.absolute())]
+        return key
+
+    @property
+    def state_dir(self) -> Path:
+        """入力ディレクトリと出力ディレクトリの組ごとのキャッシュのディレクトリを取得
+
+        Returns:
+            Path: キャッシュのディレクトリ (cache_dir内)
+        """
+        key = f"{self.input_dir.absolute()}\n{self.output_dir.absolute()}"
+        return self.cache_dir / hashlib.blake2b(key.encode("utf-8", errors="surrogateescape"), digest_size=8).hexdigest()
+
+    @property
+    def manifest_path(self) -> Path:
+        """走査結果のマニフェストのパスを取得
+
+        出力先に入力ディレクトリのパスやファイルの一覧が残らないようにキャッシュのディレクトリに保存します。
+
+        Returns:
+            Path: マニフェストのパス
+        """
+        return self.state_dir / ScanManifest.FILENAME
+
+    @property
+    def digest_cache_path(self) -> Path:
+        """出力先のファイルのハッシュ値のキャッシュのパスを取得
+
+        出力先のファイルの一覧を含むので、出力先ではなくキャッシュのディレクトリに保存します。
+
+        Returns:
+            Path: キャッシュのパス
+        """
+        return self.state_dir / DigestCache.FILENAME
+
+    def create_matcher(self) -> TagMatcher:
+        """検索内容の検索を生成
+
+        Returns:
+            TagMatcher: 検索内容の検索
+        """
+        return TagMatcher(self.tags, self.tag_regexes, mmap_threshold=self.mmap_threshold)
+
+    def create_memory_budget(self, num_shares:int = 1) -> Optional[MemoryBudget]:
+        """走査で読み込んだ内容を保持するメモリの上限を生成
+
+        Args:
+            num_shares (int, optional): 上限を等分するプロセス数. Defaults to 1.
+
+        Returns:
+            Optional[MemoryBudget]: メモリの上限. 保持しない場合はNoneを返します。
+        """
+        if self.keep_file_size <= 0 or self.keep_memory <= 0:
+            return None
+        return MemoryBudget(self.keep_memory // max(1, num_shares), self.keep_file_size)
+
+    def create_walker(self, stop_event:Optional[th.Event] = None) -> DirectoryWalker:
+        """入力ディレクトリの走査を生成
+
+        基準のリビジョン(git_base)を指定した場合はgitから変更・追加されたファイルのみを列挙します。
+
+        Args:
+            stop_event (Optional[th.Event], optional): 走査の中断の通知. Defaults to None.
+
+        Returns:
+            DirectoryWalker: 入力ディレクトリの走査
+        """
+        if self.git_base is not None:
+            return GitWalker(str(self.input_dir), self.git_base, self.path_filter)
+
+        return DirectoryWalker(
+            str(self.input_dir),
+            path_filter=self.path_filter,
+            num_threads=self.walk_threads,
+            stop_event=stop_event,
+        )
+
+    def relative_key(self, path:Path) -> str:
+        """入力ディレクトリからの相対パスを取得
+
+        Args:
+            path (Path): 入力ディレクトリ内のファイルパス
+
+        Returns:
+            str: '/'区切りの相対パス
+        """
+        return "/".join(path.parts[self.input_dir_parts_length:])
+
+    def output_roots_of(self, mask:int) -> list[Path]:
+        """一致した検索内容のコピー先の出力ディレクトリを取得
+
+        Args:
+            mask (int): 検索結果のマスク
+
+        Returns:
+            list[Path]: 出力ディレクトリ
+        """
+        roots:list[Path] = []
+        for i, label in enumerate(self.mask_labels):
+            if mask & (1 << i) and (root:=self.tag_output_dirs.get(label, self.output_dir)) not in roots:
+                roots.append(root)
+        return roots
+
+    def output_key(self, key:str, root:Optional[Path] = None) -> str:
+        """コピー先のパスを取得
+
+        Args:
+            key (str): 入力ディレクトリからの相対パス
+            root (Optional[Path], optional): 出力ディレクトリ. Noneの場合はoutput_dir. Defaults to None.
+
+        Returns:
+            str: '/'区切りの出力ディレクトリからの相対パス. output_dir以外は絶対パス.
+        """
+        if root is None or root == self.output_dir:
+            return f"{self.input_dir.name}/{key}"
+        return (root / self.input_dir.name / key).as_posix()
+
+    def output_keys(self, key:str, mask:int) -> list[str]:
+        """一致した検索内容の全てのコピー先のパスを取得
+
+        Args:
+            key (str): 入力ディレクトリからの相対パス
+            mask (int): 検索結果のマスク
+
+        Returns:
+            list[str]: コピー先のパス
+        """
+        return [self.output_key(key, root) for root in self.output_roots_of(mask)]
+
+    def output_dir_of(self, path:Path, root:Optional[Path] = None) -> Path:
+        """ファイルのコピー先ディレクトリを取得
+
+        入力ディレクトリ名を含めた階層でコピーします。
+
+        Args:
+            path (Path): 入力ディレクトリ内のファイルパス
+            root (Optional[Path], optional): 出力ディレクトリ. Noneの場合はoutput_dir. Defaults to None.
+
+        Returns:
+            Path: コピー先ディレクトリ
+        """
+        root = self.output_dir if root is None else root
+        return root / os.path.join(*path.parts[self.input_dir_parts_length-1:-1])
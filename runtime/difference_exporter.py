@@ -1,49 +1,67 @@
+import os
 import re
+import json
+import asyncio
 from pathlib import Path
-import time
-import os
-import shutil
 import threading as th
 import queue
-from typing import Optional, Callable
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Any, Optional, Callable, Union, Sequence
+
+from runtime.archive_writer import *
+from runtime.baseline_index import *
+from runtime.diff_export_info import *
+from runtime.digest_cache import *
+from runtime.directory_walker import *
+from runtime.export_profiler import *
+from runtime.export_stats import *
+from runtime.file_scanner import *
+from runtime.git_walker import *
+from runtime.memory_budget import *
+from runtime.output_writer import *
+from runtime.path_filter import *
+from runtime.scan_manifest import *
+from runtime.scan_process import *
+from runtime.tag_matcher import *
+from runtime.worker_tuner import *
 
 
 __all__ = [
+    "ExportCancelled",
     "DifferenceExporter",
 ]
 
 
-@dataclass
-class DiffExportInfo:
-    """差分出力情報
+class ExportCancelled(Exception):
+    """差分出力を中断した
     """
-    input_dir:Path
-    output_dir:Path
-    tag:str
-    num_workers:int
-
-    def __post_init__(self) -> None:
-        if isinstance(self.input_dir, str):
-            self.input_dir = Path(self.input_dir)
-
-        if isinstance(self.output_dir, str):
-            self.output_dir = Path(self.output_dir)
-
-        self.num_workers = min(max(1, self.num_workers), os.cpu_count())
+    pass
 
 
 class DifferenceExporter:
-    WAIT_TIME = 1 / 30
-
     """差分ファイルの出力
     """
     def __init__(self) -> None:
         """コンストラクタ
         """
-        # GIF変換と出力を行うスレッド
+        # 差分出力を行うスレッド
         self.thread:th.Thread = None
 
+        # 前回の差分出力で発生したエラー
+        self.error:Optional[BaseException] = None
+
+        # 前回の差分出力の集計
+        self.stats = ExportStats()
+
+        # 前回の差分出力の処理ごとの計測 (計測しない場合はNone)
+        self.profiler:Optional[ExportProfiler] = None
+
+        # 差分出力の中断の通知 (ワーカーのエラーでもセットします)
+        self.stop_event = th.Event()
+
+        # 前回の差分出力のワーカー数の自動調整 (自動調整しない場合はNone)
+        self.tuner:Optional[WorkerTuner] = None
+
     def is_thread_ready(self) -> bool:
         """スレッドの立ち上げ準備が整っているかを取得します。
 
@@ -53,14 +71,131 @@ class DifferenceExporter:
         # スレッドが生きている場合は準備完了していません。
         return True if self.thread is None else not self.thread.is_alive()
 
+    def wait(self, timeout:Optional[float] = None) -> bool:
+        """差分出力の完了を待機
+
+        Args:
+            timeout (Optional[float], optional): 待機する秒数. Noneの場合は完了まで待機. Defaults to None.
+
+        Returns:
+            bool: 差分出力が完了している場合はTrueを返します。
+        """
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return self.is_thread_ready()
+
+    def cancel(self) -> bool:
+        """実行中の差分出力を中断
+
+        走査とワーカーに中断を通知して、完了を待たずに戻ります。
+        中断した差分出力は完了時のコールバックを呼び出し、self.errorにExportCancelledを記録します。
+        走査結果のマニフェストを使う場合は処理済みのファイルをチェックポイントとして保存します。
+
+        Returns:
+            bool: 実行中の差分出力に中断を通知した場合はTrueを返します。
+        """
+        if self.is_thread_ready():
+            return False
+        self.stop_event.set()
+        return True
+
+    @property
+    def cancelled(self) -> bool:
+        """前回の差分出力を中断したか
+
+        Returns:
+            bool: 中断した場合はTrueを返します。
+        """
+        return isinstance(self.error, ExportCancelled)
+
+    def snapshot(self) -> ExportSnapshot:
+        """差分出力の進捗を取得
+
+        別スレッドから一定間隔でポーリングする想定です。
+
+        Returns:
+            ExportSnapshot: 現時点の集計
+        """
+        return self.stats.snapshot()
+
     def export(
         self,
         input_dir:str,
         output_dir:str,
-        tag:str,
+        tag:Union[str, Sequence[str]],
         num_workers:int,
-        callback_exported:Optional[Callable[[bool, str], None]] = None,
+        callback_exported:Optional[Callable[[], None]] = None,
+        incremental:bool = False,
+        mmap_threshold:int = TagMatcher.MMAP_THRESHOLD,
+        backend:str = BACKEND_THREAD,
+        chunk_size:int = DEFAULT_CHUNK_SIZE,
+        excluded_dirs:tuple[str, ...] = DEFAULT_EXCLUDED_DIRS,
+        walk_threads:Optional[int] = None,
+        sync_mode:str = SYNC_NONE,
+        mirror:bool = False,
+        tag_regexes:Sequence[str] = (),
+        tag_output_dirs:Optional[dict[str, str]] = None,
+        tag_report_path:Optional[str] = None,
+        extensions:Sequence[str] = DEFAULT_EXTENSIONS,
+        excluded_patterns:Sequence[str] = (),
+        excluded_extensions:Sequence[str] = (),
+        max_file_size:Optional[int] = None,
+        git_base:Optional[str] = None,
+        copy_workers:Optional[int] = None,
+        keep_file_size:int = DEFAULT_KEEP_FILE_SIZE,
+        keep_memory:int = DEFAULT_KEEP_MEMORY,
+        trace_path:Optional[str] = None,
+        histogram_path:Optional[str] = None,
+        resume:bool = False,
+        archive_path:Optional[str] = None,
+        baseline_path:Optional[str] = None,
+        baseline_dir:Optional[str] = None,
+        autotune:bool = False,
+        autotune_path:Optional[str] = None,
+        io_concurrency:int = DEFAULT_IO_CONCURRENCY,
+        cache_dir:Optional[str] = None,
     ) -> bool:
+        """差分ファイルの出力を開始
+
+        Args:
+            input_dir (str): 入力・コピー元ディレクトリ
+            output_dir (str): 出力・コピー先ディレクトリ
+            tag (Union[str, Sequence[str]]): 検索内容. 複数指定した場合は1回の読み込みでまとめて検索します.
+            num_workers (int): ワーカー数
+            callback_exported (Optional[Callable[[], None]], optional): 出力完了時のコールバック. Defaults to None.
+            incremental (bool, optional): 前回の走査結果から変更の無いファイルの走査を省略. Defaults to False.
+            mmap_threshold (int, optional): メモリマップで検索するファイルサイズの下限. 0以下は無効. Defaults to TagMatcher.MMAP_THRESHOLD.
+            backend (str, optional): 走査とコピーの実行方式 (BACKENDS). Defaults to BACKEND_THREAD.
+            chunk_size (int, optional): ワーカーにまとめて渡すファイル数. Defaults to DEFAULT_CHUNK_SIZE.
+            excluded_dirs (tuple[str, ...], optional): 走査しないディレクトリ名. '/'を含む場合は入力ディレクトリからの相対パス. Defaults to DEFAULT_EXCLUDED_DIRS.
+            walk_threads (Optional[int], optional): ディレクトリを走査するスレッド数. Noneの場合はワーカー数. Defaults to None.
+            sync_mode (str, optional): 出力先と同一のファイルのコピーを省略する方式 (SYNC_MODES). Defaults to SYNC_NONE.
+            mirror (bool, optional): 前回までに出力して今回は出力しなかったファイルを出力先から削除. Defaults to False.
+            tag_regexes (Sequence[str], optional): 検索内容の正規表現 (行単位). Defaults to ().
+            tag_output_dirs (Optional[dict[str, str]], optional): 検索内容(または正規表現)ごとの出力ディレクトリ. 未指定の検索内容はoutput_dirに出力. Defaults to None.
+            tag_report_path (Optional[str], optional): ファイルごとに一致した検索内容を出力するJSONのパス. Defaults to None.
+            extensions (Sequence[str], optional): 走査対象の拡張子. Defaults to DEFAULT_EXTENSIONS.
+            excluded_patterns (Sequence[str], optional): 走査しないファイル・ディレクトリ (gitignore形式). Defaults to ().
+            excluded_extensions (Sequence[str], optional): 走査対象から除く拡張子. Defaults to ().
+            max_file_size (Optional[int], optional): 走査するファイルサイズの上限. Noneは無制限. Defaults to None.
+            git_base (Optional[str], optional): 指定したリビジョンから変更・追加されたファイルのみを走査 (入力ディレクトリはgitの作業ツリー内). Defaults to None.
+            copy_workers (Optional[int], optional): コピー用スレッド数 (BACKEND_PROCESS以外). Noneの場合はワーカー数. Defaults to None.
+            keep_file_size (int, optional): 走査で読み込んだ内容をコピーに使い回すファイルサイズの上限. 0以下は無効 (BACKEND_HYBRID以外). Defaults to DEFAULT_KEEP_FILE_SIZE.
+            keep_memory (int, optional): 走査で読み込んだ内容を保持するメモリの上限. 0以下は無効. Defaults to DEFAULT_KEEP_MEMORY.
+            trace_path (Optional[str], optional): 処理ごとの計測をChromeのトレースイベント形式で出力するJSONのパス. Defaults to None.
+            histogram_path (Optional[str], optional): 処理ごとの計測のヒストグラムを出力するJSONのパス. Defaults to None.
+            resume (bool, optional): 前回の差分出力が中断した場合はチェックポイントから処理済みのファイルの走査を省略して再開. Defaults to False.
+            archive_path (Optional[str], optional): 出力先ディレクトリの代わりに出力するアーカイブのパス (.zip, .tar.gz, .tar.zst). 同期方式は無視します. Defaults to None.
+            baseline_path (Optional[str], optional): 改変前のファイルのサイズとハッシュ値の索引のパス. 指定した場合は検索内容を含まない編集も出力します. Defaults to None.
+            baseline_dir (Optional[str], optional): 索引が無い場合に構築する改変前のエンジンのディレクトリ. Defaults to None.
+            autotune (bool, optional): 計測しながら走査とコピーのワーカー数を増減 (BACKEND_THREADのみ). num_workersとcopy_workersは使いません. Defaults to False.
+            autotune_path (Optional[str], optional): 入力ボリュームごとに自動調整したワーカー数を記録するJSONのパス. Noneの場合はホームディレクトリ. Defaults to None.
+            io_concurrency (int, optional): 同時に実行するファイル操作の上限 (BACKEND_ASYNCのみ). Defaults to DEFAULT_IO_CONCURRENCY.
+            cache_dir (Optional[str], optional): 走査結果のマニフェストなどを保存するディレクトリ. Noneの場合はdefault_cache_dir(). Defaults to None.
+
+        Returns:
+            bool: 出力を開始できた場合はTrueを返します。
+        """
         # 前回実行した差分出力が完了していない
         if not self.is_thread_ready():
             return False
@@ -77,16 +212,91 @@ class DifferenceExporter:
         if Path(input_dir).absolute() == Path(output_dir).absolute():
             return False
 
+        # 不正な実行方式
+        if backend not in BACKENDS:
+            return False
+
+        # 不正な同期方式
+        if sync_mode not in SYNC_MODES:
+            return False
+
+        # 検索内容ごとの出力ディレクトリの有効性を判定
+        tag_output_dirs = {} if tag_output_dirs is None else tag_output_dirs
+        for directory in tag_output_dirs.values():
+            if not DifferenceExporter.is_valid_directory(directory):
+                return False
+            if Path(input_dir).absolute() == Path(directory).absolute():
+                return False
+
+        try:
+            info = DiffExportInfo(
+                input_dir,
+                output_dir,
+                tag,
+                num_workers,
+                incremental=incremental,
+                mmap_threshold=mmap_threshold,
+                backend=backend,
+                chunk_size=chunk_size,
+                excluded_dirs=excluded_dirs,
+                walk_threads=walk_threads,
+                sync_mode=sync_mode,
+                mirror=mirror,
+                tag_regexes=tag_regexes,
+                tag_output_dirs=tag_output_dirs,
+                tag_report_path=tag_report_path,
+                extensions=extensions,
+                excluded_patterns=excluded_patterns,
+                excluded_extensions=excluded_extensions,
+                max_file_size=max_file_size,
+                git_base=git_base,
+                copy_workers=copy_workers,
+                keep_file_size=keep_file_size,
+                keep_memory=keep_memory,
+                trace_path=trace_path,
+                histogram_path=histogram_path,
+                resume=resume,
+                archive_path=archive_path,
+                baseline_path=baseline_path,
+                baseline_dir=baseline_dir,
+                autotune=autotune,
+                autotune_path=autotune_path,
+                io_concurrency=io_concurrency,
+                cache_dir=cache_dir,
+            )
+
+            # 不正な正規表現はここで弾く
+            info.create_matcher()
+
+            # gitの作業ツリーでない, またはリビジョンが存在しない
+            if info.git_base is not None:
+                info.create_walker().verify()
+
+            # zstdが無い環境など
+            if info.archive_path is not None and not ArchiveWriter.is_available(info.archive_format):
+                return False
+
+            # 改変前の索引が無く構築もできない
+            if info.baseline_path is not None and not info.baseline_path.is_file():
+                if info.baseline_dir is None or not DifferenceExporter.is_valid_directory(info.baseline_dir):
+                    return False
+        except (ValueError, re.error, GitError):
+            return False
+
+        # 進捗のポーリングが開始直後から今回の集計を参照できるようにスレッド立ち上げ前に初期化
+        self.error = None
+        self.stats = ExportStats()
+        self.profiler = ExportProfiler() if info.profiling else None
+        self.stop_event = th.Event()
+        self.tuner = WorkerTuner(info, self.stats) if info.autotune else None
+        if self.tuner is None:
+            self.stats.record_workers(info.num_workers, info.copy_workers)
+
         # スレッド立ち上げ
         self.thread = th.Thread(
             target=self.thread_export,
             args=(
-                DiffExportInfo(
-                    input_dir,
-                    output_dir,
-                    tag,
-                    num_workers,
-                ),
+                info,
                 callback_exported,
             ),
             daemon=True,
@@ -98,40 +308,571 @@ class DifferenceExporter:
     def thread_export(
         self,
         info:DiffExportInfo,
-        callback_exported:Optional[Callable[[bool, str], None]] = None,
+        callback_exported:Optional[Callable[[], None]] = None,
     ) -> None:
+        """差分出力スレッド
+
+        全てのワーカーの終了を待ってから出力完了のコールバックを呼び出します。
+        ワーカーで発生したエラーはself.errorに記録します。
+
+        Args:
+            info (DiffExportInfo): 差分出力情報
+            callback_exported (Optional[Callable[[], None]], optional): 出力完了時のコールバック. Defaults to None.
+        """
+        phase_start = ExportProfiler.now()
+
+        # 前回の走査結果を読み込み (出力先の同期と一致した検索内容の出力にも使います)
+        manifest:Optional[ScanManifest] = None
+        if info.incremental or info.mirror or info.tag_report_path is not None or info.resume:
+            manifest = ScanManifest(info.manifest_path, info.input_dir, info.search_key)
+            manifest.load()
+
+            # 差分出力しない場合は前回の判定結果を使わずに全て走査 (中断したチェックポイントからの再開を除く)
+            if not info.incremental and not (info.resume and manifest.interrupted):
+                manifest.previous = {}
+
+        # 出力先のファイルのハッシュ値を読み込み
+        digest_cache:Optional[DigestCache] = None
+        if info.sync_mode == SYNC_HASH:
+            digest_cache = DigestCache(info.digest_cache_path)
+            digest_cache.load()
+
+        # スレッドで走査とコピーを行う場合は一致した小さいファイルの内容を保持してコピーで読み直さない
+        budget:Optional[MemoryBudget] = None
+        if info.backend in (BACKEND_THREAD, BACKEND_ASYNC):
+            budget = info.create_memory_budget()
+
+        writer:OutputWriter
+        if info.archive_path is not None:
+            writer = ArchiveWriter(info, self.stats, budget, self.profiler, manifest)
+        else:
+            writer = OutputWriter(info, self.stats, digest_cache, budget, self.profiler, manifest)
+
+        phase_start = self.end_phase(PHASE_LOAD, phase_start)
+
+        try:
+            baseline = DifferenceExporter.load_baseline(info, self.stop_event)
+
+            writer.open()
+            try:
+                if info.backend == BACKEND_THREAD:
+                    self.thread_pool_export(info, manifest, writer, baseline)
+                elif info.backend == BACKEND_ASYNC:
+                    self.async_pool_export(info, manifest, writer, baseline)
+                else:
+                    self.process_pool_export(info, manifest, writer, baseline)
+            except BaseException:
+                writer.close(commit=False)
+                raise
+            writer.close()
+        except Exception as e:
+            self.error = e
+        finally:
+            phase_start = self.end_phase(PHASE_EXPORT, phase_start)
+
+            # 途中でエラーが発生しても処理済みのファイルの走査結果は有効
+            try:
+                if manifest is not None:
+                    edited_entries = manifest.edited_entries()
+
+                    exported:set[str] = set()
+                    for key, mask in edited_entries.items():
+                        exported.update(info.output_keys(key, mask))
+
+                    # 全てのファイルを走査できた場合のみ不要になったファイルを削除
+                    if info.mirror and self.error is None:
+                        exported |= self.remove_stale_files(info, manifest.exported - exported)
+                    else:
+                        exported |= manifest.exported
+
+                    # 中断やエラーで途中までの走査結果は次回の再開に使うチェックポイント
+                    manifest.save(exported, interrupted=self.error is not None)
+
+                    if info.tag_report_path is not None:
+                        DifferenceExporter.write_tag_report(info, edited_entries)
+                if digest_cache is not None:
+                    digest_cache.save()
+                if self.tuner is not None:
+                    self.tuner.save_settings()
+            except OSError as e:
+                if self.error is None:
+                    self.error = e
+
+            self.end_phase(PHASE_SAVE, phase_start)
+
+            if self.profiler is not None:
+                try:
+                    if info.trace_path is not None:
+                        self.profiler.write_chrome_trace(info.trace_path)
+                    if info.histogram_path is not None:
+                        self.profiler.write_histograms(info.histogram_path)
+                except OSError as e:
+                    if self.error is None:
+                        self.error = e
+
+            self.stats.finish()
+
+            if callback_exported is not None:
+                callback_exported()
+
+    def end_phase(self, name:str, start:int) -> int:
+        """段階の経過時間を記録
+
+        Args:
+            name (str): 段階 (PHASE_LOAD, PHASE_WALK, PHASE_EXPORT, PHASE_SAVE)
+            start (int): ExportProfiler.now()で取得した段階の開始時刻
+
+        Returns:
+            int: 次の段階の開始時刻
+        """
+        self.stats.record_phase(name, (ExportProfiler.now() - start) / 1e9)
+        if self.profiler is not None:
+            self.profiler.record(name, start)
+        return ExportProfiler.now()
+
+    @staticmethod
+    def load_baseline(info:DiffExportInfo, stop_event:th.Event) -> Optional[BaselineIndex]:
+        """改変前の索引を読み込み
+
+        索引が無い場合は改変前のディレクトリから構築して保存します。
+
+        Args:
+            info (DiffExportInfo): 差分出力情報
+            stop_event (th.Event): 構築の中断の通知
+
+        Raises:
+            ValueError: 索引が無く構築もできない
+
+        Returns:
+            Optional[BaselineIndex]: 改変前の索引. 比較しない場合はNone
+        """
+        if info.baseline_path is None:
+            return None
+
+        baseline = BaselineIndex(info.baseline_path)
+        if baseline.load():
+            return baseline
+
+        if info.baseline_dir is None:
+            raise ValueError(f"failed to load baseline: {info.baseline_path}")
+
+        baseline.build(str(info.baseline_dir), info.path_filter, info.num_workers, stop_event)
+
+        # 中断した場合は不完全な索引を保存しない
+        if stop_event.is_set():
+            raise ExportCancelled("export cancelled")
+        baseline.save()
+        return baseline
+
+    def thread_pool_export(self, info:DiffExportInfo, manifest:Optional[ScanManifest], writer:OutputWriter, baseline:Optional[BaselineIndex] = None) -> None:
+        """スレッドで走査とコピー
+
+        書き込みの遅延で走査が止まらないように、走査とコピーを別のスレッドで行います。
+        走査結果は上限付きのキューでコピー用スレッドに渡します。
+
+        Args:
+            info (DiffExportInfo): 差分出力情報
+            manifest (Optional[ScanManifest]): 走査結果のマニフェスト
+            writer (OutputWriter): 出力先へのコピー
+            baseline (Optional[BaselineIndex], optional): 改変前の索引. Defaults to None.
+        """
         input_queue = queue.Queue()
+        copy_queue = queue.Queue(maxsize=info.copy_queue_size)
+        errors:list[BaseException] = []
+        stop_event = self.stop_event
+
+        # 自動調整する場合は上限の数だけワーカーを起動して稼働数を増減
+        tuner = self.tuner
+        scan_gate = None if tuner is None else tuner.scan_gate
+        copy_gate = None if tuner is None else tuner.copy_gate
+
+        copy_threads = DifferenceExporter.start_copy_workers(info, copy_queue, writer, errors, stop_event, copy_gate)
+
+        tuner_thread:Optional[th.Thread] = None
+        if tuner is not None:
+            tuner_thread = th.Thread(target=tuner.run, args=(input_queue, copy_queue, info.copy_queue_size), daemon=True)
+            tuner_thread.start()
+
+        try:
+            threads:list[th.Thread] = []
+            for index in range(info.num_workers if scan_gate is None else scan_gate.max_workers):
+                thread = th.Thread(
+                    target=DifferenceExporter.file_copy_worker,
+                    args=(
+                        input_queue,
+                        info,
+                        manifest,
+                        copy_queue,
+                        writer.stats,
+                        writer.budget,
+                        writer.profiler,
+                        baseline,
+                        errors,
+                        stop_event,
+                        scan_gate,
+                        index,
+                    ),
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
 
+            try:
+                walk_start = chunk_start = ExportProfiler.now()
+                for chunk in info.create_walker(stop_event).walk_chunks(info.chunk_size):
+                    if self.profiler is not None:
+                        self.profiler.record("walk_chunk", chunk_start)
+
+                    # 中断, またはワーカーでエラーが発生したら走査を打ち切り
+                    if stop_event.is_set():
+                        break
+                    self.stats.add(discovered=len(chunk))
+                    input_queue.put(chunk)
+                    chunk_start = ExportProfiler.now()
+                self.end_phase(PHASE_WALK, walk_start)
+                self.stats.finish_walk()
+            finally:
+                DifferenceExporter.stop_workers(input_queue, threads, scan_gate)
+        finally:
+            # 走査が全て終わってからコピー用スレッドを終了
+            DifferenceExporter.stop_workers(copy_queue, copy_threads, copy_gate)
+
+            if tuner_thread is not None:
+                tuner.stop()
+                tuner_thread.join()
+
+        DifferenceExporter.raise_stopped(errors, stop_event)
+
+    def async_pool_export(self, info:DiffExportInfo, manifest:Optional[ScanManifest], writer:OutputWriter, baseline:Optional[BaselineIndex] = None) -> None:
+        """asyncioで走査とコピー
+
+        ファイル1つの走査とコピーを1つのタスクにして、専用のスレッドプールで最大io_concurrency個のファイル操作を並行させます。
+        open, statの1回ごとに待ち時間の長いネットワーク共有でも、少数のスレッドで回線が空くことがありません。
+
+        Args:
+            info (DiffExportInfo): 差分出力情報
+            manifest (Optional[ScanManifest]): 走査結果のマニフェスト
+            writer (OutputWriter): 出力先へのコピー
+            baseline (Optional[BaselineIndex], optional): 改変前の索引. Defaults to None.
+        """
+        errors:list[BaseException] = []
+
+        # FileScannerはスレッドごとに生成 (TagMatcherが直前のファイルの状態を持つため)
+        scanners = th.local()
+
+        def scan_entry(entry:os.DirEntry) -> Optional[tuple[Path, int, Optional[bytes]]]:
+            if (scanner:=getattr(scanners, "scanner", None)) is None:
+                scanner = scanners.scanner = FileScanner(info, manifest, writer.stats, writer.budget, writer.profiler, baseline)
+            return scanner.scan_entry(entry)
+
+        # ディレクトリの走査はファイル操作で埋まらない別のスレッドで行う
+        with ThreadPoolExecutor(max_workers=info.io_concurrency, thread_name_prefix="io") as io_executor, \
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="walk") as walk_executor:
+            asyncio.run(self.async_export_files(info, writer, scan_entry, io_executor, walk_executor, errors))
+
+        DifferenceExporter.raise_stopped(errors, self.stop_event)
+
+    async def async_export_files(
+        self,
+        info:DiffExportInfo,
+        writer:OutputWriter,
+        scan_entry:Callable[[os.DirEntry], Optional[tuple[Path, int, Optional[bytes]]]],
+        io_executor:ThreadPoolExecutor,
+        walk_executor:ThreadPoolExecutor,
+        errors:list[BaseException],
+    ) -> None:
+        """ディレクトリを走査してファイルごとのタスクを起動 (async_pool_export)
+
+        実行中のタスクが上限に達したら空くまで次のファイルを起動しません。
+        """
+        loop = asyncio.get_running_loop()
+        stop_event = self.stop_event
+        semaphore = asyncio.Semaphore(info.io_concurrency)
+        tasks:set[asyncio.Task] = set()
+
+        def done(task:asyncio.Task) -> None:
+            tasks.discard(task)
+            semaphore.release()
+
+        chunks = info.create_walker(stop_event).walk_chunks(info.chunk_size)
+        walk_start = chunk_start = ExportProfiler.now()
+        while (chunk:=await loop.run_in_executor(walk_executor, next, chunks, None)) is not None:
+            if self.profiler is not None:
+                self.profiler.record("walk_chunk", chunk_start)
+
+            # 中断, またはエラーが発生したら走査を打ち切り
+            if stop_event.is_set():
+                break
+            self.stats.add(discovered=len(chunk))
+
+            for entry in chunk:
+                await semaphore.acquire()
+                if stop_event.is_set():
+                    semaphore.release()
+                    break
+                task = asyncio.create_task(DifferenceExporter.async_export_file(loop, entry, writer, scan_entry, io_executor, errors, stop_event))
+                tasks.add(task)
+                task.add_done_callback(done)
+            chunk_start = ExportProfiler.now()
+        self.end_phase(PHASE_WALK, walk_start)
+        self.stats.finish_walk()
+
+        # 中断しても実行中のファイル操作は止められないので終了を待つ
+        if len(tasks) > 0:
+            await asyncio.wait(set(tasks))
+
+    @staticmethod
+    async def async_export_file(
+        loop:asyncio.AbstractEventLoop,
+        entry:os.DirEntry,
+        writer:OutputWriter,
+        scan_entry:Callable[[os.DirEntry], Optional[tuple[Path, int, Optional[bytes]]]],
+        io_executor:ThreadPoolExecutor,
+        errors:list[BaseException],
+        stop_event:th.Event,
+    ) -> None:
+        try:
+            if (matched:=await loop.run_in_executor(io_executor, scan_entry, entry)) is None:
+                return
+
+            # 中断後は走査で保持した内容を解放してコピーしない
+            if stop_event.is_set():
+                if matched[2] is not None and writer.budget is not None:
+                    writer.budget.release(len(matched[2]))
+                return
+
+            await loop.run_in_executor(io_executor, writer.write, *matched)
+        except Exception as e:
+            errors.append(e)
+            stop_event.set()
+
+    @staticmethod
+    def raise_stopped(errors:list[BaseException], stop_event:th.Event) -> None:
+        """ワーカーのエラー, または中断を送出
+
+        Args:
+            errors (list[BaseException]): ワーカーで発生したエラー
+            stop_event (th.Event): 中断, またはエラー発生の通知
+
+        Raises:
+            BaseException: ワーカーで発生したエラー
+            ExportCancelled: 中断した
+        """
+        if len(errors) > 0:
+            raise errors[0]
+        if stop_event.is_set():
+            raise ExportCancelled("export cancelled")
+
+    @staticmethod
+    def start_copy_workers(
+        info:DiffExportInfo,
+        copy_queue:queue.Queue,
+        writer:OutputWriter,
+        errors:list[BaseException],
+        stop_event:th.Event,
+        gate:Optional[WorkerGate] = None,
+    ) -> list[th.Thread]:
+        """コピー用スレッドを起動
+
+        Args:
+            info (DiffExportInfo): 差分出力情報
+            copy_queue (queue.Queue): コピーするファイルパスと検索結果のマスクのキュー
+            writer (OutputWriter): 出力先へのコピー
+            errors (list[BaseException]): ワーカーで発生したエラー
+            stop_event (th.Event): 中断, またはエラー発生の通知
+            gate (Optional[WorkerGate], optional): 稼働するワーカー数の上限. 指定した場合は上限の数だけ起動します. Defaults to None.
+
+        Returns:
+            list[th.Thread]: コピー用スレッド
+        """
         threads:list[th.Thread] = []
-        for _ in range(info.num_workers):
+        for index in range(info.copy_workers if gate is None else gate.max_workers):
             thread = th.Thread(
-                target=DifferenceExporter.file_copy_worker,
+                target=DifferenceExporter.copy_worker,
                 args=(
-                    input_queue,
-                    info.input_dir,
-                    info.output_dir,
-                    info.tag,
+                    copy_queue,
+                    writer,
+                    errors,
+                    stop_event,
+                    gate,
+                    index,
                 ),
                 daemon=True,
             )
             thread.start()
             threads.append(thread)
+        return threads
 
-        # 再帰的
-        for path in info.input_dir.glob("**/*"):
-            input_queue.put(path)
+    @staticmethod
+    def stop_workers(worker_queue:queue.Queue, threads:list[th.Thread], gate:Optional[WorkerGate] = None) -> None:
+        """ワーカー1つにつき1つの終了通知を投入して全てのワーカーの終了を待機
 
-        while True:
-            time.sleep(self.WAIT_TIME)
-            if input_queue.qsize() == 0:  # whileの判定にqsize()を直に使うと偶に怪しい挙動を見せるため
-                break
+        稼働数の上限がある場合は待機中のワーカーを終了し、1つの終了通知をワーカー間で引き継ぎます。
+
+        Args:
+            worker_queue (queue.Queue): ワーカーのキュー
+            threads (list[th.Thread]): ワーカー
+            gate (Optional[WorkerGate], optional): 稼働するワーカー数の上限. Defaults to None.
+        """
+        if gate is not None:
+            gate.close()
+            worker_queue.put(None)
+        else:
+            for _ in threads:
+                worker_queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def process_pool_export(self, info:DiffExportInfo, manifest:Optional[ScanManifest], writer:OutputWriter, baseline:Optional[BaselineIndex] = None) -> None:
+        """プロセスで走査
+
+        GILの影響を受けないようにパスをまとめてプロセスに渡して走査します。
+        BACKEND_HYBRID, またはアーカイブへ出力する場合はコピーのみスレッドで行います。
+
+        Args:
+            info (DiffExportInfo): 差分出力情報
+            manifest (Optional[ScanManifest]): 走査結果のマニフェスト
+            writer (OutputWriter): 出力先へのコピー (プロセスでコピーしない場合のみ)
+            baseline (Optional[BaselineIndex], optional): 改変前の索引. Defaults to None.
+        """
+        copy_in_process = info.backend == BACKEND_PROCESS and info.archive_path is None
+
+        copy_queue = queue.Queue(maxsize=info.copy_queue_size)
+        errors:list[BaseException] = []
+        stop_event = self.stop_event
+
+        copy_threads:list[th.Thread] = []
+        if not copy_in_process:
+            copy_threads = DifferenceExporter.start_copy_workers(info, copy_queue, writer, errors, stop_event)
+
+        def collect(futures:set[Future]) -> None:
+            for future in futures:
+                result:ScanBatchResult = future.result()
+                if manifest is not None:
+                    manifest.merge(result.entries, result.pending)
+                if writer.digest_cache is not None:
+                    writer.digest_cache.merge(result.digests)
+                writer.stats.merge(result.stats)
+                if self.profiler is not None:
+                    self.profiler.merge(result.spans, result.thread_names)
+                for path, mask in result.matched_paths:
+                    copy_queue.put((Path(path), mask))
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=info.num_workers,
+                initializer=init_scan_process,
+                initargs=(
+                    info,
+                    None if manifest is None else manifest.previous,
+                    None if writer.digest_cache is None else writer.digest_cache.entries,
+                    None if baseline is None else baseline.entries,
+                ),
+            ) as executor:
+                futures:set[Future] = set()
+
+                def submit(batch:list[str]) -> None:
+                    nonlocal futures
+                    futures.add(executor.submit(scan_batch, batch, copy_in_process))
+
+                    # 走査結果を溜め込まないように処理中のまとまりの数を制限
+                    if len(futures) >= info.num_workers * 2:
+                        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                        collect(done)
 
-        # 雑に殺すためにNoneを大量投下
-        for _ in range(len(threads) * 10):
-            input_queue.put(None)
+                try:
+                    walk_start = chunk_start = ExportProfiler.now()
+                    for chunk in info.create_walker(stop_event).walk_chunks(info.chunk_size):
+                        if self.profiler is not None:
+                            self.profiler.record("walk_chunk", chunk_start)
 
-        if callback_exported is not None:
-            callback_exported()
+                        # 中断, またはコピーでエラーが発生したら走査を打ち切り
+                        if stop_event.is_set():
+                            break
+                        self.stats.add(discovered=len(chunk))
+                        submit([entry.path for entry in chunk])
+                        chunk_start = ExportProfiler.now()
+                    self.end_phase(PHASE_WALK, walk_start)
+                    self.stats.finish_walk()
+
+                    # 中断した場合は処理中のまとまりを待たない
+                    if stop_event.is_set():
+                        DifferenceExporter.raise_stopped(errors, stop_event)
+
+                    collect(wait(futures).done)
+                except BaseException:
+                    # 未着手のまとまりは破棄してプロセスの終了を早める
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            # コピー用スレッドを終了
+            DifferenceExporter.stop_workers(copy_queue, copy_threads)
+
+        DifferenceExporter.raise_stopped(errors, stop_event)
+
+    def remove_stale_files(self, info:DiffExportInfo, stale_keys:set[str]) -> set[str]:
+        """出力先から不要になったファイルを削除
+
+        前回までに出力して今回は出力しなかったファイルを削除し、空になったディレクトリも削除します。
+        ディレクトリは出力ディレクトリ内の入力ディレクトリ名の階層(<出力ディレクトリ>/<入力ディレクトリ名>)より下のみ削除します。
+
+        Args:
+            info (DiffExportInfo): 差分出力情報
+            stale_keys (set[str]): 不要になったファイル (出力ディレクトリからの相対パス)
+
+        Returns:
+            set[str]: 削除できなかったファイル
+        """
+        failed_keys:set[str] = set()
+        directories:set[Path] = set()
+
+        # 出力ディレクトリごとの削除してよい階層の上端 (入れ子の場合は深い方を優先)
+        output_roots = {info.output_dir.absolute(), *info.tag_output_dirs.values()}
+        base_dirs = sorted((root / info.input_dir.name for root in output_roots), key=lambda d: len(d.parts), reverse=True)
+
+        for key in stale_keys:
+            path = (info.output_dir / key).absolute()
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                failed_keys.add(key)
+                continue
+
+            self.stats.add(removed=1)
+
+            # 今回の出力ディレクトリに無いファイルはディレクトリを残す
+            if (base_dir:=next((d for d in base_dirs if d in path.parents), None)) is not None:
+                directories.update(d for d in path.parents if base_dir in d.parents)
+
+        # 深い階層から順に空のディレクトリを削除
+        for directory in sorted(directories, key=lambda d: len(d.parts), reverse=True):
+            try:
+                directory.rmdir()
+            except OSError:
+                pass
+
+        return failed_keys
+
+    @staticmethod
+    def write_tag_report(info:DiffExportInfo, edited_entries:dict[str, int]) -> None:
+        """ファイルごとに一致した検索内容をJSONで出力
+
+        Args:
+            info (DiffExportInfo): 差分出力情報
+            edited_entries (dict[str, int]): 入力ディレクトリからの相対パスと検索結果のマスク
+        """
+        labels = info.mask_labels
+        report = {
+            "tags": list(labels),
+            "files": {
+                key: [label for i, label in enumerate(labels) if mask & (1 << i)]
+                for key, mask in sorted(edited_entries.items())
+            },
+        }
+
+        with open(str(info.tag_report_path), mode="w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
 
     @staticmethod
     def is_valid_directory(directory:str) -> bool:
@@ -153,35 +894,131 @@ class DifferenceExporter:
         return directory.is_dir()
 
     @staticmethod
-    def is_edited_file(path:Path, tag:str, encoding:Optional[str] = None) -> bool:
-        try:
-            with open(str(path), mode="r", encoding=encoding) as f:
-                if f.read().find(tag) != -1:
-                    return True
-        except UnicodeDecodeError as e:
-            if encoding is None:
-                return DifferenceExporter.is_edited_file(path, tag, "utf-8")
-        except Exception as e:
-            pass
-        return False
+    def is_edited_file(path:Path, tag:str) -> bool:
+        """編集したファイルか判定
+
+        Args:
+            path (Path): ファイルパス
+            tag (str): 検索内容
+
+        Returns:
+            bool: 検索内容を含む場合はTrueを返します。
+        """
+        return TagMatcher(tag).is_match(path)
+
+    @staticmethod
+    def queue_get(worker_queue:queue.Queue, profiler:Optional[ExportProfiler], name:str) -> Any:
+        """キューから取り出し、待ち時間を計測
+
+        Args:
+            worker_queue (queue.Queue): キュー
+            profiler (Optional[ExportProfiler]): 処理ごとの計測
+            name (str): 区間の名前
+
+        Returns:
+            Any: 取り出した要素
+        """
+        if profiler is None:
+            return worker_queue.get()
+
+        start = profiler.now()
+        item = worker_queue.get()
+        profiler.record(name, start)
+        return item
+
+    @staticmethod
+    def queue_put(worker_queue:queue.Queue, item:Any, profiler:Optional[ExportProfiler], name:str) -> None:
+        """キューに投入し、上限による待ち時間を計測
+
+        Args:
+            worker_queue (queue.Queue): キュー
+            item (Any): 投入する要素
+            profiler (Optional[ExportProfiler]): 処理ごとの計測
+            name (str): 区間の名前
+        """
+        if profiler is None:
+            worker_queue.put(item)
+            return
+
+        start = profiler.now()
+        worker_queue.put(item)
+        profiler.record(name, start)
+
+    @staticmethod
+    def pass_stop(worker_queue:queue.Queue, gate:Optional[WorkerGate]) -> None:
+        """稼働数の上限がある場合は受け取った終了通知を次のワーカーに引き継ぐ
+
+        稼働数を減らす前から終了通知を待っていたワーカーもいるため、稼働数から終了通知の数は決められません。
+
+        Args:
+            worker_queue (queue.Queue): ワーカーのキュー
+            gate (Optional[WorkerGate]): 稼働するワーカー数の上限
+        """
+        if gate is not None:
+            worker_queue.put(None)
 
     @staticmethod
-    def file_copy_worker(input_queue:queue.Queue, input_dir:Path,output_dir:Path, tag:str) -> None:
-        pattern = re.compile("\.(h|cpp|ush|usf|ini|md|hlsl|glsl|cs|inl)$")
+    def file_copy_worker(
+        input_queue:queue.Queue,
+        info:DiffExportInfo,
+        manifest:Optional[ScanManifest],
+        copy_queue:queue.Queue,
+        stats:ExportStats,
+        budget:Optional[MemoryBudget],
+        profiler:Optional[ExportProfiler],
+        baseline:Optional[BaselineIndex],
+        errors:list[BaseException],
+        stop_event:th.Event,
+        gate:Optional[WorkerGate] = None,
+        index:int = 0,
+    ) -> None:
+        scanner = FileScanner(info, manifest, stats, budget, profiler, baseline)
 
-        input_dir:Path = Path(input_dir)
-        input_dir_parts = input_dir.parts
-        input_dir_parts_length = len(input_dir_parts)
+        # 稼働数を減らした場合は処理中のまとまりを終えてから待機
+        while gate is None or gate.wait(index):
+            if (chunk:=DifferenceExporter.queue_get(input_queue, profiler, "queue_wait")) is None:
+                DifferenceExporter.pass_stop(input_queue, gate)
+                break
 
-        while True:
-            if isinstance((path:=input_queue.get()), Path):
-                # 対象の拡張子 && ファイル名に1つの拡張子(.gen.xxxを省きたい) && 編集したファイル
-                if pattern.search(str(path)) and len(path.suffixes) == 1 and DifferenceExporter.is_edited_file(path, tag):
-                    input_path = path
-                    output_path = output_dir / os.path.join(*path.parts[input_dir_parts_length-1:-1])
+            # エラー発生後は終了通知まで読み捨て, 走査で保持した内容は解放
+            if stop_event.is_set():
+                if len(matched) > 2 and matched[2] is not None and writer.budget is not None:
+                    writer.budget.release(len(matched[2]))
+                continue
 
-                    output_path.mkdir(parents=True, exist_ok=True)
+            try:
+                for entry in chunk:
+                    # 中断はファイル単位で確認
+                    if stop_event.is_set():
+                        break
+                    if (matched:=scanner.scan_entry(entry)) is not None:
+                        DifferenceExporter.queue_put(copy_queue, matched, profiler, "copy_queue_put")
+            except Exception as e:
+                errors.append(e)
+                stop_event.set()
 
-                    shutil.copy(str(input_path), str(output_path))
-            else:
+    @staticmethod
+    def copy_worker(
+        copy_queue:queue.Queue,
+        writer:OutputWriter,
+        errors:list[BaseException],
+        stop_event:th.Event,
+        gate:Optional[WorkerGate] = None,
+        index:int = 0,
+    ) -> None:
+        while gate is None or gate.wait(index):
+            if (matched:=DifferenceExporter.queue_get(copy_queue, writer.profiler, "copy_queue_wait")) is None:
+                DifferenceExporter.pass_stop(copy_queue, gate)
                 break
+
+            # エラー発生後は終了通知まで読み捨て, 走査で保持した内容は解放
+            if stop_event.is_set():
+                if len(matched) > 2 and matched[2] is not None and writer.budget is not None:
+                    writer.budget.release(len(matched[2]))
+                continue
+
+            try:
+                writer.write(*matched)
+            except Exception as e:
+                errors.append(e)
+                stop_event.set()
@@ -0,0 +1,105 @@
+import os
+import json
+import threading as th
+from pathlib import Path
+from typing import Optional
+
+
+__all__ = [
+    "DigestCache",
+]
+
+
+class DigestCache:
+    """出力先のファイルのハッシュ値のキャッシュ
+
+    出力先のファイルのサイズと更新日時(ns)が一致する間はハッシュ値を再計算しません。
+    """
+    VERSION = 1
+    FILENAME = ".difference_exporter_digests.json"
+
+    def __init__(self, path:Path) -> None:
+        """コンストラクタ
+
+        Args:
+            path (Path): キャッシュのパス
+        """
+        self.path = Path(path)
+        self.entries:dict[str, list] = {}
+
+        # 今回記録したハッシュ値 (別プロセスから親プロセスへの反映用)
+        self.updated:dict[str, list] = {}
+        self.lock = th.Lock()
+
+    def load(self) -> bool:
+        """キャッシュを読み込み
+
+        Returns:
+            bool: 読み込めた場合はTrueを返します。
+        """
+        try:
+            with open(str(self.path), mode="r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            return False
+        if not isinstance((entries:=data.get("entries")), dict):
+            return False
+
+        self.entries = entries
+        return True
+
+    def save(self) -> None:
+        """キャッシュを保存
+        """
+        with self.lock:
+            data = {
+                "version": self.VERSION,
+                "entries": self.entries,
+            }
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(str(tmp_path), mode="w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(str(tmp_path), str(self.path))
+
+    def lookup(self, key:str, stat:os.stat_result) -> Optional[str]:
+        """ハッシュ値を取得
+
+        Args:
+            key (str): コピー先のパス (DiffExportInfo.output_key)
+            stat (os.stat_result): 出力先のファイルのstat
+
+        Returns:
+            Optional[str]: statが一致する場合はハッシュ値, それ以外はNoneを返します。
+        """
+        if (entry:=self.entries.get(key)) is None:
+            return None
+        if entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+            return None
+        return entry[2]
+
+    def update(self, key:str, stat:os.stat_result, digest:str) -> None:
+        """ハッシュ値を記録
+
+        Args:
+            key (str): コピー先のパス (DiffExportInfo.output_key)
+            stat (os.stat_result): 出力先のファイルのstat
+            digest (str): ハッシュ値
+        """
+        entry = [stat.st_size, stat.st_mtime_ns, digest]
+        with self.lock:
+            self.entries[key] = entry
+            self.updated[key] = entry
+
+    def merge(self, entries:dict[str, list]) -> None:
+        """別のワーカーで記録したハッシュ値を反映
+
+        Args:
+            entries (dict[str, list]): ハッシュ値
+        """
+        with self.lock:
+            self.entries.update(entries)
@@ -0,0 +1,152 @@
+import os
+import queue
+import threading as th
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+
+from runtime.path_filter import *
+
+
+__all__ = [
+    "DirectoryWalker",
+]
+
+
+class DirectoryWalker:
+    """os.scandirによるディレクトリの走査
+
+    PathFilterの条件に合うファイルのみを列挙します。
+    DirEntryはstatをキャッシュするため、後続の処理で再利用できます。
+    """
+    def __init__(
+        self,
+        root:str,
+        path_filter:Optional[PathFilter] = None,
+        num_threads:int = 1,
+        stop_event:Optional[th.Event] = None,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            root (str): 走査するディレクトリ
+            path_filter (Optional[PathFilter], optional): 走査対象のファイルの条件. Noneの場合は既定の条件. Defaults to None.
+            num_threads (int, optional): 直下のディレクトリ単位で並列に走査するスレッド数. Defaults to 1.
+            stop_event (Optional[th.Event], optional): 走査の中断の通知 (ディレクトリ単位で確認します). Defaults to None.
+        """
+        self.root = str(root)
+        self.path_filter = PathFilter() if path_filter is None else path_filter
+        self.num_threads = max(1, num_threads)
+        self.stop_event = stop_event
+
+        # DirEntry.pathから相対パスを切り出す位置
+        self.root_length = len(os.path.join(self.root, ""))
+
+    def scan_dir(self, directory:str, node:Optional[dict]) -> Iterator[tuple[Optional[os.DirEntry], Optional[str], Optional[dict]]]:
+        """ディレクトリ直下を走査
+
+        Args:
+            directory (str): 走査するディレクトリ
+            node (Optional[dict]): ディレクトリのプレフィックス木の節
+
+        Yields:
+            Iterator[tuple[Optional[os.DirEntry], Optional[str], Optional[dict]]]: 走査対象のファイル, またはサブディレクトリのパスと節
+        """
+        path_filter = self.path_filter
+        root_length = self.root_length
+
+        try:
+            it = os.scandir(directory)
+        except OSError:
+            return
+
+        with it:
+            for entry in it:
+                try:
+                    # シンボリックリンクのディレクトリは辿らない
+                    if entry.is_dir(follow_symlinks=False):
+                        is_accepted, child = path_filter.enter_dir(entry, node, root_length)
+                        if is_accepted:
+                            yield None, entry.path, child
+                    elif path_filter.is_candidate(entry.name) and path_filter.accepts_file(entry, root_length) and entry.is_file():
+                        yield entry, None, None
+                except OSError:
+                    pass
+
+    def walk_dir(self, directory:str, node:Optional[dict]) -> Iterator[os.DirEntry]:
+        """ディレクトリを再帰的に走査
+
+        Args:
+            directory (str): 走査するディレクトリ
+            node (Optional[dict]): ディレクトリのプレフィックス木の節
+
+        Yields:
+            Iterator[os.DirEntry]: 走査対象のファイル
+        """
+        stop_event = self.stop_event
+        stack = [(directory, node)]
+        while len(stack) > 0 and (stop_event is None or not stop_event.is_set()):
+            for entry, sub_directory, child in self.scan_dir(*stack.pop()):
+                if entry is None:
+                    stack.append((sub_directory, child))
+                else:
+                    yield entry
+
+    def walk(self) -> Iterator[os.DirEntry]:
+        """走査対象のファイルを列挙
+
+        Yields:
+            Iterator[os.DirEntry]: 走査対象のファイル
+        """
+        if self.num_threads == 1:
+            yield from self.walk_dir(self.root, self.path_filter.root_node)
+            return
+
+        # 直下のファイルはその場で列挙し、ディレクトリはスレッドに振り分け
+        top_dirs:list[tuple[str, Optional[dict]]] = []
+        for entry, sub_directory, child in self.scan_dir(self.root, self.path_filter.root_node):
+            if entry is None:
+                top_dirs.append((sub_directory, child))
+            else:
+                yield entry
+
+        # 呼び出し元が途中で列挙を止めてもスレッドが詰まらないように上限無し
+        entry_queue = queue.Queue()
+
+        def walk_top_dir(directory:str, node:Optional[dict]) -> None:
+            try:
+                for entry in self.walk_dir(directory, node):
+                    entry_queue.put(entry)
+            finally:
+                entry_queue.put(None)
+
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            for directory, node in top_dirs:
+                executor.submit(walk_top_dir, directory, node)
+
+            remaining = len(top_dirs)
+            while remaining > 0:
+                if (entry:=entry_queue.get()) is None:
+                    remaining -= 1
+                else:
+                    yield entry
+
+    def walk_chunks(self, chunk_size:int) -> Iterator[list[os.DirEntry]]:
+        """走査対象のファイルをまとめて列挙
+
+        キューの受け渡しの回数を減らすためにchunk_size個ずつまとめます。
+
+        Args:
+            chunk_size (int): まとめるファイル数
+
+        Yields:
+            Iterator[list[os.DirEntry]]: 走査対象のファイルのまとまり
+        """
+        chunk:list[os.DirEntry] = []
+        for entry in self.walk():
+            chunk.append(entry)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+        if len(chunk) > 0:
+            yield chunk
@@ -0,0 +1,306 @@
+import os
+import queue
+import asyncio
+import threading as th
+from pathlib import Path
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Optional, Sequence, Union
+
+from runtime.baseline_index import *
+from runtime.diff_export_info import *
+from runtime.difference_exporter import *
+from runtime.export_stats import *
+from runtime.file_scanner import *
+from runtime.memory_budget import *
+from runtime.output_writer import *
+
+
+__all__ = [
+    "EditedFile",
+    "EditedFileIterator",
+    "iter_edited_files",
+    "aiter_edited_files",
+]
+
+
+@dataclass(frozen=True)
+class EditedFile:
+    """検索内容を含むファイル (または改変前から変更されたファイル)
+    """
+    # 入力ディレクトリ内のファイルパス
+    path:Path
+    # 入力ディレクトリからの相対パス ('/'区切り)
+    key:str
+    # ファイルサイズ
+    size:int
+    # 検索結果のマスク
+    mask:int
+    # 一致した検索内容 (改変前から変更されたファイルはBASELINE_LABEL)
+    labels:tuple[str, ...]
+    # 一致した検索内容ごとのファイル先頭からのバイト単位の位置
+    offsets:dict[str, tuple[int, ...]]
+
+    def to_dict(self) -> dict[str, Any]:
+        """JSONで出力できる辞書に変換
+
+        Returns:
+            dict[str, Any]: 一致したファイルの情報
+        """
+        return {
+            **asdict(self),
+            "path": str(self.path),
+            "offsets": {label: list(offsets) for label, offsets in self.offsets.items()},
+        }
+
+
+class EditedFileIterator:
+    """検索内容を含むファイルを見つけた順に列挙
+
+    DifferenceExporter.exportと同じようにスレッドで走査し、一致したファイルを見つけ次第返します。
+    全ての走査の完了を待たずに、最初に見つかったファイルからアップロードなどを始められます。
+
+    結果は上限付きのキューで受け渡すので、取り出しが遅い場合は走査も待機します。
+    途中で列挙をやめる場合はclose(またはwith文)で走査スレッドを終了してください。
+    """
+    def __init__(self, info:DiffExportInfo, copy:bool = False) -> None:
+        """コンストラクタ
+
+        Args:
+            info (DiffExportInfo): 差分出力情報
+            copy (bool, optional): 一致したファイルを返す前に出力先(info.output_dir)にコピー. Defaults to False.
+        """
+        self.info = info
+        self.stats = ExportStats()
+
+        # 一致したファイルの内容を保持して一致位置の検索とコピーで読み直さない
+        self.budget = info.create_memory_budget()
+        self.writer = OutputWriter(info, self.stats, budget=self.budget) if copy else None
+
+        # 一致したファイル (走査の終了はNone)
+        self.results = queue.Queue(maxsize=info.copy_queue_size)
+        self.errors:list[BaseException] = []
+        self.stop_event = th.Event()
+        self.finished = False
+
+        self.thread = th.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __iter__(self) -> "EditedFileIterator":
+        return self
+
+    def __next__(self) -> EditedFile:
+        if self.finished:
+            raise StopIteration
+
+        if (edited_file:=self.results.get()) is not None:
+            return edited_file
+
+        self.finished = True
+        self.thread.join()
+        if len(self.errors) > 0:
+            raise self.errors[0]
+        raise StopIteration
+
+    def __enter__(self) -> "EditedFileIterator":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def cancel(self) -> None:
+        """走査を中断 (どのスレッドからでも呼び出せます)
+
+        取り出し済みの結果の後で列挙が終了します。
+        """
+        self.stop_event.set()
+
+    def close(self) -> None:
+        """走査を中断して全てのスレッドの終了を待機
+        """
+        self.stop_event.set()
+
+        # 結果のキューで待機しているワーカーを解放
+        while self.thread.is_alive():
+            try:
+                self.results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.finished = True
+
+        # 別のスレッドで取り出しを待機している場合は終了を通知
+        try:
+            self.results.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def snapshot(self) -> ExportSnapshot:
+        """走査の集計を取得
+
+        Returns:
+            ExportSnapshot: 集計
+        """
+        return self.stats.snapshot()
+
+    def run(self) -> None:
+        """走査スレッド
+
+        改変前の索引を読み込んでからワーカーを起動し、ディレクトリを走査してワーカーに渡します。
+        """
+        input_queue = queue.Queue()
+        try:
+            baseline = DifferenceExporter.load_baseline(self.info, self.stop_event)
+
+            threads:list[th.Thread] = []
+            for _ in range(self.info.num_workers):
+                thread = th.Thread(target=self.scan_worker, args=(input_queue, baseline), daemon=True)
+                thread.start()
+                threads.append(thread)
+
+            try:
+                for chunk in self.info.create_walker(self.stop_event).walk_chunks(self.info.chunk_size):
+                    if self.stop_event.is_set():
+                        break
+                    self.stats.add(discovered=len(chunk))
+                    input_queue.put(chunk)
+                self.stats.finish_walk()
+            finally:
+                DifferenceExporter.stop_workers(input_queue, threads)
+        except ExportCancelled:
+            pass
+        except Exception as e:
+            self.errors.append(e)
+            self.stop_event.set()
+        finally:
+            self.stats.finish()
+            self.results.put(None)
+
+    def scan_worker(self, input_queue:queue.Queue, baseline:Optional[BaselineIndex]) -> None:
+        scanner = FileScanner(self.info, stats=self.stats, budget=self.budget, baseline=baseline)
+
+        while (chunk:=input_queue.get()) is not None:
+            # エラー発生後は終了通知まで読み捨て
+            if self.stop_event.is_set():
+                continue
+
+            try:
+                for entry in chunk:
+                    if self.stop_event.is_set():
+                        break
+                    if (matched:=scanner.scan_entry(entry)) is not None:
+                        self.results.put(self.create_edited_file(scanner, *matched))
+            except Exception as e:
+                self.errors.append(e)
+                self.stop_event.set()
+
+    def create_edited_file(self, scanner:FileScanner, path:Path, mask:int, data:Optional[bytes]) -> EditedFile:
+        """一致したファイルの一致位置を検索 (コピーする場合はコピーも行う)
+
+        Args:
+            scanner (FileScanner): 一致を判定したワーカーの走査
+            path (Path): ファイルパス
+            mask (int): 検索結果のマスク
+            data (Optional[bytes]): 走査で保持したファイルの内容
+
+        Returns:
+            EditedFile: 一致したファイル
+        """
+        matcher = scanner.matcher
+        size = len(data) if data is not None else matcher.size or 0
+
+        # 改変前との比較のみで一致したファイルは検索内容を含まない
+        offsets:dict[str, list[int]] = {}
+        try:
+            if mask & matcher.all_mask:
+                offsets = matcher.find_offsets(path) if data is None else matcher.find_offsets_in(data)
+        finally:
+            if self.writer is None and data is not None and self.budget is not None:
+                self.budget.release(len(data))
+
+        if self.writer is not None:
+            self.writer.write(path, mask, data)
+
+        return EditedFile(
+            path=path,
+            key=self.info.relative_key(path),
+            size=size,
+            mask=mask,
+            labels=tuple(label for i, label in enumerate(self.info.mask_labels) if mask & (1 << i)),
+            offsets={label: tuple(values) for label, values in offsets.items()},
+        )
+
+
+def iter_edited_files(
+    input_dir:Union[str, Path],
+    tag:Union[str, Sequence[str]],
+    num_workers:Optional[int] = None,
+    output_dir:Optional[Union[str, Path]] = None,
+    **options,
+) -> EditedFileIterator:
+    """検索内容を含むファイルを見つけた順に列挙
+
+    output_dirを省略した場合は走査のみで何もコピーしません。
+
+    Args:
+        input_dir (Union[str, Path]): 入力ディレクトリ
+        tag (Union[str, Sequence[str]]): 検索内容
+        num_workers (Optional[int], optional): ワーカー数. Noneの場合はCPU数. Defaults to None.
+        output_dir (Optional[Union[str, Path]], optional): 一致したファイルを返す前にコピーする出力先. Defaults to None.
+        options: DiffExportInfoの走査の条件 (tag_regexes, extensions, excluded_patterns, git_base, baseline_pathなど). マニフェストやアーカイブに関する指定は無視します.
+
+    Raises:
+        ValueError: 不正なディレクトリ, または走査の条件
+        re.error: 不正な正規表現
+        GitError: gitの作業ツリーでない, またはリビジョンが存在しない
+
+    Returns:
+        EditedFileIterator: 一致したファイルの列挙
+    """
+    if not DifferenceExporter.is_valid_directory(str(input_dir)):
+        raise ValueError(f"invalid input directory: {input_dir}")
+
+    if output_dir is not None:
+        if not DifferenceExporter.is_valid_directory(str(output_dir)):
+            raise ValueError(f"invalid output directory: {output_dir}")
+        if Path(output_dir).absolute() == Path(input_dir).absolute():
+            raise ValueError("output directory is the input directory")
+
+    info = DiffExportInfo(
+        input_dir,
+        input_dir if output_dir is None else output_dir,
+        tag,
+        os.cpu_count() if num_workers is None else num_workers,
+        **options,
+    )
+
+    # 不正な正規表現はここで弾く
+    info.create_matcher()
+
+    if info.git_base is not None:
+        info.create_walker().verify()
+
+    return EditedFileIterator(info, copy=output_dir is not None)
+
+
+async def aiter_edited_files(
+    input_dir:Union[str, Path],
+    tag:Union[str, Sequence[str]],
+    num_workers:Optional[int] = None,
+    output_dir:Optional[Union[str, Path]] = None,
+    **options,
+) -> AsyncIterator[EditedFile]:
+    """検索内容を含むファイルを見つけた順に列挙 (非同期版)
+
+    走査はiter_edited_filesと同じスレッドで行い、結果の待機のみ既定のExecutorに任せます。
+    引数はiter_edited_filesと同じです。
+
+    Yields:
+        AsyncIterator[EditedFile]: 一致したファイル
+    """
+    iterator = iter_edited_files(input_dir, tag, num_workers, output_dir, **options)
+    try:
+        while (edited_file:=await asyncio.to_thread(next, iterator, None)) is not None:
+            yield edited_file
+    finally:
+        # 待機中に取り消された場合もスレッドを残さない
+        iterator.cancel()
+        await asyncio.to_thread(iterator.close)
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import threading as th
+from pathlib import Path
+from typing import Any, Optional
+
+
+__all__ = [
+    "ExportProfiler",
+]
+
+
+class ExportProfiler:
+    """差分出力の処理ごとの計測
+
+    ファイル単位の処理(stat, open, search, mkdir, copyなど)とキューの待ち時間を区間として記録し、
+    Chromeのトレースイベント形式(chrome://tracing, Perfetto)と区間ごとのヒストグラムで出力します。
+
+    記録はリストへの追加のみで、スレッド間のロックは取りません。
+    プロセスで記録した区間はdrain()で取り出して親プロセスでmerge()します。
+    """
+    # ヒストグラムの区切り (マイクロ秒, 2の累乗)
+    HISTOGRAM_BUCKETS = tuple(2 ** i for i in range(0, 27))
+
+    def __init__(self) -> None:
+        """コンストラクタ
+        """
+        self.pid = os.getpid()
+
+        # (名前, プロセスID, スレッドID, 開始(ns), 長さ(ns), ファイルパス)
+        self.spans:list[tuple[str, int, int, int, int, Optional[str]]] = []
+
+        # スレッドIDとスレッド名 (トレースの表示用)
+        self.thread_names:dict[tuple[int, int], str] = {}
+
+    @staticmethod
+    def now() -> int:
+        """区間の開始時刻を取得
+
+        プロセス間で比較できる単調増加の時刻です。
+
+        Returns:
+            int: 時刻(ns)
+        """
+        return time.perf_counter_ns()
+
+    def record(self, name:str, start:int, path:Optional[Any] = None) -> None:
+        """開始時刻から現在までの区間を記録
+
+        Args:
+            name (str): 区間の名前
+            start (int): ExportProfiler.now()で取得した開始時刻
+            path (Optional[Any], optional): 処理したファイルパス. Defaults to None.
+        """
+        end = time.perf_counter_ns()
+        tid = th.get_ident()
+        if (self.pid, tid) not in self.thread_names:
+            self.thread_names[(self.pid, tid)] = th.current_thread().name
+        self.spans.append((name, self.pid, tid, start, end - start, None if path is None else str(path)))
+
+    def drain(self) -> tuple[list[tuple], dict[tuple[int, int], str]]:
+        """記録した区間を取り出して破棄
+
+        Returns:
+            tuple[list[tuple], dict[tuple[int, int], str]]: 区間とスレッド名
+        """
+        spans, self.spans = self.spans, []
+        return spans, dict(self.thread_names)
+
+    def merge(self, spans:list[tuple], thread_names:dict[tuple[int, int], str]) -> None:
+        """別のプロセスで記録した区間を追加
+
+        Args:
+            spans (list[tuple]): 区間
+            thread_names (dict[tuple[int, int], str]): スレッド名
+        """
+        self.spans.extend(spans)
+        self.thread_names.update(thread_names)
+
+    def chrome_trace(self) -> dict[str, Any]:
+        """Chromeのトレースイベント形式に変換
+
+        Returns:
+            dict[str, Any]: トレースイベント
+        """
+        origin = min((span[3] for span in self.spans), default=0)
+
+        events:list[dict[str, Any]] = []
+        for (pid, tid), name in sorted(self.thread_names.items()):
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+
+        for name, pid, tid, start, duration, path in self.spans:
+            event = {
+                "name": name,
+                "cat": "export",
+                "ph": "X",
+                "pid": pid,
+                "tid": tid,
+                "ts": (start - origin) / 1000.0,
+                "dur": duration / 1000.0,
+            }
+            if path is not None:
+                event["args"] = {"path": path}
+            events.append(event)
+
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+        }
+
+    def histograms(self) -> dict[str, dict[str, Any]]:
+        """区間の名前ごとの長さの分布を集計
+
+        Returns:
+            dict[str, dict[str, Any]]: 回数, 合計, 平均, パーセンタイル(マイクロ秒)と2の累乗ごとの回数
+        """
+        durations:dict[str, list[int]] = {}
+        for span in self.spans:
+            durations.setdefault(span[0], []).append(span[4])
+
+        histograms:dict[str, dict[str, Any]] = {}
+        for name, values in sorted(durations.items()):
+            values.sort()
+            buckets:dict[str, int] = {}
+            for value in values:
+                us = value / 1000.0
+                bucket = next((b for b in ExportProfiler.HISTOGRAM_BUCKETS if us <= b), None)
+                key = f"<={bucket}us" if bucket is not None else f">{ExportProfiler.HISTOGRAM_BUCKETS[-1]}us"
+                buckets[key] = buckets.get(key, 0) + 1
+
+            def percentile(p:float) -> float:
+                return values[min(len(values) - 1, int(len(values) * p))] / 1000.0
+
+            histograms[name] = {
+                "count": len(values),
+                "total_us": sum(values) / 1000.0,
+                "mean_us": sum(values) / len(values) / 1000.0,
+                "p50_us": percentile(0.5),
+                "p90_us": percentile(0.9),
+                "p99_us": percentile(0.99),
+                "max_us": values[-1] / 1000.0,
+                "buckets": buckets,
+            }
+        return histograms
+
+    def write_chrome_trace(self, path:Path) -> None:
+        """Chromeのトレースイベント形式でJSONを出力
+
+        Args:
+            path (Path): 出力先のパス
+        """
+        with open(str(path), mode="w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+
+    def write_histograms(self, path:Path) -> None:
+        """区間ごとのヒストグラムをJSONで出力
+
+        Args:
+            path (Path): 出力先のパス
+        """
+        with open(str(path), mode="w", encoding="utf-8") as f:
+            json.dump(self.histograms(), f, ensure_ascii=False, indent=4)
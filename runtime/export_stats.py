@@ -0,0 +1,306 @@
+import time
+import threading as th
+from dataclasses import dataclass, field, asdict
+from typing import Any, Optional
+
+
+__all__ = [
+    "PHASE_LOAD",
+    "PHASE_WALK",
+    "PHASE_EXPORT",
+    "PHASE_SAVE",
+    "ExportSnapshot",
+    "ExportStats",
+]
+
+
+# 前回の走査結果などの読み込み
+PHASE_LOAD = "load"
+# ディレクトリの走査 (走査とコピーと並行します)
+PHASE_WALK = "walk"
+# 走査とコピー (全てのワーカーが終了するまで)
+PHASE_EXPORT = "export"
+# 走査結果の保存と不要になったファイルの削除
+PHASE_SAVE = "save"
+
+
+@dataclass(frozen=True)
+class ExportSnapshot:
+    """差分出力の集計のある時点の値
+    """
+    # 経過時間(秒)
+    elapsed:float
+    # 走査対象として見つけたファイル数
+    discovered:int
+    # 走査したファイル数
+    scanned:int
+    # 検索内容を含んでいたファイル数
+    matched:int
+    # コピーしたファイル数
+    copied:int
+    # 出力先と同一のためコピーを省略したファイル数
+    skipped:int
+    # 出力先から削除したファイル数
+    removed:int
+    # 走査で読み込んだバイト数
+    bytes_read:int
+    # コピーで書き込んだバイト数
+    bytes_written:int
+    # 全てのワーカーで検索に掛かった時間の合計(秒)
+    scan_time:float
+    # 全てのワーカーでコピーに掛かった時間の合計(秒)
+    copy_time:float
+    # ディレクトリの走査が完了したか (完了するまで総数は確定しません)
+    walk_finished:bool
+    # 差分出力が完了したか
+    finished:bool
+    # 段階ごとの経過時間(秒)
+    phases:dict[str, float] = field(default_factory=dict)
+    # 稼働中の走査, コピーのワーカー数 (自動調整しない場合は上限で丸めた指定値)
+    scan_workers:int = 0
+    copy_workers:int = 0
+
+    @property
+    def progress(self) -> float:
+        """進捗率を取得
+
+        Returns:
+            float: 0.0 ~ 1.0
+        """
+        if self.finished:
+            return 1.0
+        if self.discovered == 0:
+            return 0.0
+        return min(1.0, self.scanned / self.discovered)
+
+    @property
+    def files_per_second(self) -> float:
+        """1秒あたりに走査したファイル数を取得
+
+        Returns:
+            float: ファイル数/秒
+        """
+        return self.scanned / self.elapsed if self.elapsed > 0.0 else 0.0
+
+    @property
+    def read_mb_per_second(self) -> float:
+        """1秒あたりに読み込んだMB数を取得
+
+        Returns:
+            float: MB/秒
+        """
+        return self.bytes_read / (1024 * 1024) / self.elapsed if self.elapsed > 0.0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """残り時間を取得
+
+        Returns:
+            Optional[float]: 残り時間(秒). 総数が確定していない場合はNoneを返します。
+        """
+        if self.finished:
+            return 0.0
+        if not self.walk_finished or (rate:=self.files_per_second) <= 0.0:
+            return None
+        return (self.discovered - self.scanned) / rate
+
+    def format(self) -> str:
+        """表示用の文字列に変換
+
+        Returns:
+            str: 表示用の文字列
+        """
+        total = f"{self.discovered}" if self.walk_finished else f"{self.discovered}+"
+        text = f"{self.scanned}/{total} files, {self.matched} matched, {self.files_per_second:.0f} files/s, {self.read_mb_per_second:.1f} MB/s"
+        if self.scan_workers > 0:
+            text += f", {self.scan_workers}+{self.copy_workers} workers"
+        if (eta:=self.eta) is not None:
+            text += f", ETA {int(eta) // 60:02d}:{int(eta) % 60:02d}"
+        return text
+
+    def to_dict(self) -> dict[str, Any]:
+        """JSONで出力できる辞書に変換
+
+        Returns:
+            dict[str, Any]: 集計と1秒あたりの処理量
+        """
+        return {
+            **asdict(self),
+            "files_per_second": self.files_per_second,
+            "read_mb_per_second": self.read_mb_per_second,
+        }
+
+
+class ExportStats:
+    """差分出力の集計
+
+    複数のワーカーから更新されるためロックで保護します。
+    進捗の表示はsnapshot()で取得した値を一定間隔でポーリングしてください。
+    """
+    COUNTERS = (
+        "discovered",
+        "scanned",
+        "matched",
+        "copied",
+        "skipped",
+        "removed",
+        "bytes_read",
+        "bytes_written",
+        "scan_time",
+        "copy_time",
+    )
+
+    def __init__(self) -> None:
+        """コンストラクタ
+        """
+        self.start_time = time.perf_counter()
+        self.end_time:Optional[float] = None
+
+        # 走査対象として見つけたファイル数
+        self.discovered = 0
+
+        # 走査したファイル数
+        self.scanned = 0
+
+        # 検索内容を含んでいたファイル数
+        self.matched = 0
+
+        # コピーしたファイル数
+        self.copied = 0
+
+        # 出力先と同一のためコピーを省略したファイル数
+        self.skipped = 0
+
+        # 出力先から削除したファイル数
+        self.removed = 0
+
+        # 走査で読み込んだバイト数
+        self.bytes_read = 0
+
+        # コピーで書き込んだバイト数
+        self.bytes_written = 0
+
+        # 全てのワーカーで検索に掛かった時間の合計(秒)
+        self.scan_time = 0.0
+
+        # 全てのワーカーでコピーに掛かった時間の合計(秒)
+        self.copy_time = 0.0
+
+        # ディレクトリの走査が完了したか
+        self.walk_finished = False
+
+        # 段階ごとの経過時間(秒)
+        self.phases:dict[str, float] = {}
+
+        # 稼働中の走査, コピーのワーカー数 (自動調整しない場合は上限で丸めた指定値)
+        self.scan_workers = 0
+        self.copy_workers = 0
+
+        self.lock = th.Lock()
+
+    def add(
+        self,
+        discovered:int = 0,
+        scanned:int = 0,
+        matched:int = 0,
+        copied:int = 0,
+        skipped:int = 0,
+        removed:int = 0,
+        bytes_read:int = 0,
+        bytes_written:int = 0,
+        scan_time:float = 0.0,
+        copy_time:float = 0.0,
+    ) -> None:
+        """集計に加算
+
+        Args:
+            discovered (int, optional): 走査対象として見つけたファイル数. Defaults to 0.
+            scanned (int, optional): 走査したファイル数. Defaults to 0.
+            matched (int, optional): 検索内容を含んでいたファイル数. Defaults to 0.
+            copied (int, optional): コピーしたファイル数. Defaults to 0.
+            skipped (int, optional): コピーを省略したファイル数. Defaults to 0.
+            removed (int, optional): 出力先から削除したファイル数. Defaults to 0.
+            bytes_read (int, optional): 走査で読み込んだバイト数. Defaults to 0.
+            bytes_written (int, optional): コピーで書き込んだバイト数. Defaults to 0.
+            scan_time (float, optional): 検索に掛かった時間(秒). Defaults to 0.0.
+            copy_time (float, optional): コピーに掛かった時間(秒). Defaults to 0.0.
+        """
+        with self.lock:
+            self.discovered += discovered
+            self.scanned += scanned
+            self.matched += matched
+            self.copied += copied
+            self.skipped += skipped
+            self.removed += removed
+            self.bytes_read += bytes_read
+            self.bytes_written += bytes_written
+            self.scan_time += scan_time
+            self.copy_time += copy_time
+
+    def merge(self, other:"ExportStats") -> None:
+        """別のワーカーの集計を加算
+
+        Args:
+            other (ExportStats): 別のワーカーの集計
+        """
+        self.add(**{name: getattr(other, name) for name in ExportStats.COUNTERS})
+
+    def record_phase(self, name:str, seconds:float) -> None:
+        """段階の経過時間を記録
+
+        Args:
+            name (str): 段階 (PHASE_LOAD, PHASE_WALK, PHASE_EXPORT, PHASE_SAVE)
+            seconds (float): 経過時間(秒)
+        """
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def record_workers(self, scan_workers:int, copy_workers:int) -> None:
+        """稼働中のワーカー数を記録
+
+        Args:
+            scan_workers (int): 走査のワーカー数
+            copy_workers (int): コピーのワーカー数
+        """
+        with self.lock:
+            self.scan_workers = scan_workers
+            self.copy_workers = copy_workers
+
+    def finish_walk(self) -> None:
+        """ディレクトリの走査の完了を記録
+        """
+        with self.lock:
+            self.walk_finished = True
+
+    def finish(self) -> None:
+        """差分出力の完了を記録
+        """
+        with self.lock:
+            self.end_time = time.perf_counter()
+
+    def snapshot(self) -> ExportSnapshot:
+        """現時点の集計を取得
+
+        Returns:
+            ExportSnapshot: 現時点の集計
+        """
+        with self.lock:
+            end_time = time.perf_counter() if self.end_time is None else self.end_time
+            return ExportSnapshot(
+                elapsed=end_time - self.start_time,
+                walk_finished=self.walk_finished,
+                finished=self.end_time is not None,
+                phases=dict(self.phases),
+                scan_workers=self.scan_workers,
+                copy_workers=self.copy_workers,
+                **{name: getattr(self, name) for name in ExportStats.COUNTERS},
+            )
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state:dict) -> None:
+        self.__dict__.update(state)
+        self.lock = th.Lock()
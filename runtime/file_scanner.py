@@ -0,0 +1,190 @@
+import os
+import time
+from pathlib import Path
+from typing import Optional, Callable, Union
+
+from runtime.baseline_index import *
+from runtime.diff_export_info import *
+from runtime.export_profiler import *
+from runtime.export_stats import *
+from runtime.memory_budget import *
+from runtime.scan_manifest import *
+
+
+__all__ = [
+    "FileScanner",
+]
+
+
+class FileScanner:
+    """ファイル単位の走査
+
+    ワーカー(スレッド, プロセス)ごとに生成して使います。
+    """
+    def __init__(
+        self,
+        info:DiffExportInfo,
+        manifest:Optional[ScanManifest] = None,
+        stats:Optional[ExportStats] = None,
+        budget:Optional[MemoryBudget] = None,
+        profiler:Optional[ExportProfiler] = None,
+        baseline:Optional[BaselineIndex] = None,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            info (DiffExportInfo): 差分出力情報
+            manifest (Optional[ScanManifest], optional): 走査結果のマニフェスト. Defaults to None.
+            stats (Optional[ExportStats], optional): 差分出力の集計. Defaults to None.
+            budget (Optional[MemoryBudget], optional): 一致したファイルの内容をコピーまで保持するメモリの上限. Defaults to None.
+            profiler (Optional[ExportProfiler], optional): 処理ごとの計測. Defaults to None.
+            baseline (Optional[BaselineIndex], optional): 改変前のファイルのサイズとハッシュ値の索引. Defaults to None.
+        """
+        self.info = info
+        self.manifest = manifest
+        self.stats = ExportStats() if stats is None else stats
+        self.budget = budget
+        self.profiler = profiler
+        self.baseline = baseline
+        self.matcher = info.create_matcher()
+        self.matcher.profiler = profiler
+
+    def search(self, path:Path, key:Optional[str] = None) -> tuple[int, Optional[bytes]]:
+        """ファイルから検索内容を検索して集計
+
+        改変前の索引がある場合は、検索内容を含まないファイルを同じ読み込みで改変前と比較します。
+        サイズが改変前と同じ場合のみハッシュ値を計算します。
+
+        Args:
+            path (Path): ファイルパス
+            key (Optional[str], optional): 入力ディレクトリからの相対パス. 未計算の場合はNone. Defaults to None.
+
+        Returns:
+            tuple[int, Optional[bytes]]: 検索結果のマスクと, 保持できた場合はファイルの内容
+        """
+        baseline_entry:Optional[list] = None
+        if self.baseline is not None:
+            baseline_entry = self.baseline.entries.get(self.info.relative_key(path) if key is None else key)
+
+        bytes_read = self.matcher.bytes_read
+        start_time = time.perf_counter()
+        mask, data = self.matcher.read_and_search(path, self.budget, None if baseline_entry is None else baseline_entry[0])
+
+        # 検索内容を書き忘れた編集
+        if mask == 0 and self.baseline is not None and self.matcher.size is not None:
+            if BaselineIndex.is_edited_entry(baseline_entry, self.matcher.size, self.matcher.digest):
+                mask = self.info.baseline_mask
+
+        self.stats.add(
+            scanned=1,
+            matched=int(mask != 0),
+            bytes_read=self.matcher.bytes_read - bytes_read,
+            scan_time=time.perf_counter() - start_time,
+        )
+        return mask, data
+
+    def stat(self, stat:Callable[[], os.stat_result], path:Union[Path, str]) -> os.stat_result:
+        """statを取得して計測
+
+        Args:
+            stat (Callable[[], os.stat_result]): Path.stat, またはDirEntry.stat
+            path (Union[Path, str]): ファイルパス
+
+        Returns:
+            os.stat_result: ファイルのstat
+        """
+        if self.profiler is None:
+            return stat()
+
+        start = self.profiler.now()
+        try:
+            return stat()
+        finally:
+            self.profiler.record("stat", start, path)
+
+    def is_exported(self, path:Path, stat:os.stat_result, mask:int) -> bool:
+        """全てのコピー先に今の内容を出力済みか判定
+
+        以前の出力の残りを出力済みとみなさないように、サイズが同じでコピー元の更新後に書き込んだファイルのみ出力済みとします。
+
+        Args:
+            path (Path): 入力ディレクトリ内のファイルパス
+            stat (os.stat_result): 入力側のファイルのstat
+            mask (int): 検索結果のマスク
+
+        Returns:
+            bool: 全てのコピー先に出力済みの場合はTrueを返します。
+        """
+        for root in self.info.output_roots_of(mask):
+            try:
+                output_stat = os.stat(str(self.info.output_dir_of(path, root) / path.name))
+            except OSError:
+                return False
+            if output_stat.st_size != stat.st_size or output_stat.st_mtime_ns < stat.st_mtime_ns:
+                return False
+        return True
+
+    def scan(self, path:Path, stat:Optional[os.stat_result] = None) -> tuple[int, Optional[bytes]]:
+        """コピーが必要なファイルか判定
+
+        拡張子などの条件はDirectoryWalkerで判定済みのパスを渡してください。
+        ファイルの内容を返した場合は、コピー後にOutputWriterが確保したメモリを解放します。
+
+        Args:
+            path (Path): 入力ディレクトリ内のファイルパス
+            stat (Optional[os.stat_result], optional): ファイルのstat. 未取得の場合はNone. Defaults to None.
+
+        Returns:
+            tuple[int, Optional[bytes]]: コピーが必要な場合は検索結果のマスク, それ以外は0と, 保持できた場合はファイルの内容
+        """
+        if (manifest:=self.manifest) is None:
+            return self.search(path)
+
+        if stat is None:
+            try:
+                stat = self.stat(path.stat, path)
+            except OSError:
+                return 0, None
+
+        key = self.info.relative_key(path)
+
+        data:Optional[bytes] = None
+        if (cached:=manifest.lookup(key, stat)) is None:
+            mask, data = self.search(path, key)
+        else:
+            mask = cached
+            self.stats.add(scanned=1, matched=int(mask != 0))
+
+        # 変更が無く全てのコピー先に出力済みのファイルはコピーも省略 (アーカイブは毎回作り直すので省略しない)
+        if cached and self.info.archive_path is None and self.is_exported(path, stat, mask):
+            mask = 0
+
+        # コピーが必要なファイルはOutputWriterでコピーを終えてから記録
+        if mask == 0:
+            manifest.update(key, stat, cached or 0)
+        else:
+            manifest.defer(key, stat, mask)
+
+        return mask, data
+
+    def scan_entry(self, entry:os.DirEntry) -> Optional[tuple[Path, int, Optional[bytes]]]:
+        """DirectoryWalkerで列挙したファイルを走査
+
+        DirEntryにキャッシュされたstatを再利用します。
+
+        Args:
+            entry (os.DirEntry): 走査対象のファイル
+
+        Returns:
+            Optional[tuple[Path, int, Optional[bytes]]]: コピーが必要な場合はファイルパスと検索結果のマスクとファイルの内容, それ以外はNoneを返します。
+        """
+        stat:Optional[os.stat_result] = None
+        if self.manifest is not None:
+            try:
+                stat = self.stat(entry.stat, entry.path)
+            except OSError:
+                return None
+
+        path = Path(entry.path)
+        mask, data = self.scan(path, stat)
+        return (path, mask, data) if mask != 0 else None
@@ -0,0 +1,334 @@
+import os
+import sys
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading as th
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable, Optional
+
+from runtime.path_filter import *
+
+
+__all__ = [
+    "FileWatcher",
+    "InotifyWatcher",
+    "PollingWatcher",
+    "create_file_watcher",
+]
+
+
+class FileWatcher(ABC):
+    """入力ディレクトリの変更の監視
+
+    変更を検知したファイルパスの集合をコールバックに渡します。
+    削除・移動されたディレクトリは末尾に区切り文字(os.sep)を付けたパスで渡すので、呼び出し元で中身をまとめて破棄してください。
+    どのファイルが変更されたか分からない場合(ポーリング, イベントの取りこぼし)はNoneを渡すので、呼び出し元で全体を再確認してください。
+    """
+    def __init__(self, root:str, path_filter:Optional[PathFilter] = None) -> None:
+        """コンストラクタ
+
+        Args:
+            root (str): 監視するディレクトリ
+            path_filter (Optional[PathFilter], optional): 監視対象の条件 (除外したディレクトリは監視しません). Defaults to None.
+        """
+        self.root = str(root)
+        self.path_filter = PathFilter() if path_filter is None else path_filter
+
+    @abstractmethod
+    def run(self, callback_changed:Callable[[Optional[set[str]]], None], stop_event:th.Event) -> None:
+        """stop_eventがセットされるまで監視
+
+        Args:
+            callback_changed (Callable[[Optional[set[str]]], None]): 変更を検知したファイルパス, または不明な場合はNoneを受け取るコールバック
+            stop_event (th.Event): 監視の終了の通知
+        """
+        pass
+
+
+class PollingWatcher(FileWatcher):
+    """一定間隔で全体の再確認を通知
+
+    inotifyが使えない環境(Windows, ネットワークドライブ)向けです。
+    statによる変更の判定は呼び出し元で行います。
+    """
+    def __init__(self, root:str, path_filter:Optional[PathFilter] = None, interval:float = 5.0) -> None:
+        """コンストラクタ
+
+        Args:
+            root (str): 監視するディレクトリ
+            path_filter (Optional[PathFilter], optional): 監視対象の条件. Defaults to None.
+            interval (float, optional): 再確認の間隔(秒). Defaults to 5.0.
+        """
+        super().__init__(root, path_filter)
+        self.interval = max(0.1, interval)
+
+    def run(self, callback_changed:Callable[[Optional[set[str]]], None], stop_event:th.Event) -> None:
+        while not stop_event.wait(self.interval):
+            callback_changed(None)
+
+
+class InotifyWatcher(FileWatcher):
+    """inotifyによる変更の監視 (Linuxのみ)
+
+    走査対象のディレクトリごとにwatchを追加し、作成・移動されたディレクトリも追跡します。
+    """
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0x00000800
+    IN_CLOEXEC = 0x00080000
+
+    WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+    # struct inotify_event (名前を除く)
+    EVENT_HEADER = struct.Struct("iIII")
+
+    # イベントの読み込みを待つ間隔(秒)
+    SELECT_TIMEOUT = 0.5
+
+    def __init__(self, root:str, path_filter:Optional[PathFilter] = None) -> None:
+        """コンストラクタ
+
+        Args:
+            root (str): 監視するディレクトリ
+            path_filter (Optional[PathFilter], optional): 監視対象の条件. Defaults to None.
+
+        Raises:
+            OSError: inotifyを使えない
+        """
+        super().__init__(root, path_filter)
+
+        self.libc = InotifyWatcher.load_libc()
+        self.fd:int = self.libc.inotify_init1(InotifyWatcher.IN_NONBLOCK | InotifyWatcher.IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+
+        # watch descriptorと監視しているディレクトリ
+        self.directories:dict[int, str] = {}
+
+        # 入力ディレクトリのパスの文字数 (区切り文字を含む)
+        self.root_length = len(os.path.join(self.root, ""))
+
+    @staticmethod
+    def load_libc() -> ctypes.CDLL:
+        """inotifyの関数を持つlibcを読み込み
+
+        Raises:
+            OSError: Linux以外, またはlibcにinotifyが無い
+
+        Returns:
+            ctypes.CDLL: libc
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_init1.restype = ctypes.c_int
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_add_watch.restype = ctypes.c_int
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        libc.inotify_rm_watch.restype = ctypes.c_int
+        return libc
+
+    def close(self) -> None:
+        """inotifyを閉じる
+        """
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_watch(self, directory:str) -> bool:
+        """ディレクトリにwatchを追加
+
+        Args:
+            directory (str): ディレクトリ
+
+        Returns:
+            bool: 追加できた場合はTrueを返します。
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), InotifyWatcher.WATCH_MASK)
+        if wd < 0:
+            return False
+        self.directories[wd] = directory
+        return True
+
+    def remove_tree(self, directory:str) -> None:
+        """ディレクトリ以下のwatchを削除
+
+        入力ディレクトリ外に移動したディレクトリのイベントを受け取らないようにします。
+        入力ディレクトリ内に移動した場合は移動先のIN_MOVED_TOで追加し直します。
+
+        Args:
+            directory (str): 削除・移動されたディレクトリ
+        """
+        prefix = os.path.join(directory, "")
+        for wd, path in list(self.directories.items()):
+            if path == directory or path.startswith(prefix):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.directories[wd]
+
+    def add_tree(self, directory:str) -> tuple[set[str], bool]:
+        """ディレクトリ以下の走査対象のディレクトリに再帰的にwatchを追加
+
+        watchを追加する前に作成されたファイルを取りこぼさないように、見つけたファイルも返します。
+
+        Args:
+            directory (str): ディレクトリ
+
+        Returns:
+            tuple[set[str], bool]: ディレクトリ以下のファイルと, 全てのwatchを追加できた場合はTrue
+        """
+        path_filter = self.path_filter
+        files:set[str] = set()
+        is_complete = True
+
+        stack = [directory]
+        while len(stack) > 0:
+            current = stack.pop()
+            if not self.add_watch(current):
+                is_complete = False
+                continue
+
+            try:
+                it = os.scandir(current)
+            except OSError:
+                continue
+
+            with it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            # プレフィックス木を辿らずに相対パスで判定
+                            if path_filter.enter_dir(entry, None, self.root_length)[0] and self.accepts_dir(entry.path):
+                                stack.append(entry.path)
+                        else:
+                            files.add(entry.path)
+                    except OSError:
+                        pass
+
+        return files, is_complete
+
+    def accepts_dir(self, directory:str) -> bool:
+        """入力ディレクトリからのパスで除外したディレクトリではないか判定
+
+        Args:
+            directory (str): ディレクトリ
+
+        Returns:
+            bool: 監視する場合はTrueを返します。
+        """
+        relative_path = directory[self.root_length:].replace(os.sep, "/")
+        node:Optional[dict] = self.path_filter.root_node
+        for name in relative_path.split("/"):
+            if node is None or name not in node:
+                return True
+            if (node:=node[name]) is None:
+                return False
+        return True
+
+    def read_events(self) -> Iterable[tuple[int, int, str]]:
+        """読み込めるだけイベントを読み込み
+
+        Yields:
+            Iterable[tuple[int, int, str]]: watch descriptor, イベントの種類, 名前
+        """
+        header = InotifyWatcher.EVENT_HEADER
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = header.unpack_from(data, offset)
+                offset += header.size
+                name = os.fsdecode(data[offset:offset+length].rstrip(b"\0"))
+                offset += length
+                yield wd, mask, name
+
+    def run(self, callback_changed:Callable[[Optional[set[str]]], None], stop_event:th.Event) -> None:
+        try:
+            files, is_complete = self.add_tree(self.root)
+
+            # watchを追加しきれない場合(max_user_watchesの上限など)は取りこぼすので全体の再確認を併用
+            if not is_complete:
+                callback_changed(None)
+
+            while not stop_event.is_set():
+                readable, _, _ = select.select([self.fd], [], [], InotifyWatcher.SELECT_TIMEOUT)
+                if len(readable) == 0:
+                    continue
+
+                changed:set[str] = set()
+                overflow = False
+                for wd, mask, name in self.read_events():
+                    if mask & InotifyWatcher.IN_Q_OVERFLOW:
+                        overflow = True
+                        continue
+
+                    if mask & InotifyWatcher.IN_IGNORED:
+                        self.directories.pop(wd, None)
+                        continue
+
+                    if (directory:=self.directories.get(wd)) is None or name == "":
+                        continue
+
+                    path = os.path.join(directory, name)
+                    if mask & InotifyWatcher.IN_ISDIR:
+                        # 作成・移動されたディレクトリは中身ごと追跡
+                        if mask & (InotifyWatcher.IN_CREATE | InotifyWatcher.IN_MOVED_TO):
+                            files, is_complete = self.add_tree(path)
+                            changed |= files
+                            overflow |= not is_complete
+                        # 削除・移動されたディレクトリは中身ごと破棄
+                        elif mask & (InotifyWatcher.IN_DELETE | InotifyWatcher.IN_MOVED_FROM):
+                            self.remove_tree(path)
+                            changed.add(os.path.join(path, ""))
+                    else:
+                        changed.add(path)
+
+                if overflow:
+                    callback_changed(None)
+                elif len(changed) > 0:
+                    callback_changed(changed)
+        finally:
+            self.close()
+
+
+def create_file_watcher(root:str, path_filter:Optional[PathFilter] = None, poll_interval:float = 5.0, use_inotify:bool = True) -> FileWatcher:
+    """使える中で最も効率の良い監視を生成
+
+    Args:
+        root (str): 監視するディレクトリ
+        path_filter (Optional[PathFilter], optional): 監視対象の条件. Defaults to None.
+        poll_interval (float, optional): ポーリングの間隔(秒). Defaults to 5.0.
+        use_inotify (bool, optional): inotifyが使える場合は使う. Defaults to True.
+
+    Returns:
+        FileWatcher: 変更の監視
+    """
+    if use_inotify:
+        try:
+            return InotifyWatcher(root, path_filter)
+        except OSError:
+            pass
+    return PollingWatcher(root, path_filter, poll_interval)
@@ -0,0 +1,154 @@
+import os
+import stat
+import subprocess
+from typing import Iterator, Optional
+
+from runtime.directory_walker import *
+from runtime.path_filter import *
+
+
+__all__ = [
+    "GitError",
+    "GitCandidate",
+    "GitWalker",
+]
+
+
+class GitError(Exception):
+    """gitの実行に失敗
+    """
+    pass
+
+
+class GitCandidate:
+    """gitから列挙したファイル
+
+    os.DirEntryの代わりに走査に渡せるようにpath, name, stat(), is_file()を持ちます。
+    """
+    def __init__(self, path:str) -> None:
+        """コンストラクタ
+
+        Args:
+            path (str): ファイルパス
+        """
+        self.path = path
+        self.name = os.path.basename(path)
+        self.stat_result:Optional[os.stat_result] = None
+
+    def stat(self) -> os.stat_result:
+        """ファイルのstatを取得 (2回目以降はキャッシュ)
+
+        Returns:
+            os.stat_result: ファイルのstat
+        """
+        if self.stat_result is None:
+            self.stat_result = os.stat(self.path)
+        return self.stat_result
+
+    def is_file(self) -> bool:
+        """通常のファイルか判定
+
+        Returns:
+            bool: 通常のファイルの場合はTrueを返します。
+        """
+        try:
+            return stat.S_ISREG(self.stat().st_mode)
+        except OSError:
+            return False
+
+
+class GitWalker(DirectoryWalker):
+    """gitで基準のリビジョンから変更・追加されたファイルのみを列挙
+
+    ディレクトリを走査せずにgitの管理情報から走査対象を列挙するため、大きなツリーでも少数のファイルのみを走査します。
+    列挙したファイルにもPathFilterの条件を適用します。
+    """
+    def __init__(
+        self,
+        root:str,
+        base:str,
+        path_filter:Optional[PathFilter] = None,
+        git:str = "git",
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            root (str): 走査するディレクトリ (gitの作業ツリー内)
+            base (str): 比較する基準のリビジョン
+            path_filter (Optional[PathFilter], optional): 走査対象のファイルの条件. Noneの場合は既定の条件. Defaults to None.
+            git (str, optional): gitの実行ファイル. Defaults to "git".
+        """
+        super().__init__(root, path_filter)
+        self.base = base
+        self.git = git
+
+    def run_git(self, *args:str) -> bytes:
+        """rootをカレントディレクトリとしてgitを実行
+
+        Raises:
+            GitError: gitが見つからない, または失敗した
+
+        Returns:
+            bytes: 標準出力
+        """
+        try:
+            result = subprocess.run(
+                [self.git, "-C", self.root, *args],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=False,
+            )
+        except OSError as e:
+            raise GitError(f"failed to run git: {e}") from e
+
+        if result.returncode != 0:
+            raise GitError(result.stderr.decode("utf-8", errors="replace").strip())
+        return result.stdout
+
+    def verify(self) -> None:
+        """作業ツリーと基準のリビジョンが有効か確認
+
+        Raises:
+            GitError: 無効な場合
+        """
+        self.run_git("rev-parse", "--verify", "--quiet", f"{self.base}^{{commit}}")
+
+    def changed_files(self) -> list[str]:
+        """基準のリビジョンから変更・追加されたファイルを列挙
+
+        作業ツリーの変更(ステージ済みを含む)と、無視されていない未追跡のファイルを対象とし、削除されたファイルは除きます。
+
+        Raises:
+            GitError: gitの実行に失敗した
+
+        Returns:
+            list[str]: '/'区切りのrootからの相対パス
+        """
+        # -zで区切るとパスはエスケープされずそのまま出力される
+        changed = self.run_git("diff", "--name-only", "-z", "--relative", "--no-renames", "--diff-filter=d", self.base, "--")
+        untracked = self.run_git("ls-files", "--others", "--exclude-standard", "-z")
+
+        paths:dict[str, None] = {}
+        for output in (changed, untracked):
+            for path in output.split(b"\0"):
+                if path != b"":
+                    paths[os.fsdecode(path)] = None
+        return list(paths)
+
+    def walk(self) -> Iterator[GitCandidate]:
+        """走査対象のファイルを列挙
+
+        Raises:
+            GitError: gitの実行に失敗した
+
+        Yields:
+            Iterator[GitCandidate]: 走査対象のファイル
+        """
+        path_filter = self.path_filter
+        for relative_path in self.changed_files():
+            if not path_filter.accepts_relative_path(relative_path):
+                continue
+
+            candidate = GitCandidate(os.path.join(self.root, *relative_path.split("/")))
+            if candidate.is_file() and path_filter.accepts_size(candidate.stat().st_size):
+                yield candidate
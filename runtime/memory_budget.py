@@ -0,0 +1,53 @@
+import threading as th
+
+
+__all__ = [
+    "MemoryBudget",
+]
+
+
+class MemoryBudget:
+    """走査で読み込んだファイルの内容をコピーまで保持するメモリの上限
+
+    全てのワーカーで共有し、上限を超える場合は保持せずに通常通りコピー時に読み直します。
+    """
+    def __init__(self, limit:int, file_limit:int) -> None:
+        """コンストラクタ
+
+        Args:
+            limit (int): 保持するバイト数の合計の上限
+            file_limit (int): 保持するファイルサイズの上限
+        """
+        self.limit = max(0, limit)
+        self.file_limit = max(0, file_limit)
+        self.used = 0
+        self.lock = th.Lock()
+
+    def acquire(self, size:int) -> bool:
+        """保持するバイト数を確保
+
+        上限を超える場合は待たずに失敗します。
+
+        Args:
+            size (int): 確保するバイト数
+
+        Returns:
+            bool: 確保できた場合はTrueを返します。
+        """
+        if size > self.file_limit:
+            return False
+
+        with self.lock:
+            if self.used + size > self.limit:
+                return False
+            self.used += size
+            return True
+
+    def release(self, size:int) -> None:
+        """確保したバイト数を解放
+
+        Args:
+            size (int): 解放するバイト数
+        """
+        with self.lock:
+            self.used -= size
@@ -0,0 +1,280 @@
+import os
+import time
+import errno
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+from runtime.diff_export_info import *
+from runtime.digest_cache import *
+from runtime.export_profiler import *
+from runtime.export_stats import *
+from runtime.memory_budget import *
+from runtime.scan_manifest import *
+
+
+__all__ = [
+    "OutputWriter",
+]
+
+
+class OutputWriter:
+    """出力先へのコピー
+
+    同期方式(DiffExportInfo.sync_mode)に従って出力先と同一のファイルのコピーを省略します。
+    """
+    DIGEST_CHUNK_SIZE = 1024 * 1024
+
+    # copy_file_rangeで1回に転送するバイト数
+    COPY_RANGE_SIZE = 64 * 1024 * 1024
+
+    # copy_file_rangeが使えないファイルシステムの組み合わせ
+    COPY_RANGE_UNSUPPORTED_ERRORS = frozenset((
+        errno.EXDEV,
+        errno.ENOSYS,
+        errno.EINVAL,
+        errno.EOPNOTSUPP,
+        errno.ENOTSUP,
+        errno.EBADF,
+        errno.EPERM,
+    ))
+
+    def __init__(
+        self,
+        info:DiffExportInfo,
+        stats:ExportStats,
+        digest_cache:Optional[DigestCache] = None,
+        budget:Optional[MemoryBudget] = None,
+        profiler:Optional[ExportProfiler] = None,
+        manifest:Optional[ScanManifest] = None,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            info (DiffExportInfo): 差分出力情報
+            stats (ExportStats): 差分出力の集計
+            digest_cache (Optional[DigestCache], optional): 出力先のファイルのハッシュ値のキャッシュ. Defaults to None.
+            budget (Optional[MemoryBudget], optional): 走査で保持したファイルの内容のメモリの上限. Defaults to None.
+            profiler (Optional[ExportProfiler], optional): 処理ごとの計測. Defaults to None.
+            manifest (Optional[ScanManifest], optional): コピーを終えたファイルの判定結果を記録するマニフェスト. Defaults to None.
+        """
+        self.info = info
+        self.stats = stats
+        self.digest_cache = digest_cache
+        self.budget = budget
+        self.profiler = profiler
+        self.manifest = manifest
+
+        # 作成済みの出力先ディレクトリ (ファイルごとのmkdirを省略)
+        self.created_dirs:set[str] = set()
+
+        # copy_file_rangeが使えない環境では以降は試さない
+        self.use_copy_range = hasattr(os, "copy_file_range")
+
+    def open(self) -> None:
+        """出力を開始
+
+        ディレクトリへの出力では何もしません。
+        """
+        pass
+
+    def close(self, commit:bool = True) -> None:
+        """出力を終了
+
+        ディレクトリへの出力では何もしません。
+
+        Args:
+            commit (bool, optional): 出力を確定する. 中断やエラーの場合はFalse. Defaults to True.
+        """
+        pass
+
+    def make_dirs(self, directory:Path) -> None:
+        """出力先ディレクトリを作成
+
+        同じディレクトリの作成は1回だけ行います。
+
+        Args:
+            directory (Path): 出力先ディレクトリ
+        """
+        if (key:=str(directory)) in self.created_dirs:
+            return
+
+        start = 0 if self.profiler is None else self.profiler.now()
+        directory.mkdir(parents=True, exist_ok=True)
+        if self.profiler is not None:
+            self.profiler.record("mkdir", start, directory)
+
+        self.created_dirs.add(key)
+
+    def copy_range(self, src:str, dst:str) -> bool:
+        """copy_file_rangeでコピー
+
+        カーネル内でコピーするためユーザー空間を経由せず、対応したファイルシステムではreflinkやサーバー側のコピーになります。
+
+        Args:
+            src (str): コピー元のファイルパス
+            dst (str): コピー先のファイルパス
+
+        Returns:
+            bool: コピーできた場合はTrueを返します。使えない場合はFalseを返します。
+        """
+        with open(src, mode="rb") as fsrc, open(dst, mode="wb") as fdst:
+            copied = 0
+            try:
+                while (size:=os.copy_file_range(fsrc.fileno(), fdst.fileno(), OutputWriter.COPY_RANGE_SIZE)) > 0:
+                    copied += size
+            except OSError as e:
+                # 途中まで転送した場合は本当の書き込みエラー
+                if copied > 0 or e.errno not in OutputWriter.COPY_RANGE_UNSUPPORTED_ERRORS:
+                    raise
+                self.use_copy_range = False
+                return False
+        return True
+
+    def copy_file(self, src:Path, dst:Path) -> None:
+        """ファイルの内容と権限をコピー
+
+        copy_file_rangeを優先し、使えない場合はshutil.copyfile(sendfile, または大きなバッファでのコピー)で行います。
+
+        Args:
+            src (Path): コピー元のファイルパス
+            dst (Path): コピー先のファイルパス
+        """
+        if not self.use_copy_range or not self.copy_range(str(src), str(dst)):
+            shutil.copyfile(str(src), str(dst))
+        shutil.copymode(str(src), str(dst))
+
+    @staticmethod
+    def file_digest(path:Path) -> str:
+        """ファイルのハッシュ値(BLAKE2b)を計算
+
+        Args:
+            path (Path): ファイルパス
+
+        Returns:
+            str: ハッシュ値
+        """
+        h = hashlib.blake2b()
+        with open(str(path), mode="rb") as f:
+            while (chunk:=f.read(OutputWriter.DIGEST_CHUNK_SIZE)):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def output_digest(self, key:str, path:Path, stat:os.stat_result) -> str:
+        """出力先のファイルのハッシュ値を取得
+
+        Args:
+            key (str): コピー先のパス (DiffExportInfo.output_key)
+            path (Path): 出力先のファイルパス
+            stat (os.stat_result): 出力先のファイルのstat
+
+        Returns:
+            str: ハッシュ値
+        """
+        if self.digest_cache is not None and (digest:=self.digest_cache.lookup(key, stat)) is not None:
+            return digest
+
+        digest = OutputWriter.file_digest(path)
+        if self.digest_cache is not None:
+            self.digest_cache.update(key, stat, digest)
+        return digest
+
+    @staticmethod
+    def write_data(data:bytes, src:Path, dst:Path) -> None:
+        """走査で読み込んだ内容をそのまま書き込み
+
+        Args:
+            data (bytes): コピー元のファイルの内容
+            src (Path): コピー元のファイルパス (権限のコピー元)
+            dst (Path): コピー先のファイルパス
+        """
+        with open(str(dst), mode="wb") as f:
+            f.write(data)
+        shutil.copymode(str(src), str(dst))
+
+    def write(self, path:Path, mask:int = 1, data:Optional[bytes] = None) -> int:
+        """一致した検索内容の全てのコピー先にファイルをコピー
+
+        走査で読み込んだ内容(data)を渡した場合はコピー元を読み直さずに書き込み、確保したメモリを解放します。
+        全てのコピー先に書き込めた場合のみ、マニフェストに保留中の判定結果を記録します。
+
+        Args:
+            path (Path): 入力ディレクトリ内のファイルパス
+            mask (int, optional): 検索結果のマスク. Defaults to 1.
+            data (Optional[bytes], optional): 走査で読み込んだファイルの内容. Defaults to None.
+
+        Returns:
+            int: コピーしたコピー先の数
+        """
+        try:
+            num_copied = self.write_roots(path, mask, data)
+            if self.manifest is not None:
+                self.manifest.commit(self.info.relative_key(path))
+            return num_copied
+        finally:
+            if data is not None and self.budget is not None:
+                self.budget.release(len(data))
+
+    def write_roots(self, path:Path, mask:int, data:Optional[bytes]) -> int:
+        num_copied = 0
+        start_time = time.perf_counter()
+
+        # 入力側のstatとハッシュ値はコピー先が複数でも1回だけ取得
+        input_stat:Optional[os.stat_result] = None
+        input_digest:Optional[str] = None
+
+        for root in self.info.output_roots_of(mask):
+            output_path = self.info.output_dir_of(path, root)
+            output_file_path = output_path / path.name
+            key = self.info.output_key(self.info.relative_key(path), root)
+
+            if self.info.sync_mode != SYNC_NONE:
+                sync_start = 0 if self.profiler is None else self.profiler.now()
+                if input_stat is None:
+                    input_stat = os.stat(str(path))
+                try:
+                    output_stat = os.stat(str(output_file_path))
+                except OSError:
+                    output_stat = None
+
+                # サイズが異なる場合は必ずコピー
+                is_same = False
+                if output_stat is not None and output_stat.st_size == input_stat.st_size:
+                    if self.info.sync_mode == SYNC_STAT:
+                        # コピー後に入力側が更新されていなければ同一
+                        is_same = output_stat.st_mtime_ns >= input_stat.st_mtime_ns
+                    else:
+                        if input_digest is None:
+                            input_digest = OutputWriter.file_digest(path) if data is None else hashlib.blake2b(data).hexdigest()
+                        is_same = input_digest == self.output_digest(key, output_file_path, output_stat)
+
+                if self.profiler is not None:
+                    self.profiler.record("sync", sync_start, path)
+
+                if is_same:
+                    self.stats.add(skipped=1)
+                    continue
+
+            self.make_dirs(output_path)
+
+            copy_start = 0 if self.profiler is None else self.profiler.now()
+            if data is None:
+                self.copy_file(path, output_file_path)
+            else:
+                OutputWriter.write_data(data, path, output_file_path)
+            if self.profiler is not None:
+                self.profiler.record("copy", copy_start, path)
+
+            output_stat = os.stat(str(output_file_path))
+
+            # コピーした内容のハッシュ値は計算済み
+            if input_digest is not None and self.digest_cache is not None:
+                self.digest_cache.update(key, output_stat, input_digest)
+
+            self.stats.add(copied=1, bytes_written=output_stat.st_size)
+            num_copied += 1
+
+        self.stats.add(copy_time=time.perf_counter() - start_time)
+
+        return num_copied
@@ -0,0 +1,332 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+
+__all__ = [
+    "DEFAULT_EXTENSIONS",
+    "DEFAULT_EXCLUDED_DIRS",
+    "ENGINE_EXCLUDED_DIRS",
+    "PathFilter",
+]
+
+
+# 走査対象の拡張子
+DEFAULT_EXTENSIONS = ("h", "cpp", "ush", "usf", "ini", "md", "hlsl", "glsl", "cs", "inl")
+
+# 走査しないディレクトリ名 (既定では全て走査)
+DEFAULT_EXCLUDED_DIRS:tuple[str, ...] = ()
+
+# エンジンのビルド生成物とgitの管理情報 (明示的に指定した場合のみ除外)
+ENGINE_EXCLUDED_DIRS = ("Intermediate", "Binaries", "DerivedDataCache", ".git")
+
+# globの特殊文字
+GLOB_CHARS = frozenset("*?[\\")
+
+# globの大文字小文字の区別はファイルシステムに合わせる
+GLOB_FLAGS = re.IGNORECASE if os.name == "nt" else 0
+
+
+@dataclass
+class GlobRule:
+    """gitignore形式のパターン1行分
+    """
+    # パターンを変換した正規表現
+    pattern:re.Pattern
+    # '!'で始まるパターン (除外の取り消し)
+    negate:bool
+    # '/'で終わるパターン (ディレクトリのみ)
+    dir_only:bool
+    # '/'を含むパターン (入力ディレクトリからの相対パスと比較, それ以外は名前と比較)
+    anchored:bool
+
+    def is_match(self, name:str, relative_path:Optional[str], is_dir:bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        return self.pattern.fullmatch(relative_path if self.anchored else name) is not None
+
+
+class PathFilter:
+    """走査対象のファイルの条件
+
+    差分出力ごとに1回だけ生成し、走査中は拡張子の集合の参照とディレクトリのプレフィックス木を辿るだけで判定します。
+    対象外の拡張子のファイルはstatも相対パスの生成も行いません。
+
+    除外するパスはgitignore形式で指定します。
+
+    - '/'を含まないパターンは全ての階層の名前と比較
+    - '/'を含むパターンは入力ディレクトリからの相対パスと比較
+    - '/'で終わるパターンはディレクトリのみ
+    - '!'で始まるパターンは除外を取り消し (後に書いたパターンが優先)
+    - '*'と'?'は'/'に一致しない, '**'は任意の階層に一致
+    """
+    def __init__(
+        self,
+        extensions:Iterable[str] = DEFAULT_EXTENSIONS,
+        excluded_extensions:Iterable[str] = (),
+        excluded_dirs:Iterable[str] = DEFAULT_EXCLUDED_DIRS,
+        excluded_patterns:Iterable[str] = (),
+        max_size:Optional[int] = None,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            extensions (Iterable[str], optional): 走査対象の拡張子 (大文字小文字を区別します). Defaults to DEFAULT_EXTENSIONS.
+            excluded_extensions (Iterable[str], optional): 走査対象から除く拡張子. Defaults to ().
+            excluded_dirs (Iterable[str], optional): 走査しないディレクトリ名. '/'を含む場合は入力ディレクトリからの相対パス. Defaults to DEFAULT_EXCLUDED_DIRS.
+            excluded_patterns (Iterable[str], optional): 走査しないファイル・ディレクトリ (gitignore形式). Defaults to ().
+            max_size (Optional[int], optional): 走査するファイルサイズの上限. None, 0以下は無制限. Defaults to None.
+        """
+        self.extensions = frozenset(PathFilter.normalize_extension(extension) for extension in extensions)
+        self.extensions -= frozenset(PathFilter.normalize_extension(extension) for extension in excluded_extensions)
+
+        self.max_size = max_size if max_size is not None and max_size > 0 else None
+
+        # どの階層でも除外するディレクトリ名
+        self.excluded_dir_names:set[str] = set()
+        # どの階層でも除外するファイル名
+        self.excluded_file_names:set[str] = set()
+        # 入力ディレクトリからのパスで除外するディレクトリのプレフィックス木 (Noneの節は除外)
+        self.root_node:dict[str, Optional[dict]] = {}
+        # 入力ディレクトリからのパスで除外するファイル
+        self.excluded_file_paths:set[str] = set()
+        # 集合で判定できないパターン
+        self.rules:list[GlobRule] = []
+
+        for directory in excluded_dirs:
+            self.add_literal(directory.strip("/"), True, "/" in directory.strip("/"))
+
+        lines = [line.strip() for line in excluded_patterns]
+        lines = [line for line in lines if line != "" and not line.startswith("#")]
+
+        # 除外の取り消しがある場合は順序が意味を持つので全て正規表現で判定
+        has_negate = any(line.startswith("!") for line in lines)
+
+        for line in lines:
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+
+            # 先頭や途中に'/'を含むパターンは入力ディレクトリからの相対パス
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if line == "":
+                continue
+            if not has_negate and GLOB_CHARS.isdisjoint(line):
+                self.add_literal(line, dir_only, anchored)
+            else:
+                self.rules.append(GlobRule(re.compile(PathFilter.translate(line), GLOB_FLAGS), negate, dir_only, anchored))
+
+        # 相対パスを生成する必要があるか
+        self.needs_relative_path = any(rule.anchored for rule in self.rules) or len(self.excluded_file_paths) > 0
+
+    @staticmethod
+    def normalize_extension(extension:str) -> str:
+        return extension.lstrip(".")
+
+    @staticmethod
+    def translate(pattern:str) -> str:
+        """gitignore形式のパターンを正規表現に変換
+
+        Args:
+            pattern (str): 前後の'/'を取り除いたパターン
+
+        Returns:
+            str: 正規表現
+        """
+        i, n = 0, len(pattern)
+        parts:list[str] = []
+        while i < n:
+            c = pattern[i]
+            if pattern.startswith("**/", i):
+                parts.append("(?:.*/)?")
+                i += 3
+                continue
+            if pattern.startswith("**", i):
+                parts.append(".*")
+                i += 2
+                continue
+
+            if c == "*":
+                parts.append("[^/]*")
+            elif c == "?":
+                parts.append("[^/]")
+            elif c == "\\" and i + 1 < n:
+                parts.append(re.escape(pattern[i+1]))
+                i += 1
+            elif c == "[" and (end:=pattern.find("]", i + 2)) >= 0:
+                body = pattern[i+1:end].replace("\\", "\\\\")
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                parts.append(f"[{body}]")
+                i = end
+            else:
+                parts.append(re.escape(c))
+            i += 1
+        return "".join(parts)
+
+    def add_literal(self, path:str, dir_only:bool, anchored:bool) -> None:
+        """globを含まないパターンを集合とプレフィックス木に追加
+
+        Args:
+            path (str): 前後の'/'を取り除いたパス
+            dir_only (bool): ディレクトリのみ
+            anchored (bool): 入力ディレクトリからの相対パス
+        """
+        if not anchored:
+            self.excluded_dir_names.add(path)
+            if not dir_only:
+                self.excluded_file_names.add(path)
+            return
+
+        if not dir_only:
+            self.excluded_file_paths.add(path)
+
+        # 途中で除外済みのディレクトリに行き当たった場合は追加不要
+        node = self.root_node
+        *parents, name = path.split("/")
+        for parent in parents:
+            if parent not in node:
+                node[parent] = {}
+            if (node:=node[parent]) is None:
+                return
+        node[name] = None
+
+    def relative_path(self, root_length:int, entry:os.DirEntry) -> Optional[str]:
+        """比較に必要な場合のみ入力ディレクトリからの相対パスを生成
+
+        Args:
+            root_length (int): 入力ディレクトリのパスの文字数 (区切り文字を含む)
+            entry (os.DirEntry): ファイル・ディレクトリ
+
+        Returns:
+            Optional[str]: '/'区切りの相対パス. 不要な場合はNoneを返します。
+        """
+        if not self.needs_relative_path:
+            return None
+        relative_path = entry.path[root_length:]
+        return relative_path if os.sep == "/" else relative_path.replace(os.sep, "/")
+
+    def is_excluded_by_rules(self, name:str, relative_path:Optional[str], is_dir:bool) -> bool:
+        excluded = False
+        for rule in self.rules:
+            # 結果が変わらないパターンは比較を省略
+            if rule.negate == excluded and rule.is_match(name, relative_path, is_dir):
+                excluded = not excluded
+        return excluded
+
+    def enter_dir(self, entry:os.DirEntry, node:Optional[dict], root_length:int) -> tuple[bool, Optional[dict]]:
+        """ディレクトリを走査するか判定
+
+        Args:
+            entry (os.DirEntry): ディレクトリ
+            node (Optional[dict]): 親ディレクトリのプレフィックス木の節. 木から外れた場合はNone
+            root_length (int): 入力ディレクトリのパスの文字数 (区切り文字を含む)
+
+        Returns:
+            tuple[bool, Optional[dict]]: 走査する場合はTrueとディレクトリの節を返します。
+        """
+        name = entry.name
+        if name in self.excluded_dir_names:
+            return False, None
+
+        child:Optional[dict] = None
+        if node is not None and name in node:
+            if (child:=node[name]) is None:
+                return False, None
+
+        if len(self.rules) > 0 and self.is_excluded_by_rules(name, self.relative_path(root_length, entry), True):
+            return False, None
+
+        return True, child
+
+    def is_candidate(self, name:str) -> bool:
+        """走査対象のファイル名か判定
+
+        対象の拡張子 && ファイル名に1つの拡張子(.gen.xxxを省きたい)
+
+        Args:
+            name (str): ファイル名
+
+        Returns:
+            bool: 走査対象の場合はTrueを返します。
+        """
+        # Path.suffixesと同様に先頭のドットは拡張子として扱わない
+        stem, dot, extension = name.lstrip(".").rpartition(".")
+        return dot != "" and "." not in stem and extension in self.extensions
+
+    def accepts_file(self, entry:os.DirEntry, root_length:int) -> bool:
+        """拡張子以外の条件で走査対象のファイルか判定
+
+        is_candidateで拡張子を判定済みのファイルのみ渡してください。
+
+        Args:
+            entry (os.DirEntry): ファイル
+            root_length (int): 入力ディレクトリのパスの文字数 (区切り文字を含む)
+
+        Returns:
+            bool: 走査対象の場合はTrueを返します。
+        """
+        name = entry.name
+        if name in self.excluded_file_names:
+            return False
+
+        relative_path = self.relative_path(root_length, entry)
+        if relative_path is not None and relative_path in self.excluded_file_paths:
+            return False
+
+        if len(self.rules) > 0 and self.is_excluded_by_rules(name, relative_path, False):
+            return False
+
+        # statは最後 (DirEntryにキャッシュされて走査で再利用します)
+        return self.max_size is None or self.accepts_size(entry.stat().st_size)
+
+    def accepts_size(self, size:int) -> bool:
+        """走査するファイルサイズか判定
+
+        Args:
+            size (int): ファイルサイズ
+
+        Returns:
+            bool: 走査対象の場合はTrueを返します。
+        """
+        return self.max_size is None or size <= self.max_size
+
+    def accepts_relative_path(self, relative_path:str) -> bool:
+        """入力ディレクトリからの相対パスで走査対象のファイルか判定
+
+        ディレクトリを走査せずに列挙したファイル向けに、親ディレクトリの条件も合わせて判定します。
+        ファイルサイズは判定しません。
+
+        Args:
+            relative_path (str): '/'区切りの相対パス
+
+        Returns:
+            bool: 走査対象の場合はTrueを返します。
+        """
+        *parents, name = relative_path.split("/")
+        if not self.is_candidate(name):
+            return False
+
+        node:Optional[dict] = self.root_node
+        for i, parent in enumerate(parents):
+            if parent in self.excluded_dir_names:
+                return False
+
+            if node is not None and parent in node:
+                if (node:=node[parent]) is None:
+                    return False
+            else:
+                node = None
+
+            if len(self.rules) > 0 and self.is_excluded_by_rules(parent, "/".join(parents[:i+1]), True):
+                return False
+
+        if name in self.excluded_file_names or relative_path in self.excluded_file_paths:
+            return False
+
+        return len(self.rules) == 0 or not self.is_excluded_by_rules(name, relative_path, False)
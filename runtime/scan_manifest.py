@@ -0,0 +1,226 @@
+import os
+import json
+import threading as th
+from pathlib import Path
+from typing import Optional, Iterable, Any
+
+
+__all__ = [
+    "ScanManifest",
+]
+
+
+class ScanManifest:
+    """走査結果のマニフェスト
+
+    走査したファイルのサイズ, 更新日時(ns), inode(Windows以外)と検索結果のマスクを記録します。
+    次回の出力ではstatが一致するファイルを開かずに前回の判定結果を再利用します。
+    また、出力先から不要になったファイルを削除するために出力したファイルを記録します。
+
+    中断やエラーで途中まで走査した場合はチェックポイントとして保存し、次回は処理済みのファイルを開かずに再開します。
+    """
+    VERSION = 2
+    FILENAME = ".difference_exporter_manifest.json"
+
+    # inodeを署名に含めない (WindowsのDirEntry.statはinodeを取得しない)
+    IGNORE_INODE = os.name == "nt"
+
+    def __init__(self, path:Path, input_dir:Path, tag:Any) -> None:
+        """コンストラクタ
+
+        Args:
+            path (Path): マニフェストのパス
+            input_dir (Path): 入力・コピー元ディレクトリ
+            tag (Any): 検索内容 (JSONに変換できる値)
+        """
+        self.path = Path(path)
+        self.input_dir = str(Path(input_dir).absolute())
+        self.tag = tag
+
+        # 前回の走査結果
+        self.previous:dict[str, list] = {}
+
+        # 今回の走査結果 (保存時に前回の走査結果を置き換えます)
+        self.entries:dict[str, list] = {}
+
+        # コピーの完了待ちの判定結果 (コピーできなかったファイルは保存せず次回も走査)
+        self.pending:dict[str, list] = {}
+
+        # 前回までに出力したファイル (出力ディレクトリからの相対パス)
+        self.exported:set[str] = set()
+
+        # 前回の走査が途中で中断したか (チェックポイント)
+        self.interrupted = False
+
+        self.lock = th.Lock()
+
+    @staticmethod
+    def signature(stat:os.stat_result) -> list[int]:
+        """ファイルの変更検知に用いる署名を取得
+
+        WindowsのDirEntry.statはinodeが常に0で、os.statとは一致しないのでinodeを比較しません。
+        (列挙したDirEntryとgitの差分のパスのどちらで走査しても同じ署名にします)
+
+        Args:
+            stat (os.stat_result): ファイルのstat (os.stat, またはDirEntry.stat)
+
+        Returns:
+            list[int]: サイズ, 更新日時(ns), inode (Windowsでは0)
+        """
+        return [stat.st_size, stat.st_mtime_ns, 0 if ScanManifest.IGNORE_INODE else stat.st_ino]
+
+    def load(self) -> bool:
+        """マニフェストを読み込み
+
+        入力ディレクトリや検索内容が異なるマニフェストは破棄します。
+
+        Returns:
+            bool: 前回の走査結果を読み込めた場合はTrueを返します。
+        """
+        try:
+            with open(str(self.path), mode="r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if not isinstance(data, dict):
+            return False
+        if data.get("version") != self.VERSION:
+            return False
+
+        # 出力したファイルは入力ディレクトリや検索内容に依らず出力先に残っています
+        if isinstance((exported:=data.get("exported")), list):
+            self.exported = set(exported)
+
+        if data.get("input_dir") != self.input_dir or data.get("tag") != self.tag:
+            return False
+        if not isinstance((entries:=data.get("entries")), dict):
+            return False
+
+        self.previous = entries
+        self.interrupted = data.get("interrupted") is True
+        return True
+
+    def save(self, exported:Optional[Iterable[str]] = None, interrupted:bool = False) -> None:
+        """マニフェストを保存
+
+        書き込み途中で中断しても壊れないように一時ファイルから置き換えます。
+        途中で中断した場合は今回走査しなかったファイルの前回の走査結果も残します。
+
+        Args:
+            exported (Optional[Iterable[str]], optional): 出力したファイル. Noneの場合は前回から変更しません. Defaults to None.
+            interrupted (bool, optional): 走査が途中で中断した (チェックポイントとして保存). Defaults to False.
+        """
+        if exported is None:
+            exported = self.exported
+
+        with self.lock:
+            data = {
+                "version": self.VERSION,
+                "input_dir": self.input_dir,
+                "tag": self.tag,
+                "entries": {**self.previous, **self.entries} if interrupted else self.entries,
+                "exported": sorted(exported),
+                "interrupted": interrupted,
+            }
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(str(tmp_path), mode="w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(str(tmp_path), str(self.path))
+
+    def lookup(self, key:str, stat:os.stat_result) -> Optional[int]:
+        """前回の判定結果を取得
+
+        Args:
+            key (str): 入力ディレクトリからの相対パス
+            stat (os.stat_result): ファイルのstat
+
+        Returns:
+            Optional[int]: statが一致する場合は前回の検索結果のマスク, それ以外はNoneを返します。
+        """
+        if (entry:=self.previous.get(key)) is None:
+            return None
+        if entry[:3] != ScanManifest.signature(stat):
+            return None
+        return entry[3]
+
+    def update(self, key:str, stat:os.stat_result, mask:int) -> None:
+        """判定結果を記録
+
+        Args:
+            key (str): 入力ディレクトリからの相対パス
+            stat (os.stat_result): ファイルのstat
+            mask (int): 検索結果のマスク
+        """
+        entry = ScanManifest.signature(stat) + [mask]
+        with self.lock:
+            self.entries[key] = entry
+
+    def defer(self, key:str, stat:os.stat_result, mask:int) -> None:
+        """コピーが必要なファイルの判定結果をコピーの完了まで保留
+
+        commitするまでは保存しないので、コピーに失敗したファイルや中断で破棄したファイルは次回も走査してコピーします。
+
+        Args:
+            key (str): 入力ディレクトリからの相対パス
+            stat (os.stat_result): ファイルのstat
+            mask (int): 検索結果のマスク
+        """
+        entry = ScanManifest.signature(stat) + [mask]
+        with self.lock:
+            self.pending[key] = entry
+
+    def commit(self, key:str) -> None:
+        """コピーが完了したファイルの保留中の判定結果を記録
+
+        Args:
+            key (str): 入力ディレクトリからの相対パス
+        """
+        with self.lock:
+            if (entry:=self.pending.pop(key, None)) is not None:
+                self.entries[key] = entry
+
+    def remove(self, key:str) -> None:
+        """削除されたファイルの判定結果を破棄
+
+        Args:
+            key (str): 入力ディレクトリからの相対パス
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+            self.pending.pop(key, None)
+
+    def remove_tree(self, key:str) -> None:
+        """削除・移動されたディレクトリ以下の判定結果を破棄
+
+        Args:
+            key (str): 入力ディレクトリからのディレクトリの相対パス
+        """
+        prefix = f"{key}/"
+        with self.lock:
+            for entries in (self.entries, self.pending):
+                for entry_key in [entry_key for entry_key in entries if entry_key.startswith(prefix)]:
+                    del entries[entry_key]
+
+    def merge(self, entries:dict[str, list], pending:Optional[dict[str, list]] = None) -> None:
+        """別のワーカーで記録した判定結果を反映
+
+        Args:
+            entries (dict[str, list]): 判定結果
+            pending (Optional[dict[str, list]], optional): コピーの完了待ちの判定結果. Defaults to None.
+        """
+        with self.lock:
+            self.entries.update(entries)
+            if pending is not None:
+                self.pending.update(pending)
+
+    def edited_entries(self) -> dict[str, int]:
+        """今回の走査で検索内容を含むと判定したファイルを取得
+
+        Returns:
+            dict[str, int]: 入力ディレクトリからの相対パスと検索結果のマスク
+        """
+        with self.lock:
+            return {key: entry[3] for key, entry in self.entries.items() if entry[3]}
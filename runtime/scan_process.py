@@ -0,0 +1,128 @@
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Optional
+
+from runtime.baseline_index import *
+from runtime.diff_export_info import *
+from runtime.digest_cache import *
+from runtime.export_profiler import *
+from runtime.export_stats import *
+from runtime.file_scanner import *
+from runtime.memory_budget import *
+from runtime.output_writer import *
+from runtime.scan_manifest import *
+
+
+__all__ = [
+    "ScanBatchResult",
+    "init_scan_process",
+    "scan_batch",
+]
+
+
+@dataclass
+class ScanBatchResult:
+    """パスのまとまりの走査結果
+    """
+    # コピーが必要なファイルパスと検索結果のマスク (走査と合わせてコピーした場合は空)
+    matched_paths:list[tuple[str, int]] = field(default_factory=list)
+    # 走査結果のマニフェストに反映する判定結果
+    entries:dict[str, list] = field(default_factory=dict)
+    # コピーの完了待ちの判定結果 (親プロセスのコピー後に記録)
+    pending:dict[str, list] = field(default_factory=dict)
+    # ハッシュ値のキャッシュに反映するハッシュ値
+    digests:dict[str, list] = field(default_factory=dict)
+    # 差分出力の集計
+    stats:ExportStats = field(default_factory=ExportStats)
+    # 処理ごとの計測の区間とスレッド名 (計測しない場合は空)
+    spans:list[tuple] = field(default_factory=list)
+    thread_names:dict[tuple[int, int], str] = field(default_factory=dict)
+
+
+# プロセスごとのスキャナー
+scanner:Optional[FileScanner] = None
+
+# プロセスごとのコピー
+writer:Optional[OutputWriter] = None
+
+
+def init_scan_process(
+    info:DiffExportInfo,
+    previous_entries:Optional[dict[str, list]],
+    digest_entries:Optional[dict[str, list]],
+    baseline_entries:Optional[dict[str, list]] = None,
+) -> None:
+    """走査プロセスの初期化
+
+    ProcessPoolExecutorのinitializerとして各プロセスで1回だけ実行します。
+
+    Args:
+        info (DiffExportInfo): 差分出力情報
+        previous_entries (Optional[dict[str, list]]): 前回の走査結果. 差分出力しない場合はNone.
+        digest_entries (Optional[dict[str, list]]): 出力先のファイルのハッシュ値. ハッシュ値で比較しない場合はNone.
+        baseline_entries (Optional[dict[str, list]], optional): 改変前のファイルのサイズとハッシュ値. 比較しない場合はNone. Defaults to None.
+    """
+    global scanner, writer
+
+    manifest:Optional[ScanManifest] = None
+    if previous_entries is not None:
+        manifest = ScanManifest(info.manifest_path, info.input_dir, info.search_key)
+        manifest.previous = previous_entries
+
+    digest_cache:Optional[DigestCache] = None
+    if digest_entries is not None:
+        digest_cache = DigestCache(info.digest_cache_path)
+        digest_cache.entries = digest_entries
+
+    baseline:Optional[BaselineIndex] = None
+    if baseline_entries is not None:
+        baseline = BaselineIndex(info.baseline_path)
+        baseline.entries = baseline_entries
+
+    # 走査と合わせてコピーする場合のみ内容を保持 (メモリの上限はプロセス数で等分)
+    budget:Optional[MemoryBudget] = None
+    if info.backend == BACKEND_PROCESS and info.archive_path is None:
+        budget = info.create_memory_budget(info.num_workers)
+
+    profiler = ExportProfiler() if info.profiling else None
+
+    stats = ExportStats()
+    scanner = FileScanner(info, manifest, stats, budget, profiler, baseline)
+    writer = OutputWriter(info, stats, digest_cache, budget, profiler, manifest)
+
+
+def scan_batch(paths:list[str], copy:bool) -> ScanBatchResult:
+    """パスのまとまりを走査
+
+    Args:
+        paths (list[str]): 入力ディレクトリ内のファイルパス
+        copy (bool): 走査と合わせてコピーも行う場合はTrue
+
+    Returns:
+        ScanBatchResult: 走査結果
+    """
+    result = ScanBatchResult()
+
+    for path in paths:
+        mask, data = scanner.scan((path:=Path(path)))
+        if mask != 0:
+            if copy:
+                writer.write(path, mask, data)
+            else:
+                result.matched_paths.append((str(path), mask))
+
+    # 親プロセスに反映するので返却後は破棄
+    if scanner.manifest is not None:
+        result.entries, scanner.manifest.entries = scanner.manifest.entries, {}
+        result.pending, scanner.manifest.pending = scanner.manifest.pending, {}
+
+    if writer.digest_cache is not None:
+        result.digests, writer.digest_cache.updated = writer.digest_cache.updated, {}
+
+    if scanner.profiler is not None:
+        result.spans, result.thread_names = scanner.profiler.drain()
+
+    result.stats = writer.stats
+    writer.stats = scanner.stats = ExportStats()
+
+    return result
@@ -0,0 +1,407 @@
+import os
+import json
+import stat
+import queue
+import secrets
+import threading as th
+import dataclasses
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from typing import Any, Optional, Union
+
+from runtime.diff_export_info import *
+from runtime.difference_exporter import *
+from runtime.digest_cache import *
+from runtime.export_stats import *
+from runtime.file_watcher import *
+from runtime.output_writer import *
+from runtime.scan_manifest import *
+from runtime.tag_matcher import *
+
+
+__all__ = [
+    "DEFAULT_DAEMON_ADDRESS",
+    "DEFAULT_DAEMON_AUTHKEY_PATH",
+    "load_daemon_authkey",
+    "TagIndexDaemon",
+    "TagIndexClient",
+]
+
+
+# 常駐プロセスの待ち受けアドレス (ローカルのみ)
+DEFAULT_DAEMON_ADDRESS = ("127.0.0.1", 47611)
+
+# 常駐プロセスへの接続の認証キーを保存するパス (ユーザーごと)
+DEFAULT_DAEMON_AUTHKEY_PATH = Path.home() / ".difference_exporter_daemon_key"
+
+# 要求1つの最大サイズ
+MAX_REQUEST_SIZE = 1024 * 1024
+
+
+def load_daemon_authkey(path:Union[str, Path] = DEFAULT_DAEMON_AUTHKEY_PATH, create:bool = False) -> bytes:
+    """常駐プロセスへの接続の認証キーを読み込み
+
+    認証キーはユーザーごとに乱数で生成し、所有者のみが読み書きできるファイルに保存します。
+    同じポートに接続できる他のユーザーやプロセスは認証キーを読めないので要求を送れません。
+
+    Args:
+        path (Union[str, Path], optional): 認証キーのパス. Defaults to DEFAULT_DAEMON_AUTHKEY_PATH.
+        create (bool, optional): 存在しない場合は生成 (常駐プロセスの起動時). Defaults to False.
+
+    Raises:
+        FileNotFoundError: 認証キーが無い (常駐プロセスが起動していない)
+        PermissionError: 所有者以外も読み書きできる認証キー
+
+    Returns:
+        bytes: 認証キー
+    """
+    path = Path(path)
+
+    if create:
+        try:
+            fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, mode="wb") as f:
+                f.write(secrets.token_hex(32).encode("ascii"))
+
+    # Windowsはユーザーのホームディレクトリのアクセス権で保護
+    if os.name != "nt":
+        stat_result = os.stat(str(path))
+        if stat_result.st_uid != os.getuid() or stat_result.st_mode & 0o077:
+            raise PermissionError(f"authkey must be readable only by its owner: {path}")
+
+    with open(str(path), mode="rb") as f:
+        authkey = f.read().strip()
+
+    if len(authkey) == 0:
+        raise PermissionError(f"empty authkey: {path}")
+    return authkey
+
+
+class TagIndexDaemon:
+    """検索内容を含むファイルの索引を常駐して維持
+
+    起動時に1回だけ入力ディレクトリを走査して索引(走査結果のマニフェストと同じ形式)を構築し、
+    以降は変更を検知したファイルのみを走査し直します。
+    差分出力は索引にある一致したファイルをコピーするだけで、走査は行いません。
+
+    索引を保存した場合は次回の起動時にstatが一致するファイルの走査も省略します。
+    """
+    def __init__(
+        self,
+        info:DiffExportInfo,
+        index_path:Optional[Union[str, Path]] = None,
+        poll_interval:float = 5.0,
+        use_inotify:bool = True,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            info (DiffExportInfo): 差分出力情報 (output_dirは出力ごとに指定するので使いません)
+            index_path (Optional[Union[str, Path]], optional): 索引を保存するパス. Noneの場合は保存しません. Defaults to None.
+            poll_interval (float, optional): inotifyが使えない場合に全体を再確認する間隔(秒). Defaults to 5.0.
+            use_inotify (bool, optional): inotifyが使える場合は使う. Defaults to True.
+        """
+        self.info = info
+        self.index_path = None if index_path is None else Path(index_path)
+        self.manifest = ScanManifest(Path(ScanManifest.FILENAME) if self.index_path is None else self.index_path, info.input_dir, info.search_key)
+        self.watcher = create_file_watcher(str(info.input_dir), info.path_filter, poll_interval, use_inotify)
+
+        # 変更の反映と全体の再確認を直列化
+        self.update_lock = th.RLock()
+
+        # 常駐の終了の通知
+        self.stop_event = th.Event()
+
+        # 変更を検知したファイルの検索 (監視スレッドのみで使用)
+        self.matcher = info.create_matcher()
+
+    def load(self) -> bool:
+        """保存した索引を読み込み
+
+        Returns:
+            bool: 読み込めた場合はTrueを返します。
+        """
+        loaded = self.index_path is not None and self.manifest.load()
+
+        # 前回の判定結果と今回の判定結果を同じ辞書にして、statが一致するファイルの走査を省略
+        self.manifest.entries = self.manifest.previous
+        return loaded
+
+    def save(self) -> None:
+        """索引を保存
+        """
+        if self.index_path is not None:
+            self.manifest.save()
+
+    def update_file(self, path:str, matcher:TagMatcher, stat_result:Optional[os.stat_result] = None) -> None:
+        """ファイル1つの判定結果を更新
+
+        Args:
+            path (str): 入力ディレクトリ内のファイルパス
+            matcher (TagMatcher): 検索内容の検索 (スレッドごと)
+            stat_result (Optional[os.stat_result], optional): ファイルのstat. 未取得の場合はNone. Defaults to None.
+        """
+        key = self.info.relative_key(Path(path))
+        if not self.info.path_filter.accepts_relative_path(key):
+            return
+
+        try:
+            if stat_result is None:
+                stat_result = os.stat(path)
+        except OSError:
+            self.manifest.remove(key)
+            return
+
+        if not stat.S_ISREG(stat_result.st_mode) or not self.info.path_filter.accepts_size(stat_result.st_size):
+            self.manifest.remove(key)
+            return
+
+        if self.manifest.lookup(key, stat_result) is not None:
+            return
+
+        self.manifest.update(key, stat_result, matcher.search(Path(path)))
+
+    def update_files(self, paths:Optional[set[str]]) -> None:
+        """変更を検知したファイルの判定結果を更新
+
+        Args:
+            paths (Optional[set[str]]): 変更を検知したファイルパス. Noneの場合は全体を再確認します.
+        """
+        if paths is None:
+            self.resync()
+            return
+
+        with self.update_lock:
+            # 削除・移動されたディレクトリを先に破棄し、同じ名前で作り直されたファイルは後で判定
+            for path in paths:
+                if path.endswith(os.sep):
+                    self.manifest.remove_tree(self.info.relative_key(Path(path)))
+            for path in paths:
+                if not path.endswith(os.sep):
+                    self.update_file(path, self.matcher)
+
+    def resync(self) -> None:
+        """入力ディレクトリ全体を走査して索引を更新
+
+        statが一致するファイルは開かずに前回の判定結果を使います。
+        """
+        def update_chunk(chunk:list[os.DirEntry]) -> list[str]:
+            matcher = self.info.create_matcher()
+            keys:list[str] = []
+            for entry in chunk:
+                try:
+                    self.update_file(entry.path, matcher, entry.stat())
+                except OSError:
+                    continue
+                keys.append(self.info.relative_key(Path(entry.path)))
+            return keys
+
+        with self.update_lock:
+            seen:set[str] = set()
+            with ThreadPoolExecutor(max_workers=self.info.num_workers) as executor:
+                for keys in executor.map(update_chunk, self.info.create_walker(self.stop_event).walk_chunks(self.info.chunk_size)):
+                    seen.update(keys)
+
+            # 中断した場合は見ていないファイルを削除しない
+            if self.stop_event.is_set():
+                return
+
+            for key in set(self.manifest.entries) - seen:
+                self.manifest.remove(key)
+
+    def status(self) -> dict[str, Any]:
+        """索引の状態を取得
+
+        Returns:
+            dict[str, Any]: 索引の状態
+        """
+        return {
+            "input_dir": str(self.info.input_dir),
+            "watcher": type(self.watcher).__name__,
+            "files": len(self.manifest.entries),
+            "matched": len(self.manifest.edited_entries()),
+        }
+
+    def export(self, output_dir:Union[str, Path], sync_mode:str = SYNC_STAT) -> ExportSnapshot:
+        """索引にある一致したファイルを出力先にコピー
+
+        Args:
+            output_dir (Union[str, Path]): 出力・コピー先ディレクトリ
+            sync_mode (str, optional): 出力先と同一のファイルのコピーを省略する方式 (SYNC_MODES). Defaults to SYNC_STAT.
+
+        Raises:
+            ValueError: 不正な出力先, または同期方式
+
+        Returns:
+            ExportSnapshot: 差分出力の集計
+        """
+        if not DifferenceExporter.is_valid_directory(output_dir):
+            raise ValueError(f"invalid output directory: {output_dir}")
+        if Path(output_dir).absolute() == self.info.input_dir.absolute():
+            raise ValueError("output directory is the input directory")
+
+        info = dataclasses.replace(self.info, output_dir=Path(output_dir), sync_mode=sync_mode)
+
+        digest_cache:Optional[DigestCache] = None
+        if info.sync_mode == SYNC_HASH:
+            digest_cache = DigestCache(info.digest_cache_path)
+            digest_cache.load()
+
+        stats = ExportStats()
+        writer = OutputWriter(info, stats, digest_cache)
+
+        edited_entries = self.manifest.edited_entries()
+        stats.add(discovered=len(edited_entries), scanned=len(edited_entries), matched=len(edited_entries))
+        stats.finish_walk()
+
+        copy_queue = queue.Queue(maxsize=info.copy_queue_size)
+        errors:list[BaseException] = []
+        stop_event = th.Event()
+
+        copy_threads = DifferenceExporter.start_copy_workers(info, copy_queue, writer, errors, stop_event)
+        try:
+            for key, mask in edited_entries.items():
+                if stop_event.is_set():
+                    break
+                copy_queue.put((info.input_dir / key, mask))
+        finally:
+            DifferenceExporter.stop_workers(copy_queue, copy_threads)
+
+        if digest_cache is not None:
+            digest_cache.save()
+
+        stats.finish()
+        if len(errors) > 0:
+            raise errors[0]
+        return stats.snapshot()
+
+    def handle(self, request:Any) -> dict[str, Any]:
+        """クライアントからの要求を処理
+
+        Args:
+            request (Any): JSONから変換した {"command": "status" | "export" | "rescan" | "stop", ...}
+
+        Returns:
+            dict[str, Any]: 応答
+        """
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "invalid request"}
+
+        command = request.get("command")
+        try:
+            if command == "status":
+                return {"ok": True, **self.status()}
+            if command == "export":
+                snapshot = self.export(request["output_dir"], request.get("sync_mode", SYNC_STAT))
+                return {"ok": True, **snapshot.to_dict()}
+            if command == "rescan":
+                self.resync()
+                self.save()
+                return {"ok": True, **self.status()}
+            if command == "stop":
+                self.stop_event.set()
+                return {"ok": True}
+        except (OSError, ValueError, KeyError) as e:
+            return {"ok": False, "error": repr(e)}
+
+        return {"ok": False, "error": f"unknown command: {command}"}
+
+    def handle_bytes(self, message:bytes) -> bytes:
+        """JSONで受け取った要求を処理してJSONで応答
+
+        pickleは受け取らないので、要求から任意のオブジェクトは復元されません。
+
+        Args:
+            message (bytes): UTF-8のJSONの要求
+
+        Returns:
+            bytes: UTF-8のJSONの応答
+        """
+        try:
+            request = json.loads(message.decode("utf-8"))
+        except ValueError:
+            request = None
+        return json.dumps(self.handle(request), ensure_ascii=False).encode("utf-8")
+
+    def serve(self, address:tuple[str, int] = DEFAULT_DAEMON_ADDRESS, authkey:Optional[bytes] = None) -> None:
+        """索引を構築して要求を待ち受け
+
+        stopの要求を受けるまで戻りません。要求は1つずつ順に処理します。
+
+        Args:
+            address (tuple[str, int], optional): 待ち受けるアドレス. Defaults to DEFAULT_DAEMON_ADDRESS.
+            authkey (Optional[bytes], optional): 認証キー. Noneの場合はDEFAULT_DAEMON_AUTHKEY_PATHから読み込み (無ければ生成). Defaults to None.
+        """
+        if authkey is None:
+            authkey = load_daemon_authkey(create=True)
+
+        self.load()
+
+        # 索引の構築中の変更も取りこぼさないように先に監視を開始
+        watcher_thread = th.Thread(target=self.watcher.run, args=(self.update_files, self.stop_event), daemon=True)
+        watcher_thread.start()
+
+        try:
+            self.resync()
+            self.save()
+
+            with Listener(address, authkey=authkey) as listener:
+                while not self.stop_event.is_set():
+                    try:
+                        with listener.accept() as connection:
+                            connection.send_bytes(self.handle_bytes(connection.recv_bytes(MAX_REQUEST_SIZE)))
+                    except (OSError, EOFError, AuthenticationError):
+                        continue
+        finally:
+            self.stop_event.set()
+            watcher_thread.join()
+            self.save()
+
+
+class TagIndexClient:
+    """常駐プロセスへの要求
+    """
+    def __init__(self, address:tuple[str, int] = DEFAULT_DAEMON_ADDRESS, authkey:Optional[bytes] = None) -> None:
+        """コンストラクタ
+
+        Args:
+            address (tuple[str, int], optional): 常駐プロセスのアドレス. Defaults to DEFAULT_DAEMON_ADDRESS.
+            authkey (Optional[bytes], optional): 認証キー. Noneの場合はDEFAULT_DAEMON_AUTHKEY_PATHから読み込み. Defaults to None.
+        """
+        self.address = address
+        self.authkey = authkey
+
+    def request(self, command:str, **kwargs) -> dict[str, Any]:
+        """要求を送って応答を受け取る
+
+        Args:
+            command (str): status, export, rescan, stop
+
+        Raises:
+            OSError: 常駐プロセスに接続できない, または認証キーを読み込めない
+
+        Returns:
+            dict[str, Any]: 応答
+        """
+        if self.authkey is None:
+            self.authkey = load_daemon_authkey()
+
+        with Client(self.address, authkey=self.authkey) as connection:
+            connection.send_bytes(json.dumps({"command": command, **kwargs}, ensure_ascii=False).encode("utf-8"))
+            return json.loads(connection.recv_bytes().decode("utf-8"))
+
+    def status(self) -> dict[str, Any]:
+        return self.request("status")
+
+    def export(self, output_dir:str, sync_mode:str = SYNC_STAT) -> dict[str, Any]:
+        return self.request("export", output_dir=str(Path(output_dir).absolute()), sync_mode=sync_mode)
+
+    def rescan(self) -> dict[str, Any]:
+        return self.request("rescan")
+
+    def stop(self) -> dict[str, Any]:
+        return self.request("stop")
@@ -0,0 +1,408 @@
+import os
+import re
+import mmap
+import codecs
+import hashlib
+import locale
+from pathlib import Path
+from typing import BinaryIO, Iterator, Union, Sequence, Optional
+
+from runtime.export_profiler import *
+from runtime.memory_budget import *
+
+
+__all__ = [
+    "TagMatcher",
+]
+
+
+class TagMatcher:
+    """検索内容のバイト列検索
+
+    検索内容を事前にエンコードしておき、ファイルをデコードせずにバイト列のまま検索します。
+    BOMからUTF-16(LE/BE)を判別し、それ以外はUTF-8とシステム既定のエンコーディングで検索します。
+
+    複数の検索内容(文字列と正規表現)は1つの正規表現にまとめて1回の読み込みで検索します。
+    検索結果は検索内容の番号のビットを立てたマスクで返します。
+    """
+    CHUNK_SIZE = 1024 * 1024
+    MMAP_THRESHOLD = 4 * 1024 * 1024
+
+    # 正規表現がチャンクの境界を跨いで一致できる長さ
+    REGEX_OVERLAP = 4096
+
+    def __init__(
+        self,
+        tags:Union[str, Sequence[str]],
+        regexes:Sequence[str] = (),
+        chunk_size:int = CHUNK_SIZE,
+        mmap_threshold:int = MMAP_THRESHOLD,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            tags (Union[str, Sequence[str]]): 検索内容
+            regexes (Sequence[str], optional): 検索内容の正規表現 (行単位, 後方参照は使えません). Defaults to ().
+            chunk_size (int, optional): 1回に読み込むバイト数. Defaults to CHUNK_SIZE.
+            mmap_threshold (int, optional): メモリマップで検索するファイルサイズの下限. 0以下は無効. Defaults to MMAP_THRESHOLD.
+        """
+        self.tags = (tags, ) if isinstance(tags, str) else tuple(tags)
+        self.regexes = tuple(regexes)
+        self.chunk_size = max(1, chunk_size)
+        self.mmap_threshold = mmap_threshold
+
+        # これまでに読み込んだバイト数 (進捗の集計用)
+        self.bytes_read = 0
+
+        # ファイルを開く・検索する区間の計測 (計測しない場合はNone)
+        self.profiler:Optional[ExportProfiler] = None
+
+        # 直前にread_and_searchで読み込んだファイルのサイズ (開けない場合はNone) とハッシュ値 (計算しない場合はNone)
+        self.size:Optional[int] = None
+        self.digest:Optional[str] = None
+
+        # 検索内容の番号順の表示名
+        self.labels = self.tags + self.regexes
+        self.all_mask = (1 << len(self.labels)) - 1
+
+        # BOM無し・UTF-8のファイルはUTF-8とシステム既定のエンコーディングの両方で検索
+        encodings = ["utf-8"]
+        try:
+            if codecs.lookup((preferred:=locale.getpreferredencoding(False))).name != "utf-8":
+                encodings.append(preferred)
+        except LookupError:
+            pass
+
+        bytes_groups:list[bytes] = []
+        text_groups:list[str] = []
+        for tag in self.tags:
+            patterns:list[bytes] = []
+            for encoding in encodings:
+                try:
+                    if (pattern:=tag.encode(encoding)) not in patterns:
+                        patterns.append(pattern)
+                except UnicodeEncodeError:
+                    pass
+            bytes_groups.append(b"|".join(re.escape(pattern) for pattern in patterns))
+            text_groups.append(re.escape(tag))
+        for regex in self.regexes:
+            bytes_groups.append(regex.encode("utf-8"))
+            text_groups.append(regex)
+
+        # 一致した検索内容はグループ名(t<番号>)で判別
+        self.bytes_pattern = re.compile(b"|".join(b"(?P<t%d>%s)" % (i, group) for i, group in enumerate(bytes_groups)), re.MULTILINE)
+        self.text_pattern = re.compile("|".join(f"(?P<t{i}>{group})" for i, group in enumerate(text_groups)), re.MULTILINE)
+
+        # チャンクの境界を跨ぐ一致を拾うための重複 (エンコーディングによる長さの違いを見込んで多めに確保)
+        self.overlap = max([len(tag.encode("utf-8")) * 2 for tag in self.tags] + [0])
+        if len(self.regexes) > 0:
+            self.overlap = max(self.overlap, TagMatcher.REGEX_OVERLAP)
+
+    def labels_of(self, mask:int) -> list[str]:
+        """マスクから一致した検索内容を取得
+
+        Args:
+            mask (int): 検索結果のマスク
+
+        Returns:
+            list[str]: 一致した検索内容
+        """
+        return [label for i, label in enumerate(self.labels) if mask & (1 << i)]
+
+    def find_in(self, pattern:re.Pattern, buffer:Union[bytes, str, mmap.mmap], mask:int) -> int:
+        """バッファ内の検索
+
+        全ての検索内容が一致した時点で検索を終了します。
+
+        Args:
+            pattern (re.Pattern): 検索する正規表現
+            buffer (Union[bytes, str, mmap.mmap]): 検索対象のバッファ
+            mask (int): これまでの検索結果のマスク
+
+        Returns:
+            int: 検索結果のマスク
+        """
+        for m in pattern.finditer(buffer):
+            mask |= 1 << int(m.lastgroup[1:])
+            if mask == self.all_mask:
+                break
+        return mask
+
+    def search_chunks(self, pattern:re.Pattern, chunks:Iterator[Union[bytes, str]]) -> int:
+        """チャンク単位で検索
+
+        チャンクの境界を跨ぐ一致は末尾を重複させて拾います。
+
+        Args:
+            pattern (re.Pattern): 検索する正規表現
+            chunks (Iterator[Union[bytes, str]]): 検索対象のチャンク
+
+        Returns:
+            int: 検索結果のマスク
+        """
+        mask = 0
+        tail = None
+        for chunk in chunks:
+            buffer = chunk if tail is None else tail + chunk
+            if (mask:=self.find_in(pattern, buffer, mask)) == self.all_mask:
+                break
+            tail = buffer[max(0, len(buffer)-self.overlap):]
+        return mask
+
+    def read_chunks(self, f:BinaryIO, head:bytes, hasher:Optional["hashlib._Hash"] = None) -> Iterator[bytes]:
+        """ストリームをチャンク単位で読み込み
+
+        Args:
+            f (BinaryIO): バイナリモードで開いたストリーム
+            head (bytes): 読み込み済みの先頭のバイト列
+            hasher (Optional[hashlib._Hash], optional): 読み込んだチャンクで更新するハッシュ. Defaults to None.
+
+        Yields:
+            Iterator[bytes]: チャンク
+        """
+        self.bytes_read += len(head)
+        if hasher is not None:
+            hasher.update(head)
+        yield head
+        while (chunk:=f.read(self.chunk_size)):
+            self.bytes_read += len(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+            yield chunk
+
+    @staticmethod
+    def decode_chunks(chunks:Iterator[bytes]) -> Iterator[str]:
+        """UTF-16のチャンクを逐次デコード
+
+        Args:
+            chunks (Iterator[bytes]): BOM付きUTF-16のチャンク
+
+        Yields:
+            Iterator[str]: デコードしたチャンク
+        """
+        decoder = codecs.getincrementaldecoder("utf-16")(errors="replace")
+        for chunk in chunks:
+            if (text:=decoder.decode(chunk)):
+                yield text
+        if (text:=decoder.decode(b"", final=True)):
+            yield text
+
+    @staticmethod
+    def is_utf16(head:Union[bytes, mmap.mmap]) -> bool:
+        """BOMからUTF-16か判定
+
+        Args:
+            head (Union[bytes, mmap.mmap]): ファイル先頭のバイト列
+
+        Returns:
+            bool: UTF-16(LE/BE)の場合はTrueを返します。
+        """
+        return head[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+    def search_stream(self, f:BinaryIO, digest:bool = False) -> int:
+        """ストリームから検索内容を検索
+
+        チャンク単位で読み込み、全ての検索内容が一致した時点で読み込みを終了します。
+        UTF-16のファイルのみ逐次デコードして検索します。
+
+        Args:
+            f (BinaryIO): バイナリモードで開いたストリーム
+            digest (bool, optional): 一致しない場合(全て読み込んだ場合)は読み込んだチャンクからハッシュ値を計算. Defaults to False.
+
+        Returns:
+            int: 検索結果のマスク
+        """
+        hasher = hashlib.blake2b() if digest else None
+
+        # BOMの判別に最低限必要なバイト数は読み込む
+        head = f.read(max(self.chunk_size, 4))
+        chunks = self.read_chunks(f, head, hasher)
+
+        if TagMatcher.is_utf16(head):
+            mask = self.search_chunks(self.text_pattern, TagMatcher.decode_chunks(chunks))
+        else:
+            mask = self.search_chunks(self.bytes_pattern, chunks)
+
+        if hasher is not None and mask == 0:
+            self.digest = hasher.hexdigest()
+        return mask
+
+    def search_mmap(self, f:BinaryIO, digest:bool = False) -> int:
+        """メモリマップで検索内容を検索
+
+        ファイルをPythonのバイト列に読み込まずにページキャッシュ上で直接検索します。
+
+        Args:
+            f (BinaryIO): バイナリモードで開いたファイル
+            digest (bool, optional): 一致しない場合はページキャッシュ上でハッシュ値を計算. Defaults to False.
+
+        Returns:
+            int: 検索結果のマスク
+        """
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if TagMatcher.is_utf16(mm):
+                return self.search_stream(f, digest)
+            self.bytes_read += mm.size()
+            mask = self.find_in(self.bytes_pattern, mm, 0)
+            if digest and mask == 0:
+                self.digest = hashlib.blake2b(mm).hexdigest()
+            return mask
+
+    def search_bytes(self, data:bytes) -> int:
+        """読み込み済みのファイルの内容から検索内容を検索
+
+        Args:
+            data (bytes): ファイルの内容
+
+        Returns:
+            int: 検索結果のマスク
+        """
+        self.bytes_read += len(data)
+        if TagMatcher.is_utf16(data):
+            return self.find_in(self.text_pattern, data.decode("utf-16", errors="replace"), 0)
+        return self.find_in(self.bytes_pattern, data, 0)
+
+    def find_offsets_in(self, buffer:Union[bytes, mmap.mmap]) -> dict[str, list[int]]:
+        """ファイルの内容から全ての一致位置を検索
+
+        UTF-16のファイルはデコードして検索し、一致位置はファイル先頭(BOMを含む)からのバイト数に換算します。
+
+        Args:
+            buffer (Union[bytes, mmap.mmap]): ファイルの内容
+
+        Returns:
+            dict[str, list[int]]: 一致した検索内容ごとのファイル先頭からのバイト単位の位置
+        """
+        offsets:dict[str, list[int]] = {}
+        if not TagMatcher.is_utf16(buffer):
+            for m in self.bytes_pattern.finditer(buffer):
+                offsets.setdefault(self.labels[int(m.lastgroup[1:])], []).append(m.start())
+            return offsets
+
+        # 文字位置からバイト位置へは直前の一致からの差分だけエンコードして換算
+        text = bytes(buffer).decode("utf-16", errors="replace")
+        position, offset = 0, len(codecs.BOM_UTF16_LE)
+        for m in self.text_pattern.finditer(text):
+            offset += len(text[position:m.start()].encode("utf-16-le"))
+            position = m.start()
+            offsets.setdefault(self.labels[int(m.lastgroup[1:])], []).append(offset)
+        return offsets
+
+    def find_offsets(self, path:Path) -> dict[str, list[int]]:
+        """ファイルから全ての一致位置を検索
+
+        一致した全ての位置が必要なため、全ての検索内容が一致しても最後まで検索します。
+
+        Args:
+            path (Path): ファイルパス
+
+        Returns:
+            dict[str, list[int]]: 一致した検索内容ごとのファイル先頭からのバイト単位の位置. 開けないファイルは空の辞書を返します。
+        """
+        try:
+            with open(str(path), mode="rb") as f:
+                # 空のファイルはマップできません
+                if os.fstat(f.fileno()).st_size == 0:
+                    return {}
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    self.bytes_read += mm.size()
+                    return self.find_offsets_in(mm)
+        except (OSError, ValueError):
+            return {}
+
+    def read_and_search(self, path:Path, budget:Optional[MemoryBudget] = None, digest_size:Optional[int] = None) -> tuple[int, Optional[bytes]]:
+        """ファイルから検索内容を検索し、一致した小さいファイルは内容も返す
+
+        コピーで読み直さないように、保持できるサイズのファイルは1回で読み込んで検索します。
+        内容を返した場合は確保したバイト数の解放は呼び出し元で行ってください。
+
+        ファイルサイズがdigest_sizeと一致し検索内容に一致しない場合は、同じ読み込みでハッシュ値(BLAKE2b)も計算してself.digestに記録します。
+
+        Args:
+            path (Path): ファイルパス
+            budget (Optional[MemoryBudget], optional): 内容を保持するメモリの上限. Noneの場合は保持しません. Defaults to None.
+            digest_size (Optional[int], optional): ハッシュ値を計算するファイルサイズ. Noneの場合は計算しません. Defaults to None.
+
+        Returns:
+            tuple[int, Optional[bytes]]: 検索結果のマスクと, 一致した場合はファイルの内容. 開けないファイルは0を返します。
+        """
+        self.size = None
+        self.digest = None
+
+        profiler = self.profiler
+        try:
+            start = 0 if profiler is None else profiler.now()
+            with open(str(path), mode="rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                digest = digest_size is not None and digest_size == size
+
+                if profiler is not None:
+                    profiler.record("open", start, path)
+                    start = profiler.now()
+                    try:
+                        mask, data = self.read_and_search_file(f, size, budget, digest)
+                    finally:
+                        profiler.record("search", start, path)
+                else:
+                    mask, data = self.read_and_search_file(f, size, budget, digest)
+
+                self.size = size
+                return mask, data
+        except (OSError, ValueError):
+            self.digest = None
+            return 0, None
+
+    def read_and_search_file(self, f:BinaryIO, size:int, budget:Optional[MemoryBudget], digest:bool = False) -> tuple[int, Optional[bytes]]:
+        """開いたファイルから検索内容を検索 (read_and_search)
+
+        Args:
+            f (BinaryIO): バイナリモードで開いたファイル
+            size (int): ファイルサイズ
+            budget (Optional[MemoryBudget]): 内容を保持するメモリの上限
+            digest (bool, optional): 一致しない場合はハッシュ値を計算. Defaults to False.
+
+        Returns:
+            tuple[int, Optional[bytes]]: 検索結果のマスクと, 一致した場合はファイルの内容
+        """
+        if budget is not None and budget.acquire(size):
+            try:
+                data = f.read()
+                mask = self.search_bytes(data)
+                if digest and mask == 0:
+                    self.digest = hashlib.blake2b(data).hexdigest()
+            except BaseException:
+                budget.release(size)
+                raise
+
+            # 読み込み中に変更されたファイルは保持しない
+            if mask != 0 and len(data) == size:
+                return mask, data
+            budget.release(size)
+            return mask, None
+
+        # 大きいファイルはメモリマップ (空のファイルはマップできません)
+        if 0 < self.mmap_threshold <= size:
+            return self.search_mmap(f, digest), None
+        return self.search_stream(f, digest), None
+
+    def search(self, path:Path) -> int:
+        """ファイルから検索内容を検索
+
+        Args:
+            path (Path): ファイルパス
+
+        Returns:
+            int: 検索結果のマスク. 開けないファイルは0を返します。
+        """
+        return self.read_and_search(path)[0]
+
+    def is_match(self, path:Path) -> bool:
+        """ファイルが検索内容を含むか判定
+
+        Args:
+            path (Path): ファイルパス
+
+        Returns:
+            bool: いずれかの検索内容を含む場合はTrueを返します。
+        """
+        return self.search(path) != 0
@@ -0,0 +1,403 @@
+import os
+import json
+import math
+import queue
+import threading as th
+from pathlib import Path
+from typing import Optional
+
+from runtime.diff_export_info import *
+from runtime.export_stats import *
+
+
+__all__ = [
+    "DEFAULT_AUTOTUNE_INTERVAL",
+    "DEFAULT_AUTOTUNE_MAX_WORKERS",
+    "WorkerGate",
+    "WorkerSettings",
+    "WorkerTuner",
+]
+
+
+# 自動調整でワーカー数を見直す間隔(秒)
+DEFAULT_AUTOTUNE_INTERVAL = 1.0
+
+# 自動調整で増やすワーカー数(走査, コピーそれぞれ)の上限 (待ち時間の長いネットワーク共有を見込んでCPU数より多く)
+DEFAULT_AUTOTUNE_MAX_WORKERS = 64
+
+
+class WorkerGate:
+    """稼働するワーカー数の上限
+
+    ワーカーは上限の数だけ起動しておき、番号が稼働数以上のワーカーは稼働数が増えるまで待機します。
+    スレッドを作り直さずに実行中にワーカー数を増減できます。
+    """
+    def __init__(self, num_active:int, max_workers:int) -> None:
+        """コンストラクタ
+
+        Args:
+            num_active (int): 稼働するワーカー数
+            max_workers (int): 起動するワーカー数
+        """
+        self.max_workers = max(1, max_workers)
+        self.num_active = min(max(1, num_active), self.max_workers)
+        self.closed = False
+        self.condition = th.Condition()
+
+    def resize(self, num_active:int) -> int:
+        """稼働するワーカー数を変更
+
+        終了後は変更しません。
+
+        Args:
+            num_active (int): 稼働するワーカー数
+
+        Returns:
+            int: 変更後の稼働するワーカー数
+        """
+        with self.condition:
+            if not self.closed:
+                self.num_active = min(max(1, num_active), self.max_workers)
+                self.condition.notify_all()
+            return self.num_active
+
+    def wait(self, index:int) -> bool:
+        """ワーカーの番号が稼働数未満になるまで待機
+
+        Args:
+            index (int): ワーカーの番号
+
+        Returns:
+            bool: 稼働する場合はTrue, 終了した場合はFalseを返します。
+        """
+        with self.condition:
+            while index >= self.num_active and not self.closed:
+                self.condition.wait()
+            return index < self.num_active
+
+    def close(self) -> None:
+        """待機中のワーカーを終了
+
+        稼働中のワーカーはキューの終了通知まで処理を続けます。
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class WorkerSettings:
+    """ボリュームごとの自動調整したワーカー数
+
+    次回の差分出力は同じボリュームで前回落ち着いたワーカー数から調整を始めます。
+    """
+    VERSION = 1
+    FILENAME = ".difference_exporter_workers.json"
+
+    def __init__(self, path:Path) -> None:
+        """コンストラクタ
+
+        Args:
+            path (Path): 設定のパス
+        """
+        self.path = Path(path)
+
+        # ボリュームのマウントポイントと走査, コピーのワーカー数
+        self.entries:dict[str, list[int]] = {}
+
+    @staticmethod
+    def default_path() -> Path:
+        """既定の設定のパスを取得 (ユーザーのホームディレクトリ)
+
+        Returns:
+            Path: 設定のパス
+        """
+        return Path.home() / WorkerSettings.FILENAME
+
+    @staticmethod
+    def volume_of(path:Path) -> str:
+        """ファイルパスを含むボリュームのマウントポイントを取得
+
+        Args:
+            path (Path): ファイルパス
+
+        Returns:
+            str: マウントポイント
+        """
+        current = os.path.realpath(str(path))
+        while not os.path.ismount(current):
+            if (parent:=os.path.dirname(current)) == current:
+                break
+            current = parent
+        return current
+
+    def load(self) -> bool:
+        """設定を読み込み
+
+        Returns:
+            bool: 読み込めた場合はTrueを返します。
+        """
+        try:
+            with open(str(self.path), mode="r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            return False
+        if not isinstance((entries:=data.get("entries")), dict):
+            return False
+
+        self.entries = entries
+        return True
+
+    def save(self) -> None:
+        """設定を保存
+
+        書き込み途中で中断しても壊れないように一時ファイルから置き換えます。
+        """
+        data = {
+            "version": self.VERSION,
+            "entries": self.entries,
+        }
+
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(str(tmp_path), mode="w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(str(tmp_path), str(self.path))
+
+    def lookup(self, volume:str) -> Optional[tuple[int, int]]:
+        """ボリュームの前回のワーカー数を取得
+
+        Args:
+            volume (str): マウントポイント
+
+        Returns:
+            Optional[tuple[int, int]]: 走査とコピーのワーカー数. 記録が無い場合はNone
+        """
+        entry = self.entries.get(volume)
+        if not isinstance(entry, list) or len(entry) != 2 or not all(isinstance(value, int) for value in entry):
+            return None
+        return entry[0], entry[1]
+
+    def update(self, volume:str, num_workers:int, copy_workers:int) -> None:
+        """ボリュームのワーカー数を記録
+
+        Args:
+            volume (str): マウントポイント
+            num_workers (int): 走査のワーカー数
+            copy_workers (int): コピーのワーカー数
+        """
+        self.entries[volume] = [num_workers, copy_workers]
+
+
+class WorkerTuner:
+    """走査とコピーのワーカー数の自動調整
+
+    少ないワーカー数から始めて一定間隔で集計を計測し、実行中にワーカー数を増減します。
+
+    走査は1秒あたりに走査したファイル数が増える間はワーカーを増やし、増えなくなったら前の数に戻します。
+    減らしても変わらない場合は減らします (同時に読むと遅くなるHDDなど)。
+    落ち着いた後も入力の傾向が変わることがあるので、一定回数ごとに増減を試します。
+
+    コピーは1ファイルあたりのコピー時間と一致したファイルの発生頻度から必要な数を見積もります。
+    """
+    # 走査のワーカー数の初期値 (記録が無い場合)
+    INITIAL_WORKERS = 2
+
+    # スループットが変化したとみなす比率
+    TOLERANCE = 0.1
+
+    # 落ち着いた後に再び増減を試すまでの計測回数
+    PROBE_INTERVALS = 5
+
+    # コピーの見積もりに対する余裕
+    COPY_HEADROOM = 1.5
+
+    def __init__(
+        self,
+        info:DiffExportInfo,
+        stats:ExportStats,
+        max_workers:int = DEFAULT_AUTOTUNE_MAX_WORKERS,
+        interval:float = DEFAULT_AUTOTUNE_INTERVAL,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            info (DiffExportInfo): 差分出力情報
+            stats (ExportStats): 計測する差分出力の集計
+            max_workers (int, optional): 走査, コピーそれぞれのワーカー数の上限. Defaults to DEFAULT_AUTOTUNE_MAX_WORKERS.
+            interval (float, optional): ワーカー数を見直す間隔(秒). Defaults to DEFAULT_AUTOTUNE_INTERVAL.
+        """
+        self.stats = stats
+        self.interval = interval
+
+        self.settings = WorkerSettings(WorkerSettings.default_path() if info.autotune_path is None else info.autotune_path)
+        self.settings.load()
+        self.volume = WorkerSettings.volume_of(info.input_dir)
+
+        initial = self.settings.lookup(self.volume)
+        if initial is None:
+            initial = (WorkerTuner.INITIAL_WORKERS, WorkerTuner.INITIAL_WORKERS)
+
+        self.scan_gate = WorkerGate(initial[0], max_workers)
+        self.copy_gate = WorkerGate(initial[1], max_workers)
+        self.stats.record_workers(self.scan_gate.num_active, self.copy_gate.num_active)
+
+        # 前回の計測時の集計
+        self.last:Optional[ExportSnapshot] = None
+
+        # 比較元のワーカー数とスループット
+        self.previous:Optional[tuple[int, float]] = None
+
+        # 落ち着いてからの計測回数と, 次に試す方向
+        self.settled = 0
+        self.probe_up = True
+
+        # ワーカー数を見直したか (走査が律速でない短い差分出力は記録しない)
+        self.tuned = False
+
+        self.stop_event = th.Event()
+
+    @staticmethod
+    def step_of(num_workers:int) -> int:
+        """ワーカー数の増減幅を取得 (ワーカー数に比例)
+
+        Args:
+            num_workers (int): 現在のワーカー数
+
+        Returns:
+            int: 増減幅
+        """
+        return max(1, num_workers // 2)
+
+    def run(self, input_queue:queue.Queue, copy_queue:queue.Queue, copy_queue_size:int) -> None:
+        """一定間隔でワーカー数を見直すスレッド
+
+        Args:
+            input_queue (queue.Queue): 走査のワーカーのキュー
+            copy_queue (queue.Queue): コピーのワーカーのキュー
+            copy_queue_size (int): コピーのキューの上限
+        """
+        self.last = self.stats.snapshot()
+        while not self.stop_event.wait(self.interval):
+            self.sample(self.stats.snapshot(), input_queue.qsize(), copy_queue.qsize(), copy_queue_size)
+
+    def stop(self) -> None:
+        """見直しを終了
+        """
+        self.stop_event.set()
+
+    def sample(self, snapshot:ExportSnapshot, input_backlog:int, copy_backlog:int, copy_queue_size:int) -> None:
+        """前回からの集計の差分を計測してワーカー数を見直す
+
+        Args:
+            snapshot (ExportSnapshot): 現時点の集計
+            input_backlog (int): 走査待ちのまとまりの数
+            copy_backlog (int): コピー待ちのファイル数
+            copy_queue_size (int): コピーのキューの上限
+        """
+        last, self.last = self.last, snapshot
+        if last is None or (elapsed:=snapshot.elapsed - last.elapsed) <= 0.0:
+            return
+
+        # ディレクトリの走査が追いつかずワーカーが待機している間はスループットが入力で決まるので走査は見直さない
+        scanned = snapshot.scanned - last.scanned
+        if input_backlog > 0 and scanned > 0:
+            self.tune_scan(scanned / elapsed)
+
+        copied = (snapshot.copied + snapshot.skipped) - (last.copied + last.skipped)
+        if copied > 0:
+            latency = (snapshot.copy_time - last.copy_time) / copied
+            self.tune_copy((snapshot.matched - last.matched) / elapsed, latency, copy_backlog, copy_queue_size)
+
+        self.stats.record_workers(self.scan_gate.num_active, self.copy_gate.num_active)
+
+    def tune_scan(self, rate:float) -> None:
+        """走査のワーカー数を山登りで見直す
+
+        Args:
+            rate (float): 直前の間隔で1秒あたりに走査したファイル数
+        """
+        self.tuned = True
+        num_workers = self.scan_gate.num_active
+
+        if self.previous is None:
+            self.previous = (num_workers, rate)
+            self.scan_gate.resize(num_workers + WorkerTuner.step_of(num_workers))
+            return
+
+        previous_workers, previous_rate = self.previous
+
+        # 落ち着いている間は一定回数ごとに増減を試す
+        if num_workers == previous_workers:
+            self.previous = (num_workers, rate)
+            self.settled += 1
+            if self.settled < WorkerTuner.PROBE_INTERVALS:
+                return
+            self.settled = 0
+
+            step = WorkerTuner.step_of(num_workers)
+            if self.probe_up and num_workers < self.scan_gate.max_workers or num_workers == 1:
+                self.scan_gate.resize(num_workers + step)
+            else:
+                self.scan_gate.resize(num_workers - step)
+            self.probe_up = not self.probe_up
+            return
+
+        if num_workers > previous_workers:
+            # 増やして速くなった場合はさらに増やし, 変わらない場合は戻す
+            if rate > previous_rate * (1.0 + WorkerTuner.TOLERANCE):
+                self.previous = (num_workers, rate)
+                if self.scan_gate.resize(num_workers + WorkerTuner.step_of(num_workers)) == num_workers:
+                    self.settled = 0
+                return
+
+            # 増やしても速くならない場合は次の計測で減らすことを試す (同時に読むと遅くなるHDDなど)
+            self.scan_gate.resize(previous_workers)
+            self.settled = WorkerTuner.PROBE_INTERVALS - 1 if previous_workers > 1 else 0
+            self.probe_up = False
+        else:
+            # 減らしても遅くならない場合はさらに減らし, 遅くなった場合は戻す
+            if rate >= previous_rate * (1.0 - WorkerTuner.TOLERANCE):
+                self.previous = (num_workers, rate)
+                if self.scan_gate.resize(num_workers - WorkerTuner.step_of(num_workers)) == num_workers:
+                    self.settled = 0
+                return
+
+            self.scan_gate.resize(previous_workers)
+            self.settled = 0
+            self.probe_up = True
+
+    def tune_copy(self, arrival_rate:float, latency:float, backlog:int, copy_queue_size:int) -> None:
+        """コピーのワーカー数を見積もり直す
+
+        同時にコピー中のファイル数の平均は, 発生頻度×1ファイルあたりのコピー時間です。
+
+        Args:
+            arrival_rate (float): 1秒あたりに一致したファイル数
+            latency (float): 1ファイルあたりのコピー時間(秒)
+            backlog (int): コピー待ちのファイル数
+            copy_queue_size (int): コピーのキューの上限
+        """
+        num_workers = self.copy_gate.num_active
+        target = math.ceil(arrival_rate * latency * WorkerTuner.COPY_HEADROOM)
+
+        # コピーが溜まっている間は見積もりより多めに増やして解消
+        if backlog * 2 >= copy_queue_size:
+            target = max(target, num_workers + WorkerTuner.step_of(num_workers))
+
+        # 急に減らすと溜まりやすいので1つずつ減らす
+        if target < num_workers:
+            target = num_workers - 1
+        self.copy_gate.resize(target)
+
+    def save_settings(self) -> None:
+        """落ち着いたワーカー数をボリュームごとに保存
+        """
+        if not self.tuned:
+            return
+
+        # 試行中に終了した場合は比較元のワーカー数を記録
+        num_workers = self.scan_gate.num_active if self.previous is None else self.previous[0]
+        self.settings.update(self.volume, num_workers, self.copy_gate.num_active)
+        self.settings.save()
@@ -19,6 +19,13 @@ exe = Executable(
     target_name="Difference Exporter",
 )
 
+# GUI(Tk)の無いビルドエージェント向けのコンソール版
+cli_exe = Executable(
+    script="prompt.py",
+    base=None,
+    target_name="difference-exporter",
+)
+
 setup(
     name="Difference Exporter",
     version="0.1.1",
@@ -26,5 +33,13 @@ setup(
     options={
         "build_exe": build_exe_options,
     },
-    executables=[exe],
+    executables=[exe, cli_exe],
+    packages=["runtime"],
+    py_modules=["prompt", "index_daemon"],
+    entry_points={
+        "console_scripts": [
+            "difference-exporter=prompt:main",
+            "difference-exporter-daemon=index_daemon:main",
+        ],
+    },
 )
@@ -0,0 +1,86 @@
+import os
+import random
+import tarfile
+import zipfile
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from runtime import *
+
+
+TAG = b"// EDIT"
+
+
+class ArchiveWriterTest(unittest.TestCase):
+    """アーカイブへの出力を標準ライブラリで読み戻して確認
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_dir = Path(self.temp_dir.name) / "Engine"
+        self.output_dir = Path(self.temp_dir.name) / "out"
+        self.output_dir.mkdir()
+
+        rng = random.Random(0)
+        self.contents = {
+            "Source/Small.cpp": TAG + b"\nsmall\n",
+            "Source/Compressible.cpp": TAG + b"\n" + b"repeated line\n" * 4000,
+            "Source/Random.cpp": TAG + b"\n" + bytes(rng.getrandbits(8) for _ in range(20000)),
+            "Source/Aligned.h": TAG + b"\n" + b"x" * (tarfile.BLOCKSIZE * 8 - len(TAG) - 1),
+        }
+        for key, data in self.contents.items():
+            path = self.input_dir / key
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        (self.input_dir / "Source" / "Plain.cpp").write_bytes(b"plain\n")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def export(self, archive_format:str) -> dict[str, bytes]:
+        archive_path = self.output_dir / f"out.{archive_format}"
+        exporter = DifferenceExporter()
+        self.assertTrue(exporter.export(str(self.input_dir), str(self.output_dir), TAG.decode(), 2, archive_path=str(archive_path)))
+        exporter.wait()
+        self.assertIsNone(exporter.error)
+        self.assertEqual([path.name for path in self.output_dir.iterdir()], [archive_path.name])
+
+        try:
+            if archive_format == ARCHIVE_ZIP:
+                with zipfile.ZipFile(archive_path) as archive:
+                    self.assertIsNone(archive.testzip())
+                    return {name: archive.read(name) for name in archive.namelist()}
+            with tarfile.open(archive_path) as archive:
+                return {member.name: archive.extractfile(member).read() for member in archive.getmembers()}
+        finally:
+            archive_path.unlink()
+
+    def test_formats(self) -> None:
+        expected = {f"Engine/{key}": data for key, data in self.contents.items()}
+        for archive_format in ARCHIVE_FORMATS:
+            if not ArchiveWriter.is_available(archive_format):
+                continue
+            with self.subTest(archive_format=archive_format):
+                self.assertEqual(self.export(archive_format), expected)
+
+            # 閾値を超えるファイルは一時ファイルを介してチャンク単位で圧縮
+            with self.subTest(archive_format=archive_format, streamed=True):
+                with mock.patch.object(ArchiveWriter, "STREAM_THRESHOLD", 1024), mock.patch.object(ArchiveWriter, "STREAM_CHUNK_SIZE", 1000), \
+                    mock.patch.object(DiffExportInfo, "create_memory_budget", lambda *args, **kwargs: None):
+                    self.assertEqual(self.export(archive_format), expected)
+
+    def test_spool_entry(self) -> None:
+        info = DiffExportInfo(self.input_dir, self.output_dir, TAG.decode(), 1, archive_path=self.output_dir / "out.tar.gz")
+        writer = ArchiveWriter(info, ExportStats())
+        path = self.input_dir / "Source" / "Random.cpp"
+
+        # 読み込み中に短くなったファイルはtarのヘッダーと食い違うので失敗
+        input_stat = os.stat(path)
+        path.write_bytes(TAG)
+        with self.assertRaises(OSError):
+            writer.spool_entry(path, "Engine/Source/Random.cpp", input_stat)
+
+
+if __name__ == "__main__":
+    unittest.main()
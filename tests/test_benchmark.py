@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmark import *
+
+
+class BenchmarkTest(unittest.TestCase):
+    """小さな合成ツリーで生成・計測・基準との比較を確認
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.spec = TreeSpec(num_files=200, depth=2, fanout=3, median_size=256, hit_rate=0.2, utf16_rate=0.1)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_generate_tree(self) -> None:
+        input_dir = self.root / "Engine"
+        num_hits = generate_tree(input_dir, self.spec)
+        self.assertGreater(num_hits, 0)
+
+        # 同じシードからは同じツリー
+        other_dir = self.root / "Other" / "Engine"
+        self.assertEqual(generate_tree(other_dir, self.spec), num_hits)
+        self.assertEqual(
+            sorted(path.relative_to(input_dir).as_posix() for path in input_dir.rglob("*")),
+            sorted(path.relative_to(other_dir).as_posix() for path in other_dir.rglob("*")),
+        )
+
+        # 走査対象外の.gen.hと除外ディレクトリのファイルは数えない
+        result = measure(self.root, input_dir, 2, BACKEND_THREAD, DEFAULT_CHUNK_SIZE, 1)
+        self.assertEqual(result["scanned"], self.spec.num_files)
+        self.assertEqual(result["matched"], num_hits)
+        self.assertEqual(result["copied"], num_hits)
+        self.assertEqual(result["effective_workers"], min(2, os.cpu_count()))
+
+    def test_compare_baseline(self) -> None:
+        baseline = {"results": [
+            {"backend": BACKEND_THREAD, "workers": 1, "chunk_size": 64, "best": 1.0},
+            {"backend": BACKEND_THREAD, "workers": 4, "chunk_size": 64, "best": 1.0},
+        ]}
+        results = [
+            {"backend": BACKEND_THREAD, "workers": 1, "chunk_size": 64, "best": 1.05},
+            {"backend": BACKEND_THREAD, "workers": 4, "chunk_size": 64, "best": 1.5},
+            {"backend": BACKEND_PROCESS, "workers": 4, "chunk_size": 64, "best": 9.0},
+        ]
+
+        # 許容範囲を超えて遅くなった構成のみ (基準に無い構成は比較しない)
+        regressions = compare_baseline(results, baseline, 0.1)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("workers=4", regressions[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,251 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import threading as th
+from pathlib import Path
+from typing import Optional, Union
+from unittest import mock
+
+from runtime import *
+
+
+TAG = "// EDIT"
+
+
+class DifferenceExporterTest(unittest.TestCase):
+    """差分出力の差分・再開・同期を一時ディレクトリで確認
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_dir = Path(self.temp_dir.name) / "Engine"
+        self.output_dir = Path(self.temp_dir.name) / "out"
+        self.output_dir.mkdir()
+        self.cache_dir = Path(self.temp_dir.name) / "cache"
+
+        for i in range(4):
+            self.write(f"Source/Edited{i}.cpp", f"{TAG}\nv1 {i}\n")
+        self.write("Source/Plain.cpp", "plain\n")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def write(self, relative_path:str, text:str) -> None:
+        path = self.input_dir / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+    def edit_all(self, version:str) -> None:
+        for i in range(4):
+            self.write(f"Source/Edited{i}.cpp", f"{TAG}\n{version} {i} edited\n")
+
+    def export(self, tag:Union[str, list[str]] = TAG, **options) -> DifferenceExporter:
+        exporter = DifferenceExporter()
+        self.assertTrue(exporter.export(str(self.input_dir), str(self.output_dir), tag, 2, cache_dir=str(self.cache_dir), **options))
+        exporter.wait()
+        return exporter
+
+    def outputs(self, root:Optional[Path] = None) -> dict[str, str]:
+        root = self.output_dir if root is None else root
+        return {path.relative_to(root).as_posix(): path.read_text(encoding="utf-8") for path in root.rglob("*.cpp")}
+
+    def stale_outputs(self, version:str) -> list[str]:
+        return sorted(key for key, text in self.outputs().items() if version not in text)
+
+    def test_incremental(self) -> None:
+        for backend in (BACKEND_THREAD, BACKEND_ASYNC, BACKEND_PROCESS, BACKEND_HYBRID):
+            with self.subTest(backend=backend):
+                exporter = self.export(incremental=True, backend=backend)
+                self.assertIsNone(exporter.error)
+                self.assertEqual(len(self.outputs()), 4)
+
+                # 変更の無いファイルは開かずコピーもしない
+                exporter = self.export(incremental=True, backend=backend)
+                self.assertIsNone(exporter.error)
+                self.assertEqual(exporter.snapshot().copied, 0)
+                self.assertEqual(exporter.snapshot().bytes_read, 0)
+
+                self.write("Source/Edited1.cpp", f"{TAG}\n{backend}\n")
+                exporter = self.export(incremental=True, backend=backend)
+                self.assertEqual(exporter.snapshot().copied, 1)
+                self.assertEqual(self.outputs()["Engine/Source/Edited1.cpp"], f"{TAG}\n{backend}\n")
+
+    def test_incremental_after_copy_failure(self) -> None:
+        self.assertIsNone(self.export(incremental=True).error)
+        self.edit_all("v2")
+
+        copy_file = OutputWriter.copy_file
+        write_data = OutputWriter.write_data
+
+        def failing_copy_file(writer:OutputWriter, src:Path, dst:Path) -> None:
+            if src.name == "Edited2.cpp":
+                raise OSError("disk full")
+            copy_file(writer, src, dst)
+
+        def failing_write_data(data:bytes, src:Path, dst:Path) -> None:
+            if src.name == "Edited2.cpp":
+                raise OSError("disk full")
+            write_data(data, src, dst)
+
+        with mock.patch.object(OutputWriter, "copy_file", failing_copy_file), mock.patch.object(OutputWriter, "write_data", staticmethod(failing_write_data)):
+            self.assertIsInstance(self.export(incremental=True).error, OSError)
+
+        # コピーに失敗したファイルは次回もコピーする
+        self.assertIsNone(self.export(incremental=True).error)
+        self.assertEqual(self.stale_outputs("v2"), [])
+
+    def test_budget_after_copy_failure(self) -> None:
+        budgets:list[MemoryBudget] = []
+        create_memory_budget = DiffExportInfo.create_memory_budget
+
+        def recording_create_memory_budget(info:DiffExportInfo, num_shares:int = 1) -> Optional[MemoryBudget]:
+            budget = create_memory_budget(info, num_shares)
+            budgets.append(budget)
+            return budget
+
+        def failing_write_roots(writer:OutputWriter, *args) -> int:
+            raise OSError("disk full")
+
+        # 中断後に読み捨てたファイルの内容も解放する
+        with mock.patch.object(DiffExportInfo, "create_memory_budget", recording_create_memory_budget), mock.patch.object(OutputWriter, "write_roots", failing_write_roots):
+            self.assertIsInstance(self.export(copy_workers=1).error, OSError)
+        self.assertEqual(len(budgets), 1)
+        self.assertIsNotNone(budgets[0])
+        self.assertEqual(budgets[0].used, 0)
+
+    def test_resume(self) -> None:
+        self.assertIsNone(self.export(resume=True).error)
+        self.edit_all("v2")
+
+        exporter = DifferenceExporter()
+        started = th.Event()
+        released = th.Event()
+        write_roots = OutputWriter.write_roots
+
+        # 最初のコピーの途中で中断し、キューに残ったファイルは破棄させる
+        def slow_write_roots(writer:OutputWriter, *args) -> int:
+            started.set()
+            released.wait(10.0)
+            return write_roots(writer, *args)
+
+        with mock.patch.object(OutputWriter, "write_roots", slow_write_roots):
+            self.assertTrue(exporter.export(str(self.input_dir), str(self.output_dir), TAG, 1, resume=True, copy_workers=1, cache_dir=str(self.cache_dir)))
+            self.assertTrue(started.wait(10.0))
+            exporter.cancel()
+            released.set()
+            exporter.wait()
+        self.assertIsInstance(exporter.error, ExportCancelled)
+        self.assertLess(exporter.snapshot().copied, 4)
+
+        exporter = self.export(resume=True)
+        self.assertIsNone(exporter.error)
+        self.assertEqual(self.stale_outputs("v2"), [])
+
+        # チェックポイントは出力先に保存しない
+        self.assertEqual(sorted(path.name for path in self.output_dir.iterdir()), ["Engine"])
+        self.assertTrue(DiffExportInfo(self.input_dir, self.output_dir, TAG, 1, cache_dir=self.cache_dir).manifest_path.is_file())
+
+    def touch(self, relative_path:str) -> None:
+        # 出力先を入力より確実に古い更新日時にする
+        path = self.output_dir / "Engine" / relative_path
+        mtime_ns = os.stat(self.input_dir / relative_path).st_mtime_ns - 10 ** 9
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    def test_sync(self) -> None:
+        for sync_mode in (SYNC_STAT, SYNC_HASH):
+            with self.subTest(sync_mode=sync_mode):
+                shutil.rmtree(self.output_dir / "Engine", ignore_errors=True)
+                self.assertEqual(self.export(sync_mode=sync_mode).snapshot().copied, 4)
+
+                # 出力先と一致するファイルはコピーしない
+                snapshot = self.export(sync_mode=sync_mode).snapshot()
+                self.assertEqual((snapshot.copied, snapshot.skipped), (0, 4))
+
+                # 内容が同じでも入力の更新日時が新しい場合, statでは比較できないのでコピー
+                self.touch("Source/Edited1.cpp")
+                snapshot = self.export(sync_mode=sync_mode).snapshot()
+                self.assertEqual(snapshot.copied, 1 if sync_mode == SYNC_STAT else 0)
+
+                # サイズが同じで内容が異なる場合, ハッシュ値で比較すればコピー
+                text = f"{TAG}\n{sync_mode[:2]} 2\n"
+                self.write("Source/Edited2.cpp", text)
+                self.touch("Source/Edited2.cpp")
+                snapshot = self.export(sync_mode=sync_mode).snapshot()
+                self.assertEqual(snapshot.copied, 1)
+                self.assertEqual(self.outputs()["Engine/Source/Edited2.cpp"], text)
+
+    def test_tag_output_dirs(self) -> None:
+        other_dir = self.output_dir / "other"
+        other_dir.mkdir()
+        report_path = Path(self.temp_dir.name) / "report.json"
+        self.write("Source/Other.cpp", "// OTHER\n")
+        self.write("Source/Both.cpp", f"{TAG}\n// OTHER\n")
+
+        # 検索内容ごとのコピー先にのみコピー
+        exporter = self.export([TAG, "// OTHER"], tag_output_dirs={"// OTHER": str(other_dir)}, tag_report_path=str(report_path))
+        self.assertIsNone(exporter.error)
+        self.assertEqual(sorted(self.outputs(self.output_dir / "Engine")), ["Source/Both.cpp"] + [f"Source/Edited{i}.cpp" for i in range(4)])
+        self.assertEqual(sorted(self.outputs(other_dir)), ["Engine/Source/Both.cpp", "Engine/Source/Other.cpp"])
+
+        with open(report_path, mode="r", encoding="utf-8") as f:
+            report = json.load(f)
+        self.assertEqual(report["tags"], [TAG, "// OTHER"])
+        self.assertEqual(report["files"]["Source/Both.cpp"], [TAG, "// OTHER"])
+        self.assertEqual(report["files"]["Source/Other.cpp"], ["// OTHER"])
+
+    def test_baseline(self) -> None:
+        pristine_dir = Path(self.temp_dir.name) / "Pristine" / "Engine"
+        shutil.copytree(self.input_dir, pristine_dir)
+        self.write("Source/Unchanged.cpp", "unchanged\n")
+        shutil.copy2(self.input_dir / "Source" / "Unchanged.cpp", pristine_dir / "Source" / "Unchanged.cpp")
+
+        # 検索内容を書き忘れた編集 (サイズが同じでもハッシュ値で検出) と追加されたファイル
+        self.write("Source/Plain.cpp", "PLAIN\n")
+        self.write("Source/Added.cpp", "added\n")
+
+        baseline_path = Path(self.temp_dir.name) / "baseline.json"
+        report_path = Path(self.temp_dir.name) / "report.json"
+        exporter = self.export(baseline_path=str(baseline_path), baseline_dir=str(pristine_dir), tag_report_path=str(report_path))
+        self.assertIsNone(exporter.error)
+        self.assertTrue(baseline_path.is_file())
+        self.assertEqual(sorted(self.outputs()), ["Engine/Source/Added.cpp"] + [f"Engine/Source/Edited{i}.cpp" for i in range(4)] + ["Engine/Source/Plain.cpp"])
+
+        with open(report_path, mode="r", encoding="utf-8") as f:
+            report = json.load(f)
+        self.assertEqual(report["files"]["Source/Plain.cpp"], [BASELINE_LABEL])
+        self.assertEqual(report["files"]["Source/Edited0.cpp"], [TAG])
+
+        # 保存した索引は改変前のディレクトリ無しで再利用
+        shutil.rmtree(pristine_dir)
+        self.write("Source/Unchanged.cpp", "changed\n")
+        exporter = self.export(baseline_path=str(baseline_path))
+        self.assertIsNone(exporter.error)
+        self.assertIn("Engine/Source/Unchanged.cpp", self.outputs())
+
+    def test_mirror(self) -> None:
+        other_dir = Path(self.temp_dir.name) / "nest" / "deeper" / "other"
+        other_dir.mkdir(parents=True)
+        tags = [TAG, "// OTHER"]
+        options = {"mirror": True, "tag_output_dirs": {"// OTHER": str(other_dir)}}
+
+        self.write("Source/Sub/Both.cpp", f"{TAG}\n// OTHER\n")
+        self.assertIsNone(self.export(tags, **options).error)
+        self.assertIn("Engine/Source/Sub/Both.cpp", self.outputs())
+        self.assertEqual(list(self.outputs(other_dir)), ["Engine/Source/Sub/Both.cpp"])
+
+        # 一致しなくなったファイルと空になったディレクトリのみ削除
+        self.write("Source/Sub/Both.cpp", "reverted\n")
+        self.write("Source/Edited0.cpp", "reverted\n")
+        exporter = self.export(tags, **options)
+        self.assertIsNone(exporter.error)
+        self.assertEqual(exporter.snapshot().removed, 3)
+        self.assertEqual(sorted(self.outputs()), [f"Engine/Source/Edited{i}.cpp" for i in range(1, 4)])
+        self.assertFalse((self.output_dir / "Engine" / "Source" / "Sub").exists())
+        self.assertEqual(self.outputs(other_dir), {})
+        self.assertTrue((other_dir / "Engine").is_dir())
+        self.assertFalse((other_dir / "Engine" / "Source").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import re
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+
+from runtime import *
+
+
+TAG = "// EDIT"
+
+
+class EditedFileIteratorTest(unittest.TestCase):
+    """一致したファイルの逐次列挙と途中での終了を確認
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_dir = Path(self.temp_dir.name) / "Engine"
+        self.output_dir = Path(self.temp_dir.name) / "out"
+        self.output_dir.mkdir()
+
+        for i in range(20):
+            self.write(f"Source/Edited{i:02d}.cpp", f"int value = {i};\n{TAG}\n")
+        self.write("Source/Plain.cpp", "plain\n")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def write(self, relative_path:str, text:str) -> None:
+        path = self.input_dir / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+    def expected_keys(self) -> list[str]:
+        return [f"Source/Edited{i:02d}.cpp" for i in range(20)]
+
+    def test_iter(self) -> None:
+        with iter_edited_files(self.input_dir, TAG, 2) as iterator:
+            edited_files = sorted(iterator, key=lambda edited_file: edited_file.key)
+        self.assertEqual([edited_file.key for edited_file in edited_files], self.expected_keys())
+        self.assertEqual(list(self.output_dir.iterdir()), [])
+
+        edited_file = edited_files[3]
+        self.assertEqual(edited_file.path, self.input_dir / "Source" / "Edited03.cpp")
+        self.assertEqual(edited_file.size, edited_file.path.stat().st_size)
+        self.assertEqual(edited_file.labels, (TAG, ))
+        self.assertEqual(edited_file.offsets, {TAG: (len("int value = 3;\n"), )})
+        self.assertEqual(edited_file.to_dict()["offsets"], {TAG: [len("int value = 3;\n")]})
+
+    def test_copy(self) -> None:
+        keys = sorted(edited_file.key for edited_file in iter_edited_files(self.input_dir, TAG, 2, self.output_dir))
+        self.assertEqual(keys, self.expected_keys())
+        self.assertEqual(sorted(path.relative_to(self.output_dir / "Engine").as_posix() for path in self.output_dir.rglob("*.cpp")), keys)
+
+    def test_close(self) -> None:
+        # 途中でやめても走査スレッドを残さない
+        iterator = iter_edited_files(self.input_dir, TAG, 2, chunk_size=1)
+        self.assertIsInstance(next(iterator), EditedFile)
+        iterator.close()
+        self.assertFalse(iterator.thread.is_alive())
+        self.assertEqual(list(iterator), [])
+
+    def test_aiter(self) -> None:
+        async def collect() -> list[str]:
+            return sorted([edited_file.key async for edited_file in aiter_edited_files(self.input_dir, TAG, 2)])
+
+        self.assertEqual(asyncio.run(collect()), self.expected_keys())
+
+    def test_invalid(self) -> None:
+        with self.assertRaises(ValueError):
+            iter_edited_files(self.input_dir / "missing", TAG)
+        with self.assertRaises(ValueError):
+            iter_edited_files(self.input_dir, TAG, output_dir=self.input_dir)
+        with self.assertRaises(re.error):
+            iter_edited_files(self.input_dir, TAG, tag_regexes=["("])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from runtime import *
+
+
+TAG = "// EDIT"
+
+
+class ExportProfilerTest(unittest.TestCase):
+    """処理ごとの計測をトレースとヒストグラムのJSONで読み戻して確認
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.input_dir = self.root / "Engine"
+        (self.input_dir / "Source").mkdir(parents=True)
+        for i in range(3):
+            (self.input_dir / "Source" / f"Edited{i}.cpp").write_text(f"{TAG}\n{i}\n", encoding="utf-8")
+        (self.input_dir / "Source" / "Plain.cpp").write_text("plain\n", encoding="utf-8")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def read_json(self, path:Path) -> dict:
+        with open(path, mode="r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_chrome_trace(self) -> None:
+        profiler = ExportProfiler()
+        start = profiler.now()
+        profiler.record("open", start, self.input_dir / "Source" / "Plain.cpp")
+        profiler.record("copy_queue_wait", profiler.now())
+
+        # 別のプロセスで記録した区間も同じトレースに含める
+        other = ExportProfiler()
+        other.record("search", other.now())
+        profiler.merge(*other.drain())
+        self.assertEqual(other.spans, [])
+
+        events = profiler.chrome_trace()["traceEvents"]
+        spans = [event for event in events if event["ph"] == "X"]
+        self.assertEqual([event["name"] for event in spans], ["open", "copy_queue_wait", "search"])
+        self.assertEqual(min(event["ts"] for event in spans), 0.0)
+        self.assertTrue(all(event["dur"] >= 0.0 for event in spans))
+        self.assertEqual(spans[0]["args"]["path"], str(self.input_dir / "Source" / "Plain.cpp"))
+        self.assertNotIn("args", spans[1])
+        self.assertTrue(any(event["ph"] == "M" and event["name"] == "thread_name" for event in events))
+
+        histograms = profiler.histograms()
+        self.assertEqual(sorted(histograms), ["copy_queue_wait", "open", "search"])
+        self.assertEqual(histograms["open"]["count"], 1)
+        self.assertEqual(sum(histograms["open"]["buckets"].values()), 1)
+
+    def test_export(self) -> None:
+        for backend in (BACKEND_THREAD, BACKEND_PROCESS):
+            with self.subTest(backend=backend):
+                output_dir = self.root / f"out_{backend}"
+                output_dir.mkdir()
+                trace_path = self.root / f"trace_{backend}.json"
+                histogram_path = self.root / f"histogram_{backend}.json"
+
+                exporter = DifferenceExporter()
+                self.assertTrue(exporter.export(str(self.input_dir), str(output_dir), TAG, 2, backend=backend, trace_path=str(trace_path), histogram_path=str(histogram_path)))
+                exporter.wait()
+                self.assertIsNone(exporter.error)
+
+                # ファイルごとの走査とコピーの区間を記録
+                names = [event["name"] for event in self.read_json(trace_path)["traceEvents"] if event["ph"] == "X"]
+                self.assertEqual(names.count("search"), 4)
+                self.assertEqual(names.count("copy"), 3)
+
+                histograms = self.read_json(histogram_path)
+                self.assertEqual(histograms["search"]["count"], 4)
+                self.assertEqual(histograms["copy"]["count"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
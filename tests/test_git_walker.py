@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+from pathlib import Path
+
+from runtime import *
+
+
+@unittest.skipIf(shutil.which("git") is None, "git is not installed")
+class GitWalkerTest(unittest.TestCase):
+    """一時的なgitリポジトリで基準のタグからの変更の列挙を確認
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name) / "Engine"
+        self.root.mkdir()
+
+        self.git("init", "-q")
+        self.write("Source/Modified.cpp", "v1")
+        self.write("Source/Staged.h", "v1")
+        self.write("Source/Deleted.cpp", "v1")
+        self.write("Source/Unchanged.cpp", "v1")
+        self.write(".gitignore", "*.generated.h\n")
+        self.git("add", "-A")
+        self.git("commit", "-q", "-m", "base")
+        self.git("tag", "base")
+
+        # 作業ツリーの変更, ステージ済みの変更, 未追跡, 削除, 無視されたファイル
+        self.write("Source/Modified.cpp", "v2")
+        self.write("Source/Staged.h", "v2")
+        self.git("add", "Source/Staged.h")
+        self.write("Source/Untracked.cpp", "v1")
+        (self.root / "Source" / "Deleted.cpp").unlink()
+        self.write("Source/Ignored.generated.h", "v1")
+        self.write("Source/Untracked.txt", "v1")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def git(self, *args:str) -> None:
+        env = {
+            **os.environ,
+            "GIT_AUTHOR_NAME": "test",
+            "GIT_AUTHOR_EMAIL": "test@example.com",
+            "GIT_COMMITTER_NAME": "test",
+            "GIT_COMMITTER_EMAIL": "test@example.com",
+        }
+        subprocess.run(["git", "-C", str(self.root), "-c", "commit.gpgsign=false", *args], env=env, check=True, stdout=subprocess.DEVNULL)
+
+    def write(self, relative_path:str, text:str) -> None:
+        path = self.root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+    def walk(self, root:Path, base:str = "base") -> list[str]:
+        return sorted(Path(candidate.path).relative_to(root).as_posix() for candidate in GitWalker(str(root), base).walk())
+
+    def test_walk(self) -> None:
+        self.assertEqual(self.walk(self.root), ["Source/Modified.cpp", "Source/Staged.h", "Source/Untracked.cpp"])
+
+    def test_walk_subdirectory(self) -> None:
+        self.write("Other/Modified.cpp", "v1")
+        self.assertEqual(self.walk(self.root / "Source"), ["Modified.cpp", "Staged.h", "Untracked.cpp"])
+
+    def test_candidate_stat(self) -> None:
+        for candidate in GitWalker(str(self.root), "base").walk():
+            self.assertTrue(candidate.is_file())
+            self.assertEqual(candidate.stat().st_size, os.stat(candidate.path).st_size)
+
+    def test_invalid_base(self) -> None:
+        with self.assertRaises(GitError):
+            GitWalker(str(self.root), "missing").verify()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from runtime import *
+
+
+class PathFilterTest(unittest.TestCase):
+    """拡張子と除外パターンの判定をディレクトリの走査と相対パスの両方で確認
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name) / "Engine"
+        for key in (
+            "Source/Edited.cpp",
+            "Source/Edited.h",
+            "Source/Upper.CPP",
+            "Source/Edited.gen.cpp",
+            "Source/.hidden.cpp",
+            "Source/Notes.txt",
+            "Source/ThirdParty/Lib.cpp",
+            "Source/ThirdParty/Keep.cpp",
+            "Plugins/Foo/Intermediate/Generated.cpp",
+            "Plugins/Foo/Source/Foo.cpp",
+            "Intermediate/Build.cpp",
+            "Config/Base.ini",
+        ):
+            path = self.root / key
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(key, encoding="utf-8")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def walk(self, path_filter:PathFilter) -> list[str]:
+        walker = DirectoryWalker(str(self.root), path_filter)
+        return sorted(entry.path[walker.root_length:].replace(os.sep, "/") for entry in walker.walk())
+
+    def assertFiltered(self, path_filter:PathFilter, expected:list[str]) -> None:
+        self.assertEqual(self.walk(path_filter), expected)
+
+        # 走査せずに列挙したファイルも同じ判定
+        keys = sorted(path.relative_to(self.root).as_posix() for path in self.root.rglob("*") if path.is_file())
+        self.assertEqual([key for key in keys if path_filter.accepts_relative_path(key)], expected)
+
+    def test_extensions(self) -> None:
+        # 拡張子は大文字小文字を区別し, 2つ以上の拡張子は対象外
+        self.assertTrue(PathFilter().is_candidate("Edited.cpp"))
+        self.assertTrue(PathFilter().is_candidate(".hidden.cpp"))
+        self.assertFalse(PathFilter().is_candidate("Upper.CPP"))
+        self.assertFalse(PathFilter().is_candidate("Edited.gen.cpp"))
+        self.assertFalse(PathFilter().is_candidate("Makefile"))
+
+        self.assertFiltered(PathFilter(extensions=(".cpp", "ini"), excluded_extensions=("ini", )), [
+            "Intermediate/Build.cpp",
+            "Plugins/Foo/Intermediate/Generated.cpp",
+            "Plugins/Foo/Source/Foo.cpp",
+            "Source/.hidden.cpp",
+            "Source/Edited.cpp",
+            "Source/ThirdParty/Keep.cpp",
+            "Source/ThirdParty/Lib.cpp",
+        ])
+
+    def test_excluded_dirs(self) -> None:
+        # 既定では全て走査
+        self.assertIn("Intermediate/Build.cpp", self.walk(PathFilter()))
+
+        # '/'を含まない名前は全ての階層, '/'を含むパスは入力ディレクトリからの相対パス
+        self.assertFiltered(PathFilter(extensions=("cpp", ), excluded_dirs=ENGINE_EXCLUDED_DIRS + ("Source/ThirdParty", )), [
+            "Plugins/Foo/Source/Foo.cpp",
+            "Source/.hidden.cpp",
+            "Source/Edited.cpp",
+        ])
+
+    def test_excluded_patterns(self) -> None:
+        self.assertFiltered(PathFilter(extensions=("cpp", "h"), excluded_patterns=(
+            "# コメントと空行は無視",
+            "",
+            "*.h",
+            "/Intermediate/",
+            "Plugins/**/Intermediate",
+            "ThirdParty/",
+            "!Source/ThirdParty/Keep.cpp",
+        )), [
+            "Plugins/Foo/Source/Foo.cpp",
+            "Source/.hidden.cpp",
+            "Source/Edited.cpp",
+        ])
+
+        # 除外の取り消しは後に書いたパターンが優先 (親ディレクトリが除外されていないファイルのみ)
+        self.assertFiltered(PathFilter(extensions=("cpp", ), excluded_patterns=("Source/ThirdParty/*.cpp", "!Keep.cpp", "Plugins/", "Intermediate/")), [
+            "Source/.hidden.cpp",
+            "Source/Edited.cpp",
+            "Source/ThirdParty/Keep.cpp",
+        ])
+
+    def test_max_size(self) -> None:
+        path_filter = PathFilter(max_size=len("Source/Edited.h"))
+        self.assertTrue(path_filter.accepts_size(len("Source/Edited.h")))
+        self.assertFalse(path_filter.accepts_size(len("Source/Edited.h") + 1))
+        self.assertEqual(self.walk(path_filter), ["Config/Base.ini", "Source/Edited.h"])
+        self.assertIsNone(PathFilter(max_size=0).max_size)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import json
+import pickle
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from runtime import *
+
+
+class TagIndexDaemonTest(unittest.TestCase):
+    """常駐プロセスの認証キーと要求の受け渡しを確認
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.input_dir = self.root / "Engine"
+        (self.input_dir / "Source").mkdir(parents=True)
+        (self.input_dir / "Source" / "Edited.cpp").write_text("// EDIT\n", encoding="utf-8")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_authkey(self) -> None:
+        path = self.root / "key"
+        authkey = load_daemon_authkey(path, create=True)
+        self.assertGreaterEqual(len(authkey), 32)
+        self.assertEqual(load_daemon_authkey(path, create=True), authkey)
+        self.assertEqual(load_daemon_authkey(path), authkey)
+        if os.name != "nt":
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+    @unittest.skipIf(os.name == "nt", "permissions are protected by the home directory ACL")
+    def test_authkey_permissions(self) -> None:
+        path = self.root / "key"
+        load_daemon_authkey(path, create=True)
+        os.chmod(path, 0o644)
+        with self.assertRaises(PermissionError):
+            load_daemon_authkey(path)
+
+    def test_missing_authkey(self) -> None:
+        with self.assertRaises(FileNotFoundError):
+            load_daemon_authkey(self.root / "missing")
+
+    def test_handle_bytes(self) -> None:
+        daemon = TagIndexDaemon(DiffExportInfo(self.input_dir, ".", "// EDIT", 1), use_inotify=False)
+        daemon.resync()
+
+        response = json.loads(daemon.handle_bytes(json.dumps({"command": "status"}).encode("utf-8")))
+        self.assertTrue(response["ok"])
+        self.assertEqual(response["matched"], 1)
+
+        # pickleの要求は復元せずに拒否
+        response = json.loads(daemon.handle_bytes(pickle.dumps({"command": "status"})))
+        self.assertFalse(response["ok"])
+
+    def test_remove_directory(self) -> None:
+        (self.input_dir / "Source" / "Sub").mkdir()
+        (self.input_dir / "Source" / "Sub" / "Nested.cpp").write_text("// EDIT\n", encoding="utf-8")
+        daemon = TagIndexDaemon(DiffExportInfo(self.input_dir, ".", "// EDIT", 1), use_inotify=False)
+        daemon.resync()
+        self.assertEqual(daemon.status()["matched"], 2)
+
+        # 削除されたディレクトリ以下の判定結果をまとめて破棄
+        shutil.rmtree(self.input_dir / "Source" / "Sub")
+        daemon.update_files({os.path.join(self.input_dir, "Source", "Sub", "")})
+        self.assertEqual(daemon.status()["matched"], 1)
+
+    def test_abstract_watcher(self) -> None:
+        with self.assertRaises(TypeError):
+            FileWatcher(str(self.input_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
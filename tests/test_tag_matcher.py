@@ -0,0 +1,91 @@
+import codecs
+import tempfile
+import unittest
+from pathlib import Path
+
+from runtime import *
+
+
+TAG = "// EDIT"
+
+
+class TagMatcherTest(unittest.TestCase):
+    """バイト列のまま検索した結果をチャンクの境界やエンコーディングごとに確認
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def write(self, name:str, data:bytes) -> Path:
+        path = self.root / name
+        path.write_bytes(data)
+        return path
+
+    def test_chunk_boundary(self) -> None:
+        data = b"x" * 10 + TAG.encode("utf-8") + b"\n"
+        path = self.write("Boundary.cpp", data)
+
+        # 検索内容がチャンクの境界を跨ぐ全ての位置で一致
+        for chunk_size in range(1, len(data) + 1):
+            with self.subTest(chunk_size=chunk_size):
+                matcher = TagMatcher(TAG, chunk_size=chunk_size, mmap_threshold=0)
+                self.assertTrue(matcher.is_match(path))
+                self.assertLessEqual(matcher.bytes_read, len(data))
+
+        path = self.write("Partial.cpp", b"x" * 10 + TAG[:-1].encode("utf-8") + b"\n")
+        self.assertFalse(TagMatcher(TAG, chunk_size=3, mmap_threshold=0).is_match(path))
+
+    def test_utf16(self) -> None:
+        text = "日本語のコメント\n" * 3 + TAG + "\n"
+        for encoding, bom in (("utf-16-le", codecs.BOM_UTF16_LE), ("utf-16-be", codecs.BOM_UTF16_BE)):
+            path = self.write(f"{encoding}.cpp", bom + text.encode(encoding))
+
+            # 奇数のチャンクで1文字の途中で区切られても逐次デコードして一致
+            for chunk_size in (1, 3, 7, 1024):
+                with self.subTest(encoding=encoding, chunk_size=chunk_size):
+                    self.assertTrue(TagMatcher(TAG, chunk_size=chunk_size, mmap_threshold=0).is_match(path))
+
+            path = self.write(f"{encoding}_plain.cpp", bom + "plain\n".encode(encoding))
+            self.assertFalse(TagMatcher(TAG, chunk_size=3, mmap_threshold=0).is_match(path))
+
+        # BOM無しのUTF-16はUTF-8として検索するので一致しない
+        path = self.write("no_bom.cpp", text.encode("utf-16-le"))
+        self.assertFalse(TagMatcher(TAG, mmap_threshold=0).is_match(path))
+
+    def test_mmap(self) -> None:
+        paths = [
+            self.write("Edited.cpp", b"x" * 100 + TAG.encode("utf-8") + b"\n"),
+            self.write("Plain.cpp", b"x" * 100 + b"\n"),
+            self.write("Utf16.cpp", codecs.BOM_UTF16_LE + f"{TAG}\n".encode("utf-16-le")),
+            self.write("Empty.cpp", b""),
+        ]
+
+        # メモリマップでの検索は逐次読み込みと同じ結果 (UTF-16は逐次デコードに切り替え, 空のファイルはマップしない)
+        for path in paths:
+            with self.subTest(path=path.name):
+                expected = TagMatcher(TAG, mmap_threshold=0).search(path)
+                matcher = TagMatcher(TAG, mmap_threshold=1)
+                self.assertEqual(matcher.search(path), expected)
+                self.assertEqual(matcher.size, path.stat().st_size)
+
+    def test_multiple_tags(self) -> None:
+        matcher = TagMatcher([TAG, "// OTHER"], [r"^#pragma optimize\(.*\)$"], chunk_size=8, mmap_threshold=0)
+        path = self.write("Both.cpp", b"x" * 20 + b"\n// OTHER\n#pragma optimize(\"\", off)\n")
+
+        # 一致した検索内容の番号のビットを立てたマスク
+        mask = matcher.search(path)
+        self.assertEqual(mask, 0b110)
+        self.assertEqual(matcher.labels_of(mask), ["// OTHER", r"^#pragma optimize\(.*\)$"])
+        self.assertEqual(matcher.find_offsets(path), {"// OTHER": [21], r"^#pragma optimize\(.*\)$": [30]})
+
+    def test_unreadable(self) -> None:
+        matcher = TagMatcher(TAG)
+        self.assertEqual(matcher.read_and_search(self.root / "missing.cpp"), (0, None))
+        self.assertIsNone(matcher.size)
+
+
+if __name__ == "__main__":
+    unittest.main()
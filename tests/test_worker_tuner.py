@@ -0,0 +1,104 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from collections import Counter
+from typing import Callable
+
+from runtime import *
+
+
+class WorkerTunerTest(unittest.TestCase):
+    """計測値を模した集計でワーカー数の収束と記録を確認
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.settings_path = self.root / WorkerSettings.FILENAME
+        self.info = DiffExportInfo(self.root, self.root, "// EDIT", 1, autotune=True, autotune_path=self.settings_path)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def create_tuner(self) -> WorkerTuner:
+        tuner = WorkerTuner(self.info, ExportStats(), max_workers=16)
+        tuner.last = self.snapshot(0.0, 0)
+        return tuner
+
+    @staticmethod
+    def snapshot(elapsed:float, scanned:int, matched:int = 0, copy_time:float = 0.0) -> ExportSnapshot:
+        return ExportSnapshot(elapsed, scanned, scanned, matched, matched, 0, 0, 0, 0, 0.0, copy_time, False, False)
+
+    def run_tuner(self, tuner:WorkerTuner, rate_of:Callable[[int], float], num_samples:int) -> list[int]:
+        """1秒ごとに走査のワーカー数に応じたファイル数を走査したとして見直す
+        """
+        history:list[int] = []
+        elapsed, scanned = 0.0, 0
+        for _ in range(num_samples):
+            elapsed += 1.0
+            scanned += int(rate_of(tuner.scan_gate.num_active))
+            tuner.sample(self.snapshot(elapsed, scanned), 10, 0, 100)
+            history.append(tuner.scan_gate.num_active)
+        return history
+
+    def test_scan_convergence(self) -> None:
+        # 6つで頭打ちになる場合は6つに落ち着き, 時々増減を試す
+        history = self.run_tuner(self.create_tuner(), lambda num_workers: min(num_workers, 6) * 100.0, 40)
+        self.assertEqual(Counter(history[10:]).most_common(1)[0][0], 6)
+        self.assertLessEqual(max(history), 9)
+
+        # 同時に読むと遅くなる場合は1つまで減らす
+        history = self.run_tuner(self.create_tuner(), lambda num_workers: 400.0 / num_workers, 20)
+        self.assertEqual(Counter(history[5:]).most_common(1)[0][0], 1)
+
+    def test_scan_backlog(self) -> None:
+        # 走査待ちが無い間は入力が律速なので見直さない
+        tuner = self.create_tuner()
+        tuner.sample(self.snapshot(1.0, 100), 0, 0, 100)
+        self.assertEqual(tuner.scan_gate.num_active, WorkerTuner.INITIAL_WORKERS)
+        self.assertFalse(tuner.tuned)
+
+    def test_copy_estimate(self) -> None:
+        # 1秒あたり50ファイル×0.1秒のコピーに余裕を見込んだ数
+        tuner = self.create_tuner()
+        tuner.sample(self.snapshot(1.0, 100, matched=50, copy_time=5.0), 0, 0, 100)
+        self.assertEqual(tuner.copy_gate.num_active, 8)
+
+        # コピーが無くなっても急には減らさない
+        tuner.sample(self.snapshot(2.0, 200, matched=51, copy_time=5.001), 0, 0, 100)
+        self.assertEqual(tuner.copy_gate.num_active, 7)
+
+    def test_settings(self) -> None:
+        # 見直していない短い差分出力は記録しない
+        tuner = self.create_tuner()
+        tuner.save_settings()
+        self.assertFalse(self.settings_path.exists())
+
+        self.run_tuner(tuner, lambda num_workers: min(num_workers, 6) * 100.0, 40)
+        tuner.save_settings()
+
+        # 次回は同じボリュームで落ち着いた数から始める
+        settings = WorkerSettings(self.settings_path)
+        self.assertTrue(settings.load())
+        self.assertEqual(settings.lookup(WorkerSettings.volume_of(self.root)), (6, tuner.copy_gate.num_active))
+        self.assertEqual(self.create_tuner().scan_gate.num_active, 6)
+
+        # 壊れた記録は無視
+        with open(self.settings_path, mode="w", encoding="utf-8") as f:
+            json.dump({"version": WorkerSettings.VERSION, "entries": {tuner.volume: ["6", 1]}}, f)
+        self.assertEqual(self.create_tuner().scan_gate.num_active, WorkerTuner.INITIAL_WORKERS)
+
+    def test_gate(self) -> None:
+        gate = WorkerGate(2, 4)
+        self.assertTrue(gate.wait(1))
+        self.assertEqual(gate.resize(10), 4)
+        self.assertEqual(gate.resize(0), 1)
+
+        # 終了後は待機中のワーカーも終了し, 稼働数は変えない
+        gate.close()
+        self.assertFalse(gate.wait(3))
+        self.assertEqual(gate.resize(4), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()